@@ -1,5 +1,5 @@
 from src.models.user import db
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 
 class Achievement(db.Model):
@@ -24,6 +24,9 @@ class Achievement(db.Model):
     
     # Relacionamentos
     user_achievements = db.relationship('UserAchievement', backref='achievement', lazy=True)
+    
+    # Nome único: o catálogo resolve as regras pelo nome e vários processos sincronizam ao iniciar
+    __table_args__ = (db.Index('ux_achievement_name', 'name', unique=True),)
 
     def to_dict(self):
         return {
@@ -196,3 +199,43 @@ class Leaderboard(db.Model):
             'week_start': self.week_start.isoformat()
         }
 
+# Índice para o ranking semanal (top N por semana em ordem de XP)
+db.Index('ix_leaderboard_week_xp', Leaderboard.week_start, Leaderboard.weekly_xp.desc())
+
+def get_week_start(day=None):
+    """Retorna a segunda-feira da semana do dia informado"""
+    day = day or datetime.utcnow().date()
+    return day - timedelta(days=day.weekday())
+
+def record_leaderboard_activity(user_id, xp=0, questions=0, sessions=0):
+    """Aplica deltas de XP/questões/sessões na linha do ranking da semana atual (sem commit)"""
+    deltas = {
+        field: value for field, value in (
+            ('weekly_xp', xp), ('questions_answered', questions), ('study_sessions', sessions)
+        ) if value
+    }
+    if not deltas:
+        return
+
+    week_start = get_week_start()
+
+    updated = db.session.query(Leaderboard).filter(
+        Leaderboard.user_id == user_id,
+        Leaderboard.week_start == week_start
+    ).update(
+        {getattr(Leaderboard, field): getattr(Leaderboard, field) + value for field, value in deltas.items()},
+        synchronize_session='fetch'
+    )
+
+    if not updated:
+        entry = Leaderboard(
+            user_id=user_id,
+            week_start=week_start,
+            weekly_xp=0,
+            questions_answered=0,
+            study_sessions=0
+        )
+        for field, value in deltas.items():
+            setattr(entry, field, value)
+        db.session.add(entry)
+        db.session.flush()
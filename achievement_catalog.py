@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, func, select
+from src.models.user import db
+from src.models.achievement import Achievement
+from src.services.session_hooks import after_transaction, after_transaction_of
+
+_FIELDS = ('id', 'name', 'description', 'icon', 'category', 'criteria_type',
+           'criteria_value', 'xp_reward', 'rarity')
+
+class AchievementDefinition(namedtuple('AchievementDefinition', _FIELDS)):
+    """Definição imutável de uma conquista (mesmo formato de Achievement.to_dict)"""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return dict(self._asdict())
+
+class AchievementCatalog:
+    """
+    Catálogo em memória das conquistas, indexado por id, nome e criteria_type.
+    A tabela Achievement é praticamente estática: o catálogo é carregado uma vez, só com dados
+    já commitados (conexão própria), e recarregado quando a versão muda (escritas commitadas
+    neste processo) ou quando a conferência periódica de COUNT/MAX(id) mostra escritas de
+    outros processos.
+    """
+
+    def __init__(self, check_interval=30):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = 0
+        self._loaded_version = None
+        self._snapshot = None
+        self._fingerprint = None
+        self._checked_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    @property
+    def version(self):
+        return self._version
+
+    def _read_fingerprint(self, connection):
+        table = Achievement.__table__
+        return tuple(connection.execute(select(func.count(), func.max(table.c.id)).select_from(table)).one())
+
+    def _is_current(self):
+        if self._snapshot is None or self._loaded_version != self._version:
+            return False
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return True
+
+        # Conferência barata das escritas feitas por outros processos
+        with db.engine.connect() as connection:
+            fingerprint = self._read_fingerprint(connection)
+        self._checked_at = time.monotonic()
+        return fingerprint == self._fingerprint
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if self._is_current():
+            return snapshot
+
+        with self._lock:
+            version = self._version
+            table = Achievement.__table__
+            with db.engine.connect() as connection:
+                fingerprint = self._read_fingerprint(connection)
+                definitions = tuple(
+                    AchievementDefinition(*(row._mapping[field] for field in _FIELDS))
+                    for row in connection.execute(select(table).order_by(table.c.id))
+                )
+
+            by_criteria = {}
+            for definition in definitions:
+                by_criteria.setdefault(definition.criteria_type, []).append(definition)
+
+            snapshot = {
+                'all': definitions,
+                'by_id': {d.id: d for d in definitions},
+                'by_name': {d.name: d for d in definitions},
+                'by_criteria_type': {key: tuple(items) for key, items in by_criteria.items()}
+            }
+            self._snapshot = snapshot
+            self._loaded_version = version
+            self._fingerprint = fingerprint
+            self._checked_at = time.monotonic()
+
+        return snapshot
+
+    def all(self):
+        return self._get_snapshot()['all']
+
+    def get(self, achievement_id):
+        return self._get_snapshot()['by_id'].get(achievement_id)
+
+    def get_by_name(self, name):
+        return self._get_snapshot()['by_name'].get(name)
+
+    def get_by_criteria_type(self, criteria_type):
+        return self._get_snapshot()['by_criteria_type'].get(criteria_type, ())
+
+    def resolve_names(self, names):
+        """
+        Definições pelo nome, incluindo as inseridas na transação atual (ainda fora do catálogo,
+        que só tem dados commitados): as que faltam vêm de uma consulta na sessão.
+        """
+        by_name = self._get_snapshot()['by_name']
+        resolved = {name: by_name[name] for name in names if name in by_name}
+
+        missing = set(names) - set(resolved)
+        if missing:
+            for achievement in Achievement.query.filter(Achievement.name.in_(missing)).all():
+                resolved[achievement.name] = AchievementDefinition(
+                    *(getattr(achievement, field) for field in _FIELDS)
+                )
+
+        return resolved
+
+achievement_catalog = AchievementCatalog()
+
+def _insert_missing(rows):
+    """Insere as definições ignorando nomes já gravados por outro processo (índice único em name)"""
+    table = Achievement.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).on_conflict_do_nothing(index_elements=['name'])
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).on_conflict_do_nothing(index_elements=['name'])
+    else:
+        statement = table.insert().prefix_with('IGNORE')
+
+    db.session.execute(statement, rows)
+
+def sync_achievement_definitions(rules):
+    """
+    Garante que as definições das regras existam no banco (uma leitura + uma inserção em lote).
+    Seguro com vários processos sincronizando ao mesmo tempo: nomes inseridos por outro processo
+    são ignorados e o catálogo recarregado passa a vê-los.
+    rules: lista de (criteria_type, regra) no formato do motor de conquistas.
+    """
+    missing = {}
+    for criteria_type, rule in rules:
+        if achievement_catalog.get_by_name(rule['name']) is None:
+            missing[rule['name']] = {
+                'name': rule['name'],
+                'description': rule['description'],
+                'category': rule['category'],
+                'criteria_type': criteria_type,
+                'criteria_value': rule['threshold'],
+                'xp_reward': rule['xp_reward']
+            }
+
+    if missing:
+        _insert_missing(list(missing.values()))
+        after_transaction(db.session(), 'achievement_catalog', achievement_catalog.invalidate)
+
+    return len(missing)
+
+@event.listens_for(Achievement, 'after_insert')
+@event.listens_for(Achievement, 'after_update')
+@event.listens_for(Achievement, 'after_delete')
+def _invalidate_catalog(mapper, connection, target):
+    after_transaction_of(target, 'achievement_catalog', achievement_catalog.invalidate)
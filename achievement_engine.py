@@ -0,0 +1,187 @@
+import math
+from datetime import datetime
+from src.models.user import db
+from src.models.achievement import UserAchievement
+from src.services.achievement_catalog import achievement_catalog, sync_achievement_definitions
+from src.models.user_stats import record_xp_earned
+
+# Regras de conquista indexadas pelo contador do qual dependem
+ACHIEVEMENT_RULES = {
+    'questions_answered': [
+        {'name': "Primeiros Passos", 'description': "Respondeu 10 questões", 'category': "progress", 'threshold': 10, 'xp_reward': 1},
+        {'name': "Estudante Dedicado", 'description': "Respondeu 50 questões", 'category': "progress", 'threshold': 50, 'xp_reward': 5},
+        {'name': "Centena Completa", 'description': "Respondeu 100 questões", 'category': "progress", 'threshold': 100, 'xp_reward': 10},
+        {'name': "Meio Milhar", 'description': "Respondeu 500 questões", 'category': "progress", 'threshold': 500, 'xp_reward': 50},
+        {'name': "Milhar Conquistado", 'description': "Respondeu 1000 questões", 'category': "progress", 'threshold': 1000, 'xp_reward': 100},
+    ],
+    'accuracy': [
+        # Exigem pelo menos 50 questões respondidas
+        {'name': "Precisão Cirúrgica", 'description': "Manteve 90% de acerto com pelo menos 50 questões", 'category': "performance", 'threshold': 90, 'xp_reward': 100, 'min_answers': 50},
+        {'name': "Alta Performance", 'description': "Manteve 80% de acerto com pelo menos 50 questões", 'category': "performance", 'threshold': 80, 'xp_reward': 75, 'min_answers': 50},
+    ],
+    'streak': [
+        {'name': "Três Dias Seguidos", 'description': "Estudou por 3 dias consecutivos", 'category': "consistency", 'threshold': 3, 'xp_reward': 6},
+        {'name': "Uma Semana Completa", 'description': "Estudou por 7 dias consecutivos", 'category': "consistency", 'threshold': 7, 'xp_reward': 14},
+        {'name': "Duas Semanas", 'description': "Estudou por 14 dias consecutivos", 'category': "consistency", 'threshold': 14, 'xp_reward': 28},
+        {'name': "Um Mês Dedicado", 'description': "Estudou por 30 dias consecutivos", 'category': "consistency", 'threshold': 30, 'xp_reward': 60},
+        {'name': "Cem Dias de Foco", 'description': "Estudou por 100 dias consecutivos", 'category': "consistency", 'threshold': 100, 'xp_reward': 200},
+    ],
+    'level': [
+        {'name': "Nível 5", 'description': "Alcançou o nível 5", 'category': "level", 'threshold': 5, 'xp_reward': 50},
+        {'name': "Nível 10", 'description': "Alcançou o nível 10", 'category': "level", 'threshold': 10, 'xp_reward': 100},
+        {'name': "Nível 20", 'description': "Alcançou o nível 20", 'category': "level", 'threshold': 20, 'xp_reward': 200},
+        {'name': "Nível 50", 'description': "Alcançou o nível 50", 'category': "level", 'threshold': 50, 'xp_reward': 500},
+    ],
+    'weekly_sessions': [
+        {'name': "Estudante Consistente", 'description': "Completou pelo menos uma sessão por dia na última semana", 'category': "consistency", 'threshold': 7, 'xp_reward': 100},
+    ],
+}
+
+# Contadores que também mudam por caminhos que não avaliam conquistas (ex.: /questions/<id>/answer):
+# suas regras valem pelo valor atual (>= limite), e as já obtidas são descartadas no desbloqueio
+REACHED_COUNTERS = ('questions_answered', 'accuracy')
+
+# Domínio de especialidade: >= 80% de acerto com pelo menos 20 questões
+SPECIALTY_MASTERY_RULE = {'category': "specialty", 'threshold': 80, 'xp_reward': 50, 'min_answers': 20}
+SPECIALTY_MASTERY_PREFIX = "Mestre em "
+
+def level_for_xp(xp):
+    """Fórmula de nível: level = sqrt(xp / 100) + 1"""
+    return int(math.sqrt((xp or 0) / 100)) + 1
+
+def all_rules():
+    """Todas as regras estáticas como (criteria_type, regra)"""
+    return [(counter, rule) for counter, rules in ACHIEVEMENT_RULES.items() for rule in rules]
+
+def specialty_mastery_rule(specialty):
+    """Regra de domínio de uma especialidade"""
+    return dict(
+        SPECIALTY_MASTERY_RULE,
+        name=f"{SPECIALTY_MASTERY_PREFIX}{specialty}",
+        description=f"Alcançou 80% de acerto em {specialty}"
+    )
+
+def min_answers_for(criteria_type, name):
+    """Mínimo de questões respondidas exigido pela regra (0 quando a regra não exige)"""
+    if criteria_type == 'specialty_mastery':
+        return SPECIALTY_MASTERY_RULE['min_answers']
+    for rule in ACHIEVEMENT_RULES.get(criteria_type, []):
+        if rule['name'] == name:
+            return rule.get('min_answers', 0)
+    return 0
+
+def _accuracy(total, correct):
+    return (correct / total * 100) if total else 0
+
+def crossed_rules(counter, old_value, new_value):
+    """
+    Regras do contador cujo limite foi atingido nesta mudança (old < limite <= new). Para os
+    REACHED_COUNTERS vale o valor atual (limite <= new), sem depender do valor antigo.
+    """
+    if counter == 'accuracy':
+        new_total, new_correct = new_value
+        new_accuracy = _accuracy(new_total, new_correct)
+
+        for rule in ACHIEVEMENT_RULES['accuracy']:
+            if new_total >= rule['min_answers'] and new_accuracy >= rule['threshold']:
+                return [rule]  # Apenas a faixa mais alta, como na avaliação completa
+        return []
+
+    if counter in REACHED_COUNTERS:
+        return [rule for rule in ACHIEVEMENT_RULES.get(counter, []) if rule['threshold'] <= new_value]
+
+    return [
+        rule for rule in ACHIEVEMENT_RULES.get(counter, [])
+        if old_value < rule['threshold'] <= new_value
+    ]
+
+class AchievementEngine:
+    """
+    Motor de conquistas orientado a eventos: recebe apenas os contadores que mudaram,
+    avalia somente as regras cujo limite acabou de ser cruzado e desbloqueia tudo
+    numa única escrita em lote.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def evaluate(self, changes):
+        """
+        changes: {contador: (valor_antigo, valor_novo)}; para 'accuracy' os valores são
+        (total, corretas) e para 'specialty_mastery' um dict {especialidade: (respondidas, acurácia)}.
+        """
+        candidates = []
+
+        for counter, values in changes.items():
+            if counter == 'specialty_mastery':
+                for specialty, (answered, accuracy) in values.items():
+                    if answered >= SPECIALTY_MASTERY_RULE['min_answers'] and accuracy >= SPECIALTY_MASTERY_RULE['threshold']:
+                        candidates.append((counter, specialty_mastery_rule(specialty)))
+                continue
+
+            old_value, new_value = values
+            candidates.extend((counter, rule) for rule in crossed_rules(counter, old_value, new_value))
+
+        if not candidates:
+            return []
+
+        unlocked = self._unlock(candidates)
+
+        xp_gained = sum(item['xp_reward'] for item in unlocked)
+        if xp_gained:
+            record_xp_earned(self.user.id, xp_gained)
+
+        return unlocked
+
+    def _unlock(self, candidates):
+        """Desbloqueia as regras candidatas ainda não obtidas com uma única escrita"""
+        unlocked = []
+        rows = []
+        pending = list(candidates)
+        seen = set()
+
+        while pending:
+            definitions = self._load_definitions(pending)
+
+            owned = {
+                row[0] for row in db.session.query(UserAchievement.achievement_id).filter(
+                    UserAchievement.user_id == self.user.id,
+                    UserAchievement.achievement_id.in_([d.id for d in definitions.values()])
+                ).all()
+            } if definitions else set()
+
+            old_level = level_for_xp(self.user.xp)
+            now = datetime.utcnow()
+
+            for counter, rule in pending:
+                achievement = definitions[rule['name']]
+                if rule['name'] in seen or achievement.id in owned:
+                    continue
+                seen.add(rule['name'])
+
+                rows.append({'user_id': self.user.id, 'achievement_id': achievement.id, 'unlocked_at': now})
+                self.user.xp += rule['xp_reward']
+                unlocked.append({
+                    'achievement': achievement.to_dict(),
+                    'xp_reward': rule['xp_reward'],
+                    'unlocked_at': now.isoformat()
+                })
+
+            # O XP das conquistas pode subir o nível e cruzar novas regras de nível
+            new_level = level_for_xp(self.user.xp)
+            pending = []
+            if new_level > old_level:
+                self.user.level = new_level
+                pending = [('level', rule) for rule in crossed_rules('level', old_level, new_level)
+                           if rule['name'] not in seen]
+
+        if rows:
+            db.session.execute(UserAchievement.__table__.insert(), rows)
+
+        return unlocked
+
+    def _load_definitions(self, candidates):
+        """Resolve as definições pelo catálogo em memória (criando em lote as que faltarem)"""
+        sync_achievement_definitions(candidates)
+
+        return achievement_catalog.resolve_names({rule['name'] for _, rule in candidates})
@@ -0,0 +1,394 @@
+import atexit
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app, has_app_context
+from src.models.user import db, User
+from src.models.question import UserAnswer, StudySession, record_question_stats
+from src.models.priority import QuestionSelectionLog, get_user_topic_priority
+from src.models.user_stats import record_answer_stats, record_answer_batch_stats, record_xp_earned
+from src.services.gamification import xp_for_answer
+from src.services.answer_key import answer_key_store, get_explanations
+from src.services.question_pool import question_pool_index
+
+INGESTION_MODES = ('sync', 'write_behind')
+
+# Máximo de respostas aplicadas por transação do worker
+MAX_INGESTION_BATCH = 200
+
+# Tentativas por resposta isolada antes de descartá-la (falhas transitórias, ex.: banco travado)
+MAX_APPLY_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 0.5
+
+def ingestion_mode():
+    """Modo de gravação das respostas de sessão (config ANSWER_INGESTION_MODE, síncrono por padrão)"""
+    if has_app_context():
+        mode = current_app.config.get('ANSWER_INGESTION_MODE', 'sync')
+        if mode in INGESTION_MODES:
+            return mode
+    return 'sync'
+
+class SessionState:
+    """Estado em memória de uma sessão em andamento: gabarito das questões e progresso"""
+
+    __slots__ = ('user_id', 'total', 'keys', 'explanations', 'answered', 'correct', 'xp')
+
+    def __init__(self, user_id, total, keys, answered, correct, xp):
+        self.user_id = user_id
+        self.total = total
+        self.keys = keys  # question_id -> (alternativa correta, especialidade, dificuldade)
+        self.explanations = None  # carregadas na primeira resposta que pedir explicação
+        self.answered = answered
+        self.correct = correct
+        self.xp = xp
+
+def apply_answer_batch(items, commit=True):
+    """
+    Aplica numa única transação os efeitos de um lote de respostas já corrigidas: respostas,
+    contadores, rollups, XP, progresso das sessões, prioridades, log de seleção e estatísticas
+    das questões. items: dicts com user_id, session_id, question_id, selected_option,
+    is_correct, response_time, xp, specialty e answered_at.
+    Com commit=False a transação fica aberta para o chamador concluí-la.
+    Uma questão já respondida pelo usuário (em outra sessão ou no mesmo lote) tem a resposta
+    substituída, como em answer_question; as demais são inseridas de uma vez.
+    Retorna as sessões (session_id, user_id) que terminaram neste lote.
+    """
+    previous = {
+        (answer.user_id, answer.question_id): answer
+        for answer in UserAnswer.query.filter(
+            UserAnswer.user_id.in_({item['user_id'] for item in items}),
+            UserAnswer.question_id.in_({item['question_id'] for item in items})
+        ).all()
+    }
+
+    new_rows = {}
+    for item in items:
+        key = (item['user_id'], item['question_id'])
+        row = {
+            'user_id': item['user_id'],
+            'question_id': item['question_id'],
+            'selected_answer': item['selected_option'],
+            'is_correct': item['is_correct'],
+            'time_spent': item['response_time'],
+            'session_id': item['session_id'],
+            'answered_at': item['answered_at']
+        }
+
+        if key in new_rows:
+            # Respondida de novo no mesmo lote: vale a última resposta
+            new_rows[key].update(row)
+        elif key in previous:
+            answer = previous[key]
+            record_answer_stats(
+                item['user_id'], item['is_correct'], item['response_time'],
+                previous_answer=(answer.is_correct, answer.time_spent, answer.answered_at)
+            )
+            answer.selected_answer = item['selected_option']
+            answer.is_correct = item['is_correct']
+            answer.time_spent = item['response_time']
+            answer.session_id = item['session_id']
+            answer.answered_at = item['answered_at']
+        else:
+            new_rows[key] = row
+
+    if new_rows:
+        db.session.execute(UserAnswer.__table__.insert(), list(new_rows.values()))
+
+    # A inserção pelo Core não dispara o after_insert de UserAnswer: atualizar o bitset aqui
+    for user_id, question_id in new_rows:
+        question_pool_index.mark_answered(user_id, question_id)
+
+    by_user = {}
+    by_session = {}
+    by_question = {}
+    for item in items:
+        by_user.setdefault(item['user_id'], {'answered': 0, 'correct': 0, 'seconds': 0, 'xp': 0})['xp'] += item['xp']
+
+        session = by_session.setdefault(item['session_id'], [0, 0, 0])
+        session[0] += 1
+        session[1] += int(item['is_correct'])
+        session[2] += item['xp']
+
+        question = by_question.setdefault(item['question_id'], [0, 0])
+        question[0] += 1
+        question[1] += int(item['is_correct'])
+
+    # Respostas substituídas já atualizaram os contadores; aqui entram só as novas
+    for row in new_rows.values():
+        user = by_user[row['user_id']]
+        user['answered'] += 1
+        user['correct'] += int(row['is_correct'])
+        user['seconds'] += row['time_spent'] or 0
+
+    # Contadores, rollup diário, ranking e XP (User pelo ORM para invalidar o cache de autenticação)
+    users = {user.id: user for user in User.query.filter(User.id.in_(by_user.keys())).all()}
+    for user_id, totals in by_user.items():
+        if totals['answered']:
+            record_answer_batch_stats(user_id, totals['answered'], totals['correct'], totals['seconds'])
+        if totals['xp']:
+            users[user_id].xp = (users[user_id].xp or 0) + totals['xp']
+            record_xp_earned(user_id, totals['xp'])
+
+    sessions = {
+        session.id: session
+        for session in StudySession.query.filter(StudySession.id.in_(by_session.keys())).all()
+    }
+    completed = []
+    for session_id, (answered, correct, xp) in by_session.items():
+        session = sessions[session_id]
+        session.questions_answered = (session.questions_answered or 0) + answered
+        session.correct_answers = (session.correct_answers or 0) + correct
+        session.xp_earned = (session.xp_earned or 0) + xp
+        if not session.completed_at and session.questions_answered >= (session.total_questions or 0):
+            completed.append((session_id, session.user_id))
+
+    for question_id, (answered, correct) in by_question.items():
+        record_question_stats(question_id, answered, correct)
+
+    # Prioridades por tópico, na ordem das respostas
+    priorities = {}
+    for item in items:
+        key = (item['user_id'], item['specialty'])
+        if key not in priorities:
+            priorities[key] = get_user_topic_priority(*key)
+        priorities[key].update_performance(item['is_correct'])
+
+    # Log de seleção: a entrada mais recente de cada (usuário, questão)
+    logs = {}
+    for log in QuestionSelectionLog.query.filter(
+        QuestionSelectionLog.user_id.in_(by_user.keys()),
+        QuestionSelectionLog.question_id.in_(by_question.keys())
+    ).order_by(QuestionSelectionLog.selected_at.desc()).all():
+        logs.setdefault((log.user_id, log.question_id), log)
+    for item in items:
+        log = logs.get((item['user_id'], item['question_id']))
+        if log:
+            log.was_correct = item['is_correct']
+            log.response_time = item['response_time']
+
+    if commit:
+        db.session.commit()
+
+    return completed
+
+class AnswerIngestionQueue:
+    """
+    Ingestão write-behind das respostas de sessão: a correção usa o gabarito da sessão em
+    memória e a resposta volta na hora; os efeitos colaterais vão para uma fila em processo
+    que um worker aplica em lotes (uma transação por lote). Respostas ainda na fila se perdem
+    se o processo cair; a fila é drenada na saída normal do processo.
+    """
+
+    def __init__(self, max_batch=MAX_INGESTION_BATCH, max_sessions=10000):
+        self.max_batch = max_batch
+        self.max_sessions = max_sessions
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._sessions = OrderedDict()  # session_id -> SessionState
+        self._lock = threading.Lock()
+        self._worker = None
+        self._app = None
+
+    def start(self, app):
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._app = app
+            self._worker = threading.Thread(target=self._run, name='answer-ingestion', daemon=True)
+            self._worker.start()
+        atexit.register(self.flush)
+
+    def _load_session(self, session_id, user_id):
+        """Carrega a sessão, o gabarito das suas questões e as já respondidas (uma vez por sessão)"""
+        session = StudySession.query.get(session_id)
+        if not session or session.user_id != user_id or session.completed_at:
+            return None
+
+        question_ids = list(session.questions_data or [])
+        keys = answer_key_store.lookup_many(question_ids)
+        answered = {
+            row[0] for row in db.session.query(UserAnswer.question_id).filter(
+                UserAnswer.user_id == user_id,
+                UserAnswer.session_id == session_id
+            ).all()
+        }
+
+        return SessionState(
+            user_id, session.total_questions or len(question_ids), keys, answered,
+            session.correct_answers or 0, session.xp_earned or 0
+        )
+
+    def discard_session(self, session_id):
+        """
+        Descarta o estado em memória da sessão (ela passou a ser gravada por outro caminho).
+        Retorna as questões já respondidas nele, inclusive as que ainda estão na fila.
+        """
+        with self._lock:
+            state = self._sessions.pop(session_id, None)
+        return set(state.answered) if state is not None else set()
+
+    def _session_state(self, session_id, user_id):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None:
+                self._sessions.move_to_end(session_id)
+                return state
+
+        state = self._load_session(session_id, user_id)
+        if state is None:
+            return None
+
+        with self._lock:
+            # Outra requisição pode ter carregado a sessão enquanto isso
+            state = self._sessions.setdefault(session_id, state)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return state
+
+    def _explanation(self, state, question_id):
+        """Explicação da questão, buscando as da sessão inteira na primeira vez"""
+        if state.explanations is None:
+            state.explanations = get_explanations(state.keys)
+        return state.explanations.get(question_id)
+
+    def submit(self, user_id, session_id, question_id, selected_option, response_time=None,
+               include_explanation=True):
+        """Corrige a resposta em memória, enfileira os efeitos colaterais e retorna o feedback"""
+        if self._worker is None:
+            self.start(current_app._get_current_object())
+
+        state = self._session_state(session_id, user_id)
+        if state is None or state.user_id != user_id:
+            return None, "Sessão não encontrada"
+
+        with self._lock:
+            if question_id not in state.keys:
+                return None, "Questão não pertence a esta sessão"
+            if question_id in state.answered:
+                return None, "Questão já foi respondida nesta sessão"
+
+            correct_option, specialty, difficulty = state.keys[question_id]
+            is_correct = selected_option == correct_option
+            xp_earned = xp_for_answer(is_correct, difficulty, response_time)
+
+            state.answered.add(question_id)
+            state.correct += int(is_correct)
+            state.xp += xp_earned
+            answered = len(state.answered)
+            correct = state.correct
+            session_completed = answered >= state.total
+
+        self._queue.put({
+            'user_id': user_id,
+            'session_id': session_id,
+            'question_id': question_id,
+            'selected_option': selected_option,
+            'is_correct': is_correct,
+            'response_time': response_time,
+            'xp': xp_earned,
+            'specialty': specialty,
+            'answered_at': datetime.utcnow()
+        })
+
+        return {
+            'is_correct': is_correct,
+            'correct_option': correct_option,
+            'explanation': self._explanation(state, question_id) if include_explanation else None,
+            'xp_earned': xp_earned,
+            'session_progress': {
+                'answered': answered,
+                'total': state.total,
+                'correct': correct,
+                'accuracy': (correct / answered * 100) if answered > 0 else 0
+            },
+            'session_completed': session_completed
+        }, None
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _apply(self, batch):
+        """Aplica o lote; se a transação falhar, reaplica resposta por resposta para isolar a falha"""
+        try:
+            return apply_answer_batch(batch)
+        except Exception:
+            db.session.rollback()
+            if len(batch) == 1:
+                return self._apply_item(batch[0])
+            current_app.logger.exception(
+                'Falha ao aplicar lote de %s respostas; reaplicando uma a uma', len(batch)
+            )
+
+        completed = []
+        for item in batch:
+            completed += self._apply([item])
+        return completed
+
+    def _apply_item(self, item):
+        """Reaplica uma resposta isolada que já falhou uma vez, até MAX_APPLY_ATTEMPTS, antes de descartá-la"""
+        for attempt in range(2, MAX_APPLY_ATTEMPTS + 1):
+            time.sleep(RETRY_DELAY_SECONDS * (attempt - 1))
+            try:
+                return apply_answer_batch([item])
+            except Exception:
+                db.session.rollback()
+                if attempt == MAX_APPLY_ATTEMPTS:
+                    current_app.logger.exception(
+                        'Resposta descartada após %s tentativas: usuário %s, sessão %s, questão %s',
+                        attempt, item['user_id'], item['session_id'], item['question_id']
+                    )
+
+        self.failed += 1
+        return []
+
+    def _run(self):
+        from src.services.microlearning import MicroLearningService
+
+        while True:
+            batch = self._next_batch()
+            try:
+                with self._app.app_context():
+                    failed = self.failed
+                    completed = self._apply(batch)
+                    self.processed += len(batch) - (self.failed - failed)
+                    self.batches += 1
+
+                    # Conclusão (bônus, nível, streak e conquistas) fora da transação do lote
+                    for session_id, user_id in completed:
+                        result, error = MicroLearningService(user_id).complete_session(session_id)
+                        if error:
+                            current_app.logger.error('Falha ao completar a sessão %s: %s', session_id, error)
+            except Exception:
+                # O worker não pode parar: o lote é descartado e contado como falha
+                self._app.logger.exception('Lote de %s respostas descartado pelo worker', len(batch))
+                self.failed += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Aguarda o worker aplicar todas as respostas enfileiradas"""
+        if self._worker is not None:
+            self._queue.join()
+
+    def get_stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'processed': self.processed,
+            'failed': self.failed,
+            'batches': self.batches,
+            'sessions': len(self._sessions)
+        }
+
+answer_ingestion_queue = AnswerIngestionQueue()
@@ -0,0 +1,158 @@
+import threading
+import time
+import numpy as np
+from sqlalchemy import event, inspect, select
+from src.models.user import db
+from src.models.question import Question
+from src.services.session_hooks import after_transaction_of
+
+# Códigos de dificuldade no array (0 = sem questão)
+DIFFICULTY_CODES = {'easy': 1, 'medium': 2, 'hard': 3}
+DIFFICULTY_NAMES = {code: name for name, code in DIFFICULTY_CODES.items()}
+
+# Campos da questão mantidos no gabarito
+ANSWER_KEY_FIELDS = ('correct_answer', 'specialty', 'difficulty')
+
+
+class AnswerKeyStore:
+    """
+    Gabarito compacto em memória, indexado pelo id da questão: alternativa correta, id da
+    especialidade e código da dificuldade. Corrigir uma resposta não consulta o banco; o
+    conteúdo e a explicação da questão ficam fora do gabarito e são buscados sob demanda.
+    O gabarito tem só dados commitados: é invalidado no fim da transação que edita questões
+    e recarregado a cada `ttl` segundos para ver escritas de outros processos (populate_db).
+    Questões fora do gabarito (criadas depois da carga) são buscadas uma a uma.
+    """
+
+    def __init__(self, ttl=120):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._correct = np.zeros(0, dtype='S1')
+        self._specialty = np.zeros(0, dtype=np.int16)
+        self._difficulty = np.zeros(0, dtype=np.int8)
+        self._specialties = []
+        self._extra = {}  # question_id -> gabarito das questões buscadas fora da carga
+        self._dirty = True
+        self._expires_at = 0
+
+    def invalidate(self):
+        """Marca o gabarito para ser recarregado na próxima leitura"""
+        with self._lock:
+            self._dirty = True
+
+    def warm(self):
+        """Carrega o gabarito (chamado na inicialização do app)"""
+        self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        if not self._dirty and time.monotonic() < self._expires_at:
+            return
+
+        with self._lock:
+            if not self._dirty and time.monotonic() < self._expires_at:
+                return
+
+            # Conexão própria: apenas dados commitados entram no gabarito
+            with db.engine.connect() as connection:
+                rows = connection.execute(select(
+                    Question.id, Question.correct_answer, Question.specialty, Question.difficulty
+                )).all()
+
+            size = max((row[0] for row in rows), default=0) + 1
+            correct = np.zeros(size, dtype='S1')
+            specialty = np.zeros(size, dtype=np.int16)
+            difficulty = np.zeros(size, dtype=np.int8)
+
+            specialties = []
+            specialty_ids = {}
+            for question_id, correct_answer, specialty_name, difficulty_name in rows:
+                if specialty_name not in specialty_ids:
+                    specialty_ids[specialty_name] = len(specialties)
+                    specialties.append(specialty_name)
+                correct[question_id] = (correct_answer or '').encode('utf-8')[:1]
+                specialty[question_id] = specialty_ids[specialty_name]
+                difficulty[question_id] = DIFFICULTY_CODES.get(difficulty_name or 'medium', DIFFICULTY_CODES['medium'])
+
+            self._correct = correct
+            self._specialty = specialty
+            self._difficulty = difficulty
+            self._specialties = specialties
+            self._extra = {}
+            self._dirty = False
+            self._expires_at = time.monotonic() + self.ttl
+
+    def lookup(self, question_id):
+        """(alternativa correta, especialidade, dificuldade) da questão, ou None se não existir"""
+        try:
+            question_id = int(question_id)
+        except (TypeError, ValueError):
+            return None
+
+        self._ensure_loaded()
+
+        with self._lock:
+            if 0 <= question_id < len(self._difficulty) and self._difficulty[question_id]:
+                return (
+                    self._correct[question_id].decode('utf-8'),
+                    self._specialties[self._specialty[question_id]],
+                    DIFFICULTY_NAMES[int(self._difficulty[question_id])]
+                )
+            if question_id in self._extra:
+                return self._extra[question_id]
+
+        return self._lookup_missing(question_id)
+
+    def _lookup_missing(self, question_id):
+        """Questão fora do gabarito carregado: consulta de uma linha (None se não existir)"""
+        row = db.session.query(
+            Question.correct_answer, Question.specialty, Question.difficulty
+        ).filter(Question.id == question_id).first()
+        if row is None:
+            return None
+
+        key = (row.correct_answer, row.specialty, row.difficulty or 'medium')
+        with self._lock:
+            self._extra[question_id] = key
+        return key
+
+    def lookup_many(self, question_ids):
+        """Gabarito de várias questões: {question_id: (alternativa correta, especialidade, dificuldade)}"""
+        keys = {}
+        for question_id in question_ids:
+            key = self.lookup(question_id)
+            if key is not None:
+                keys[question_id] = key
+        return keys
+
+    def grade(self, question_id, selected_option):
+        """Corrige uma resposta: (acertou, gabarito) ou None se a questão não existir"""
+        key = self.lookup(question_id)
+        if key is None:
+            return None
+        return selected_option == key[0], key
+
+
+answer_key_store = AnswerKeyStore()
+
+
+def get_explanations(question_ids):
+    """Explicações buscadas sob demanda (apenas a coluna necessária)"""
+    if not question_ids:
+        return {}
+    return dict(
+        db.session.query(Question.id, Question.explanation).filter(Question.id.in_(list(question_ids))).all()
+    )
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_delete')
+def _invalidate_answer_key(mapper, connection, target):
+    after_transaction_of(target, 'answer_key', answer_key_store.invalidate)
+
+
+@event.listens_for(Question, 'after_update')
+def _invalidate_answer_key_on_edit(mapper, connection, target):
+    # Atualizações de estatísticas (times_answered) não alteram o gabarito
+    state = inspect(target)
+    if any(getattr(state.attrs, field).history.has_changes() for field in ANSWER_KEY_FIELDS):
+        after_transaction_of(target, 'answer_key', answer_key_store.invalidate)
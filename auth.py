@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db, User
+from src.services.principal_cache import principal_cache
 from datetime import datetime
 import jwt
 import os
@@ -19,10 +20,21 @@ def token_required(f):
                 token = token[7:]
             
             data = jwt.decode(token, os.environ.get('SECRET_KEY', 'default-secret'), algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            token_version = data.get('ver', 0)
+            
+            # Caso comum: usuário em cache, sem ida ao banco
+            current_user = principal_cache.get(data['user_id'], token_version)
             
             if not current_user:
-                return jsonify({'message': 'User not found'}), 401
+                current_user = User.query.get(data['user_id'])
+                
+                if not current_user:
+                    return jsonify({'message': 'User not found'}), 401
+                
+                if (current_user.token_version or 0) != token_version:
+                    return jsonify({'message': 'Token has been revoked'}), 401
+                
+                principal_cache.put(current_user)
                 
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token has expired'}), 401
@@ -128,6 +140,23 @@ def refresh_token(current_user):
         'user': current_user.to_dict()
     }), 200
 
+@auth_bp.route('/revoke-tokens', methods=['POST'])
+@token_required
+def revoke_tokens(current_user):
+    """Revogar todos os tokens do usuário (logout em todos os dispositivos)"""
+    try:
+        current_user.revoke_tokens()
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Tokens revoked successfully',
+            'token': current_user.generate_token()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Token revocation failed: {str(e)}'}), 500
+
 @auth_bp.route('/update-profile', methods=['PUT'])
 @token_required
 def update_profile(current_user):
@@ -0,0 +1,108 @@
+from datetime import timedelta
+import numpy as np
+from flask import current_app, has_app_context
+
+# Horizonte (dias) coberto pela contagem diária usada no balanceamento
+BALANCE_HORIZON_DAYS = 365
+
+# Limite padrão de revisões por dia e por usuário
+DEFAULT_DAILY_CAP = 200
+
+# Quantos dias além da janela um card pode ser adiado quando todos os dias estão no limite
+MAX_CAP_DELAY_DAYS = 7
+
+# Janela dos cards novos (dias após a criação)
+NEW_CARD_WINDOW = (1, 3)
+
+def load_balancing_enabled():
+    """Modo de balanceamento da instalação (config REVIEW_LOAD_BALANCING, ligado por padrão)"""
+    if has_app_context():
+        return bool(current_app.config.get('REVIEW_LOAD_BALANCING', True))
+    return True
+
+def daily_review_cap():
+    if has_app_context():
+        return int(current_app.config.get('REVIEW_DAILY_CAP', DEFAULT_DAILY_CAP))
+    return DEFAULT_DAILY_CAP
+
+def fuzz_window(interval_days):
+    """Janela permitida (em dias) para o vencimento de um intervalo: ±5%, ao menos 1 dia a partir de 3"""
+    if interval_days < 3:
+        return interval_days, interval_days
+    delta = max(1, int(round(interval_days * 0.05)))
+    return interval_days - delta, interval_days + delta
+
+def load_metrics(day_counts):
+    """Métricas de distribuição da carga diária (quanto menor a variância, mais suave)"""
+    counts = np.asarray(day_counts, dtype=np.float64)
+    if not len(counts):
+        return {'variance': 0, 'std': 0, 'mean': 0, 'max': 0, 'peak_to_mean': 0}
+
+    mean = counts.mean()
+    return {
+        'variance': round(float(counts.var()), 2),
+        'std': round(float(counts.std()), 2),
+        'mean': round(float(mean), 2),
+        'max': int(counts.max()),
+        'peak_to_mean': round(float(counts.max() / mean), 2) if mean else 0
+    }
+
+class DueDateBalancer:
+    """
+    Distribui os vencimentos dentro da janela permitida de cada intervalo, escolhendo o dia
+    menos carregado segundo a contagem diária da previsão (mantida em memória e atualizada a
+    cada card agendado) e respeitando o limite diário de revisões do usuário.
+    """
+
+    def __init__(self, base_date, day_counts, daily_cap=None):
+        self.base_date = base_date
+        self.counts = np.array(day_counts, dtype=np.int64)
+        self.daily_cap = daily_cap or daily_review_cap()
+
+    def _offset(self, moment):
+        return (moment.date() - self.base_date).days
+
+    def release(self, due_date):
+        """Remove da contagem o vencimento antigo de um card que será reagendado"""
+        if due_date is None:
+            return
+        offset = max(self._offset(due_date), 0)
+        if offset < len(self.counts) and self.counts[offset] > 0:
+            self.counts[offset] -= 1
+
+    def assign(self, reviewed_at, interval_days, window=None):
+        """Retorna o vencimento balanceado de uma revisão e contabiliza o dia escolhido"""
+        low, high = window or fuzz_window(interval_days)
+        start = self._offset(reviewed_at)
+
+        # Fora do horizonte conhecido: vencimento exato
+        first, last = start + low, start + high
+        if first < 1 or last >= len(self.counts):
+            exact = start + interval_days
+            if 0 <= exact < len(self.counts):
+                self.counts[exact] += 1
+            return reviewed_at + timedelta(days=interval_days)
+
+        offsets = np.arange(first, last + 1)
+        loads = self.counts[offsets]
+
+        # Todos os dias no limite: estende a janela para frente até achar um dia livre
+        if loads.min() >= self.daily_cap:
+            extended = np.arange(last + 1, min(last + 1 + MAX_CAP_DELAY_DAYS, len(self.counts)))
+            free = extended[self.counts[extended] < self.daily_cap]
+            if len(free):
+                offsets, loads = free[:1], self.counts[free[:1]]
+
+        # Menor carga; empate decidido pelo dia mais próximo do intervalo original
+        target = start + interval_days
+        chosen = offsets[np.lexsort((offsets, np.abs(offsets - target), loads))[0]]
+        self.counts[chosen] += 1
+
+        return reviewed_at + timedelta(days=int(chosen - start))
+
+    def assign_new(self, created_at):
+        """Vencimento inicial de um card novo, espalhado pelos primeiros dias"""
+        return self.assign(created_at, NEW_CARD_WINDOW[0], NEW_CARD_WINDOW)
+
+    def metrics(self, days=None):
+        return load_metrics(self.counts[:days] if days else self.counts)
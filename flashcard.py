@@ -2,10 +2,26 @@ from src.models.user import db
 from datetime import datetime, timedelta
 import json
 
-class Flashcard(db.Model):
+class FlashcardContent(db.Model):
+    """
+    Frente e verso derivados de uma questão, compartilhados por todos os usuários.
+    content_hash identifica a versão da questão (e da derivação) que gerou o texto.
+    """
     id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
     front_content = db.Column(db.Text, nullable=False)
     back_content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('question_id', 'content_hash', name='unique_question_content_hash'),)
+
+class Flashcard(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Texto próprio (cards personalizados); cards gerados de questões usam content_id
+    front_content = db.Column(db.Text)
+    back_content = db.Column(db.Text)
+    content_id = db.Column(db.Integer, db.ForeignKey('flashcard_content.id'), nullable=True)
     
     # Categorização
     specialty = db.Column(db.String(100), nullable=False)
@@ -15,6 +31,20 @@ class Flashcard(db.Model):
     # Relacionamento com questão (opcional)
     question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=True)
     
+    # Agendamento da repetição espaçada (flashcards do usuário)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    ease_factor = db.Column(db.Float, default=2.5)
+    interval_days = db.Column(db.Integer, default=1)
+    review_count = db.Column(db.Integer, default=0)
+    next_review_date = db.Column(db.DateTime, default=datetime.utcnow)
+    last_reviewed = db.Column(db.DateTime)
+    is_active = db.Column(db.Boolean, default=True)
+    is_custom = db.Column(db.Boolean, default=False)
+    
+    # Estado de memória do FSRS (estabilidade em dias e dificuldade 1-10)
+    stability = db.Column(db.Float)
+    memory_difficulty = db.Column(db.Float)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -22,6 +52,32 @@ class Flashcard(db.Model):
     # Relacionamentos
     reviews = db.relationship('FlashcardReview', backref='flashcard', lazy=True)
     question = db.relationship('Question', backref='flashcards')
+    content = db.relationship('FlashcardContent', lazy='joined')
+
+    @property
+    def front_text(self):
+        return self.content.front_content if self.content is not None else self.front_content
+
+    @front_text.setter
+    def front_text(self, value):
+        self._detach_content()
+        self.front_content = value
+
+    @property
+    def back_text(self):
+        return self.content.back_content if self.content is not None else self.back_content
+
+    @back_text.setter
+    def back_text(self, value):
+        self._detach_content()
+        self.back_content = value
+
+    def _detach_content(self):
+        """Editar um card que usa o conteúdo compartilhado cria uma cópia própria do texto"""
+        if self.content is not None:
+            self.front_content = self.content.front_content
+            self.back_content = self.content.back_content
+            self.content = None
 
     def get_tags_list(self):
         """Retorna as tags como lista"""
@@ -36,15 +92,31 @@ class Flashcard(db.Model):
     def to_dict(self):
         return {
             'id': self.id,
-            'front_content': self.front_content,
-            'back_content': self.back_content,
+            'front_content': self.front_text,
+            'back_content': self.back_text,
             'specialty': self.specialty,
             'difficulty': self.difficulty,
             'tags': self.get_tags_list(),
             'question_id': self.question_id,
+            'ease_factor': self.ease_factor,
+            'interval_days': self.interval_days,
+            'review_count': self.review_count,
+            'next_review_date': self.next_review_date.isoformat() if self.next_review_date else None,
+            'last_reviewed': self.last_reviewed.isoformat() if self.last_reviewed else None,
+            'is_custom': self.is_custom,
+            'stability': self.stability,
+            'memory_difficulty': self.memory_difficulty,
             'created_at': self.created_at.isoformat()
         }
 
+# Índices das consultas de flashcards pendentes (usuário + ativos + data de revisão)
+db.Index('ix_flashcard_user_active_due', Flashcard.user_id, Flashcard.is_active, Flashcard.next_review_date)
+db.Index(
+    'ix_flashcard_active_due', Flashcard.user_id, Flashcard.next_review_date,
+    sqlite_where=Flashcard.is_active == True,
+    postgresql_where=Flashcard.is_active == True
+)
+
 class FlashcardReview(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -60,6 +132,13 @@ class FlashcardReview(db.Model):
     last_review_date = db.Column(db.Date)
     last_quality = db.Column(db.Integer)  # 0-5 (0=blackout, 5=perfect)
     
+    # Histórico da revisão (registro gravado pelo serviço de repetição espaçada)
+    quality_rating = db.Column(db.Integer)
+    previous_interval = db.Column(db.Integer)
+    previous_ease_factor = db.Column(db.Float)
+    reviewed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    time_spent = db.Column(db.Integer)  # tempo em segundos
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -69,26 +148,20 @@ class FlashcardReview(db.Model):
         Atualiza o algoritmo de repetição espaçada baseado na qualidade da resposta
         Quality: 0-5 (0=não lembrou, 1=difícil, 2=hesitou, 3=fácil, 4=muito fácil, 5=perfeito)
         """
+        from src.services.scheduler import SM2Engine
+        
         self.last_review_date = datetime.utcnow().date()
         self.last_quality = quality
         
-        if quality < 3:
-            # Resposta incorreta ou difícil - reinicia o processo
-            self.repetitions = 0
-            self.interval = 1
-        else:
-            # Resposta correta
-            if self.repetitions == 0:
-                self.interval = 1
-            elif self.repetitions == 1:
-                self.interval = 6
-            else:
-                self.interval = int(self.interval * self.ease_factor)
-            
-            self.repetitions += 1
-        
-        # Atualiza o fator de facilidade
-        self.ease_factor = max(1.3, self.ease_factor + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)))
+        # Mesmas regras do agendamento dos flashcards (engine SM-2 compartilhado)
+        state = SM2Engine().review({
+            'review_count': self.repetitions or 0,
+            'interval_days': self.interval or 1,
+            'ease_factor': self.ease_factor or 2.5
+        }, quality)
+        self.repetitions = state['review_count']
+        self.interval = state['interval_days']
+        self.ease_factor = state['ease_factor']
         
         # Define a próxima data de revisão
         self.next_review_date = datetime.utcnow().date() + timedelta(days=self.interval)
@@ -107,6 +180,9 @@ class FlashcardReview(db.Model):
             'next_review_date': self.next_review_date.isoformat(),
             'last_review_date': self.last_review_date.isoformat() if self.last_review_date else None,
             'last_quality': self.last_quality,
+            'quality_rating': self.quality_rating,
+            'reviewed_at': self.reviewed_at.isoformat() if self.reviewed_at else None,
+            'time_spent': self.time_spent,
             'is_due': self.is_due_for_review()
         }
 
@@ -153,3 +229,38 @@ class UserFlashcardProgress(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
+
+class SchedulerParameters(db.Model):
+    """Parâmetros de agendamento ajustados a partir do histórico de revisões (por usuário e especialidade)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    specialty = db.Column(db.String(100))  # None = todas as especialidades do usuário
+    
+    parameters = db.Column(db.Text)  # JSON: initial_stability, interval_modifier
+    statistics = db.Column(db.Text)  # JSON: contagens acumuladas usadas no ajuste
+    reviews_fitted = db.Column(db.Integer, default=0)
+    last_review_id = db.Column(db.Integer, default=0)  # Última revisão processada (ajuste incremental)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_scheduler_parameters_user_specialty', 'user_id', 'specialty'),)
+
+    def get_parameters(self):
+        return json.loads(self.parameters) if self.parameters else {}
+
+    def set_parameters(self, parameters):
+        self.parameters = json.dumps(parameters)
+
+    def get_statistics(self):
+        return json.loads(self.statistics) if self.statistics else {}
+
+    def set_statistics(self, statistics):
+        self.statistics = json.dumps(statistics)
+
+    def to_dict(self):
+        return {
+            'specialty': self.specialty,
+            'parameters': self.get_parameters(),
+            'reviews_fitted': self.reviews_fitted,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
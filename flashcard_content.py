@@ -0,0 +1,150 @@
+import hashlib
+import json
+from sqlalchemy import event, inspect, select
+from src.models.user import db
+from src.models.question import Question
+from src.models.flashcard import Flashcard, FlashcardContent
+
+# Incrementar quando as regras de derivação mudarem (gera novas versões do conteúdo)
+DERIVATION_VERSION = 1
+
+# Campos da questão usados na derivação
+CONTENT_FIELDS = ('content', 'options', 'correct_answer', 'explanation')
+
+def content_hash(question):
+    """Hash da versão da questão (campos usados na derivação + versão das regras)"""
+    payload = json.dumps(
+        [DERIVATION_VERSION] + [getattr(question, field) for field in CONTENT_FIELDS],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def derive_front(question):
+    """Extrai o conceito principal de uma questão para criar a frente do flashcard"""
+    # Simplificação: usar as primeiras palavras da questão
+    # Em uma implementação mais avançada, usaríamos NLP para extrair conceitos
+    
+    question_text = question.content
+    
+    # Tentar identificar padrões comuns em questões médicas
+    if "diagnóstico" in question_text.lower():
+        return f"Qual o diagnóstico mais provável para: {question_text[:100]}..."
+    elif "tratamento" in question_text.lower():
+        return f"Qual o tratamento indicado para: {question_text[:100]}..."
+    elif "exame" in question_text.lower():
+        return f"Qual exame é indicado para: {question_text[:100]}..."
+    else:
+        # Usar a questão completa se for curta, ou resumir
+        if len(question_text) <= 150:
+            return question_text
+        else:
+            return f"{question_text[:150]}..."
+
+def derive_back(question):
+    """Cria a resposta do flashcard baseada na explicação da questão"""
+    explanation = question.explanation or ""
+    correct_option = question.correct_answer
+    options = json.loads(question.options) if question.options else {}
+    
+    # Buscar a opção correta
+    correct_answer_text = ""
+    if correct_option in options:
+        correct_answer_text = options[correct_option]
+    
+    # Combinar resposta correta com explicação
+    back_text = f"**Resposta:** {correct_option}) {correct_answer_text}\n\n"
+    
+    if explanation:
+        back_text += f"**Explicação:** {explanation}"
+    
+    return back_text
+
+def _content_row(question, digest):
+    return {
+        'question_id': question.id,
+        'content_hash': digest,
+        'front_content': derive_front(question),
+        'back_content': derive_back(question)
+    }
+
+def _insert_ignoring_existing(dialect):
+    """
+    INSERT que ignora versões já gravadas por outro processo (restrição única em
+    question_id + content_hash); quem perde a corrida relê o id na consulta seguinte.
+    """
+    table = FlashcardContent.__table__
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing(index_elements=['question_id', 'content_hash'])
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing(index_elements=['question_id', 'content_hash'])
+    return table.insert().prefix_with('IGNORE')
+
+def get_content_ids(questions):
+    """
+    Retorna {question_id: id do conteúdo derivado} para a versão atual de cada questão.
+    Só deriva (e insere em lote) o texto das versões que ainda não existem na tabela.
+    questions: objetos ou linhas com id e os campos de CONTENT_FIELDS.
+    """
+    hashes = {question.id: content_hash(question) for question in questions}
+    if not hashes:
+        return {}
+
+    def lookup():
+        rows = db.session.query(
+            FlashcardContent.question_id,
+            FlashcardContent.content_hash,
+            FlashcardContent.id
+        ).filter(FlashcardContent.question_id.in_(hashes.keys())).all()
+        return {
+            question_id: content_id for question_id, digest, content_id in rows
+            if hashes.get(question_id) == digest
+        }
+
+    content_ids = lookup()
+
+    missing = [question for question in questions if question.id not in content_ids]
+    if missing:
+        db.session.execute(
+            _insert_ignoring_existing(db.session.get_bind().dialect.name),
+            [_content_row(question, hashes[question.id]) for question in missing]
+        )
+        content_ids = lookup()
+
+    return content_ids
+
+@event.listens_for(Question, 'after_update')
+def _refresh_flashcard_content(mapper, connection, target):
+    """
+    Questão editada: deriva o conteúdo da nova versão, aponta os cards para ele e remove
+    as versões antigas. Questões sem conteúdo derivado ficam para a próxima geração.
+    """
+    state = inspect(target)
+    if not any(getattr(state.attrs, field).history.has_changes() for field in CONTENT_FIELDS):
+        return
+
+    table = FlashcardContent.__table__
+    stale_ids = [
+        row[0] for row in connection.execute(
+            select(table.c.id).where(table.c.question_id == target.id)
+        )
+    ]
+    if not stale_ids:
+        return
+
+    digest = content_hash(target)
+    current_query = select(table.c.id).where(table.c.question_id == target.id, table.c.content_hash == digest)
+    current = connection.execute(current_query).scalar()
+    if current is None:
+        connection.execute(_insert_ignoring_existing(connection.dialect.name), [_content_row(target, digest)])
+        current = connection.execute(current_query).scalar()
+
+    stale_ids = [content_id for content_id in stale_ids if content_id != current]
+    if stale_ids:
+        flashcards = Flashcard.__table__
+        connection.execute(
+            flashcards.update().where(flashcards.c.content_id.in_(stale_ids)).values(content_id=current)
+        )
+        connection.execute(table.delete().where(table.c.id.in_(stale_ids)))
@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+class FlashcardStatsCache:
+    """
+    Cache LRU das estatísticas de flashcards por usuário. A chave é a última revisão do usuário
+    (e o total de cards ativos, que muda quando cards são criados ou desativados); a entrada
+    também expira quando o próximo card vence, para manter exata a contagem de pendentes.
+    """
+
+    def __init__(self, max_size=5000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (chave, estatísticas, próximo vencimento, expira_em)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key, now=None):
+        now = now or datetime.utcnow()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == key and (entry[2] is None or now < entry[2]) and entry[3] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, user_id, key, stats, next_due=None):
+        with self._lock:
+            self._entries[user_id] = (key, stats, next_due, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 2) if total else 0
+        }
+
+flashcard_stats_cache = FlashcardStatsCache()
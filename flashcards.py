@@ -3,6 +3,9 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import db
 from src.models.flashcard import Flashcard, FlashcardReview
 from src.services.spaced_repetition import SpacedRepetitionService
+from src.services.scheduler import SCHEDULERS, default_scheduler_name
+from src.services.retention_analytics import get_retention_report
+from src.models.user import User
 from datetime import datetime
 
 flashcards_bp = Blueprint('flashcards', __name__)
@@ -62,12 +65,40 @@ def review_flashcard(flashcard_id):
         data = request.get_json()
         
         quality_rating = data.get('quality_rating')
+        time_spent = data.get('time_spent')
         
         if quality_rating is None or not (0 <= quality_rating <= 5):
             return jsonify({'message': 'quality_rating deve ser um número entre 0 e 5'}), 400
         
+        if time_spent is not None and (not isinstance(time_spent, int) or time_spent < 0):
+            return jsonify({'message': 'time_spent deve ser um número de segundos'}), 400
+        
+        spaced_rep = SpacedRepetitionService(user_id)
+        result, error = spaced_rep.review_flashcard(flashcard_id, quality_rating, time_spent)
+        
+        if error:
+            return jsonify({'message': error}), 400
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@flashcards_bp.route('/flashcards/review/batch', methods=['POST'])
+@jwt_required()
+def review_flashcards_batch():
+    """Sincroniza em lote as revisões feitas offline"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        
+        reviews = data.get('reviews')
+        
+        if not isinstance(reviews, list) or not reviews:
+            return jsonify({'message': 'reviews deve ser uma lista de {flashcard_id, quality_rating, reviewed_at}'}), 400
+        
         spaced_rep = SpacedRepetitionService(user_id)
-        result, error = spaced_rep.review_flashcard(flashcard_id, quality_rating)
+        result, error = spaced_rep.review_flashcards_batch(reviews)
         
         if error:
             return jsonify({'message': error}), 400
@@ -77,6 +108,51 @@ def review_flashcard(flashcard_id):
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
+@flashcards_bp.route('/flashcards/<int:flashcard_id>/retrievability', methods=['GET'])
+@jwt_required()
+def get_retrievability_curve(flashcard_id):
+    """Retorna a curva de retenção prevista para um flashcard"""
+    try:
+        user_id = get_jwt_identity()
+        days = min(max(int(request.args.get('days', 30)), 1), 365)
+        
+        spaced_rep = SpacedRepetitionService(user_id)
+        result, error = spaced_rep.get_retrievability_curve(flashcard_id, days)
+        
+        if error:
+            return jsonify({'message': error}), 404
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@flashcards_bp.route('/flashcards/scheduler', methods=['GET', 'PUT'])
+@jwt_required()
+def flashcard_scheduler():
+    """Consulta ou define o engine de agendamento do usuário (sm2, fsrs ou null para o padrão)"""
+    try:
+        user = User.query.get(get_jwt_identity())
+        
+        if request.method == 'PUT':
+            engine = (request.get_json() or {}).get('engine')
+            
+            if engine is not None and engine not in SCHEDULERS:
+                return jsonify({'message': f"engine deve ser um de: {', '.join(SCHEDULERS)}"}), 400
+            
+            user.scheduler_engine = engine
+            db.session.commit()
+        
+        return jsonify({
+            'engine': user.scheduler_engine or default_scheduler_name(),
+            'is_default': user.scheduler_engine is None,
+            'available': list(SCHEDULERS)
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
+
 @flashcards_bp.route('/flashcards/stats', methods=['GET'])
 @jwt_required()
 def get_flashcard_stats():
@@ -84,8 +160,11 @@ def get_flashcard_stats():
     try:
         user_id = get_jwt_identity()
         
+        # fresh=1 ignora o cache (recalcula mesmo sem revisões novas)
+        cached = request.args.get('fresh') not in ('1', 'true')
+        
         spaced_rep = SpacedRepetitionService(user_id)
-        stats, error = spaced_rep.get_flashcard_stats()
+        stats, error = spaced_rep.get_flashcard_stats(cached=cached)
         
         if error:
             return jsonify({'message': error}), 400
@@ -101,22 +180,63 @@ def get_study_forecast():
     """Retorna previsão de flashcards para os próximos dias"""
     try:
         user_id = get_jwt_identity()
-        days = int(request.args.get('days', 7))
+        days = min(max(int(request.args.get('days', 7)), 1), 365)
+        bucket = request.args.get('bucket', 'day')
         
         spaced_rep = SpacedRepetitionService(user_id)
-        forecast, error = spaced_rep.get_study_forecast(days)
+        forecast, error = spaced_rep.get_study_forecast(days, bucket)
         
         if error:
             return jsonify({'message': error}), 400
         
         return jsonify({
             'forecast': forecast,
-            'days': days
+            'days': days,
+            'bucket': bucket
         })
         
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
+@flashcards_bp.route('/flashcards/load', methods=['GET'])
+@jwt_required()
+def get_review_load():
+    """Retorna a carga diária de revisões prevista e sua variância"""
+    try:
+        user_id = get_jwt_identity()
+        days = min(max(int(request.args.get('days', 30)), 1), 365)
+        
+        spaced_rep = SpacedRepetitionService(user_id)
+        load, error = spaced_rep.get_review_load(days)
+        
+        if error:
+            return jsonify({'message': error}), 400
+        
+        return jsonify(load)
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@flashcards_bp.route('/flashcards/rebalance', methods=['POST'])
+@jwt_required()
+def rebalance_due_dates():
+    """Redistribui os vencimentos futuros e retorna a variância da carga antes e depois"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+        days = min(max(int(data.get('days', 30)), 2), 365)
+        
+        spaced_rep = SpacedRepetitionService(user_id)
+        result, error = spaced_rep.rebalance_due_dates(days)
+        
+        if error:
+            return jsonify({'message': error}), 400
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
 @flashcards_bp.route('/flashcards/create', methods=['POST'])
 @jwt_required()
 def create_custom_flashcard():
@@ -177,6 +297,20 @@ def get_retention_rate():
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
+@flashcards_bp.route('/flashcards/retention', methods=['GET'])
+@jwt_required()
+def get_retention_analytics():
+    """Retenção em 7/30/90 dias, tendência, por faixa de intervalo, maturidade e especialidade"""
+    try:
+        user_id = get_jwt_identity()
+        days = min(max(int(request.args.get('days', 30)), 1), 365)
+        specialty = request.args.get('specialty')
+        
+        return jsonify(get_retention_report(user_id, days, specialty))
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
 @flashcards_bp.route('/flashcards/optimize-session', methods=['GET'])
 @jwt_required()
 def optimize_study_session():
@@ -186,15 +320,19 @@ def optimize_study_session():
         available_time = int(request.args.get('time_minutes', 15))
         
         spaced_rep = SpacedRepetitionService(user_id)
-        flashcards, error = spaced_rep.optimize_study_session(available_time)
+        plan, error = spaced_rep.optimize_study_session(available_time)
         
         if error:
             return jsonify({'message': error}), 400
         
+        flashcards = plan['flashcards']
         return jsonify({
             'recommended_flashcards': [card.to_dict() for card in flashcards],
-            'estimated_time_minutes': len(flashcards) * 0.5,
+            'estimated_time_minutes': round(plan['estimated_seconds'] / 60, 1),
             'available_time_minutes': available_time,
+            'expected_retention_gain': plan['expected_gain'],
+            'due_flashcards': plan['due'],
+            'near_due_flashcards': plan['near_due'],
             'optimization_note': f'Selecionados {len(flashcards)} flashcards para {available_time} minutos'
         })
         
@@ -1,10 +1,31 @@
 from datetime import datetime, timedelta
 from src.models.user import db, User
-from src.models.achievement import Achievement, UserAchievement
+from src.models.achievement import UserAchievement
+from src.services.achievement_catalog import achievement_catalog
 from src.models.study_session import StudySession
 from src.models.question import UserAnswer
 from src.models.priority import UserTopicPriority
-import math
+from src.services.achievement_engine import AchievementEngine, level_for_xp
+from src.models.user_stats import read_user_stats, get_daily_activity, sum_daily_activity
+
+def xp_for_answer(is_correct, difficulty='medium', response_time=None):
+    """XP de uma resposta (não depende do estado do usuário; usado também fora do serviço)"""
+    if not is_correct:
+        return 0
+    
+    # XP base por dificuldade
+    base_xp = {
+        'easy': 5,
+        'medium': 10,
+        'hard': 15
+    }.get(difficulty, 10)
+    
+    # Bonus por velocidade (se respondeu em menos de 30 segundos)
+    speed_bonus = 0
+    if response_time and response_time < 30:
+        speed_bonus = 2
+    
+    return base_xp + speed_bonus
 
 class GamificationService:
     """Serviço de gamificação para o MedStudy"""
@@ -12,25 +33,11 @@ class GamificationService:
     def __init__(self, user_id):
         self.user_id = user_id
         self.user = User.query.get(user_id)
+        self.pending_changes = {}  # contador -> (valor antigo, valor novo)
     
     def calculate_xp_for_answer(self, is_correct, difficulty='medium', response_time=None):
         """Calcula XP baseado na resposta"""
-        if not is_correct:
-            return 0
-        
-        # XP base por dificuldade
-        base_xp = {
-            'easy': 5,
-            'medium': 10,
-            'hard': 15
-        }.get(difficulty, 10)
-        
-        # Bonus por velocidade (se respondeu em menos de 30 segundos)
-        speed_bonus = 0
-        if response_time and response_time < 30:
-            speed_bonus = 2
-        
-        return base_xp + speed_bonus
+        return xp_for_answer(is_correct, difficulty, response_time)
     
     def calculate_session_bonus(self, session_id):
         """Calcula bonus de XP por completar sessão"""
@@ -60,14 +67,14 @@ class GamificationService:
     def update_user_level(self):
         """Atualiza o nível do usuário baseado no XP"""
         # Fórmula: level = sqrt(xp / 100)
-        new_level = int(math.sqrt(self.user.xp / 100)) + 1
+        new_level = level_for_xp(self.user.xp)
         old_level = self.user.level
         
         self.user.level = new_level
         
         # Verificar se subiu de nível
         if new_level > old_level:
-            self.check_level_achievements(new_level)
+            self._record_change('level', old_level, new_level)
             return True, new_level - old_level
         
         return False, 0
@@ -75,9 +82,10 @@ class GamificationService:
     def update_streak(self):
         """Atualiza a sequência de dias estudando"""
         today = datetime.utcnow().date()
+        old_streak = self.user.streak or 0
         
-        if self.user.last_activity_date:
-            last_activity = self.user.last_activity_date.date()
+        if self.user.last_study_date:
+            last_activity = self.user.last_study_date
             
             if last_activity == today:
                 # Já estudou hoje, não alterar streak
@@ -92,237 +100,71 @@ class GamificationService:
             # Primeira atividade
             self.user.streak = 1
         
-        self.user.last_activity_date = datetime.utcnow()
+        self.user.last_study_date = today
         
-        # Verificar conquistas de streak
-        self.check_streak_achievements()
+        # Conquistas de streak são avaliadas em check_achievements
+        self._record_change('streak', old_streak, self.user.streak)
         
         return self.user.streak
     
-    def check_achievements(self, context=None):
-        """Verifica e desbloqueia conquistas"""
-        achievements_unlocked = []
-        
-        # Conquistas básicas
-        achievements_unlocked.extend(self.check_basic_achievements())
-        
-        # Conquistas de especialidade
-        achievements_unlocked.extend(self.check_specialty_achievements())
-        
-        # Conquistas de desempenho
-        achievements_unlocked.extend(self.check_performance_achievements())
-        
-        # Conquistas de consistência
-        achievements_unlocked.extend(self.check_consistency_achievements())
-        
-        return achievements_unlocked
-    
-    def check_basic_achievements(self):
-        """Conquistas básicas de progresso"""
-        achievements = []
-        
-        # Total de questões respondidas
-        total_answered = UserAnswer.query.filter_by(user_id=self.user_id).count()
-        
-        milestones = [
-            (10, "Primeiros Passos", "Respondeu 10 questões"),
-            (50, "Estudante Dedicado", "Respondeu 50 questões"),
-            (100, "Centena Completa", "Respondeu 100 questões"),
-            (500, "Meio Milhar", "Respondeu 500 questões"),
-            (1000, "Milhar Conquistado", "Respondeu 1000 questões")
-        ]
-        
-        for count, name, description in milestones:
-            if total_answered >= count:
-                achievement = self.unlock_achievement(
-                    name=name,
-                    description=description,
-                    category="progress",
-                    xp_reward=count // 10
-                )
-                if achievement:
-                    achievements.append(achievement)
-        
-        return achievements
-    
-    def check_specialty_achievements(self):
-        """Conquistas por especialidade"""
-        achievements = []
-        
-        # Verificar domínio de especialidades (>= 80% de acerto com pelo menos 20 questões)
-        priorities = UserTopicPriority.query.filter_by(user_id=self.user_id).all()
-        
-        for priority in priorities:
-            if priority.questions_answered >= 20 and priority.accuracy_rate >= 80:
-                achievement = self.unlock_achievement(
-                    name=f"Mestre em {priority.specialty}",
-                    description=f"Alcançou 80% de acerto em {priority.specialty}",
-                    category="specialty",
-                    xp_reward=50
-                )
-                if achievement:
-                    achievements.append(achievement)
-        
-        return achievements
+    def _record_change(self, counter, old_value, new_value):
+        """Acumula a mudança de um contador para a próxima avaliação de conquistas"""
+        if counter in self.pending_changes:
+            old_value = self.pending_changes[counter][0]
+        self.pending_changes[counter] = (old_value, new_value)
     
-    def check_performance_achievements(self):
-        """Conquistas de desempenho"""
-        achievements = []
-        
-        # Acurácia geral
-        total_answered = UserAnswer.query.filter_by(user_id=self.user_id).count()
-        correct_answers = UserAnswer.query.filter_by(user_id=self.user_id, is_correct=True).count()
-        
-        if total_answered >= 50:
-            accuracy = (correct_answers / total_answered) * 100
-            
-            if accuracy >= 90:
-                achievement = self.unlock_achievement(
-                    name="Precisão Cirúrgica",
-                    description="Manteve 90% de acerto com pelo menos 50 questões",
-                    category="performance",
-                    xp_reward=100
-                )
-                if achievement:
-                    achievements.append(achievement)
-            elif accuracy >= 80:
-                achievement = self.unlock_achievement(
-                    name="Alta Performance",
-                    description="Manteve 80% de acerto com pelo menos 50 questões",
-                    category="performance",
-                    xp_reward=75
-                )
-                if achievement:
-                    achievements.append(achievement)
-        
-        return achievements
-    
-    def check_streak_achievements(self):
-        """Conquistas de sequência"""
-        achievements = []
-        
-        streak_milestones = [
-            (3, "Três Dias Seguidos", "Estudou por 3 dias consecutivos"),
-            (7, "Uma Semana Completa", "Estudou por 7 dias consecutivos"),
-            (14, "Duas Semanas", "Estudou por 14 dias consecutivos"),
-            (30, "Um Mês Dedicado", "Estudou por 30 dias consecutivos"),
-            (100, "Cem Dias de Foco", "Estudou por 100 dias consecutivos")
-        ]
-        
-        for days, name, description in streak_milestones:
-            if self.user.streak >= days:
-                achievement = self.unlock_achievement(
-                    name=name,
-                    description=description,
-                    category="consistency",
-                    xp_reward=days * 2
-                )
-                if achievement:
-                    achievements.append(achievement)
-        
-        return achievements
-    
-    def check_level_achievements(self, level):
-        """Conquistas por nível alcançado"""
-        achievements = []
-        
-        level_milestones = [
-            (5, "Nível 5", "Alcançou o nível 5"),
-            (10, "Nível 10", "Alcançou o nível 10"),
-            (20, "Nível 20", "Alcançou o nível 20"),
-            (50, "Nível 50", "Alcançou o nível 50")
-        ]
-        
-        for target_level, name, description in level_milestones:
-            if level >= target_level:
-                achievement = self.unlock_achievement(
-                    name=name,
-                    description=description,
-                    category="level",
-                    xp_reward=target_level * 10
-                )
-                if achievement:
-                    achievements.append(achievement)
-        
-        return achievements
-    
-    def check_consistency_achievements(self):
-        """Conquistas de consistência de estudo"""
-        achievements = []
-        
-        # Verificar sessões completadas nos últimos 7 dias
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_sessions = StudySession.query.filter(
-            StudySession.user_id == self.user_id,
-            StudySession.completed_at >= week_ago,
-            StudySession.completed_at.isnot(None)
-        ).count()
-        
-        if recent_sessions >= 7:
-            achievement = self.unlock_achievement(
-                name="Estudante Consistente",
-                description="Completou pelo menos uma sessão por dia na última semana",
-                category="consistency",
-                xp_reward=100
-            )
-            if achievement:
-                achievements.append(achievement)
-        
-        return achievements
-    
-    def unlock_achievement(self, name, description, category, xp_reward=0):
-        """Desbloqueia uma conquista se ainda não foi obtida"""
-        # Verificar se a conquista já existe
-        achievement = Achievement.query.filter_by(name=name).first()
-        
-        if not achievement:
-            # Criar nova conquista
-            achievement = Achievement(
-                name=name,
-                description=description,
-                category=category,
-                xp_reward=xp_reward
-            )
-            db.session.add(achievement)
-            db.session.commit()
-        
-        # Verificar se o usuário já tem esta conquista
-        user_achievement = UserAchievement.query.filter_by(
-            user_id=self.user_id,
-            achievement_id=achievement.id
-        ).first()
-        
-        if not user_achievement:
-            # Desbloquear conquista para o usuário
-            user_achievement = UserAchievement(
-                user_id=self.user_id,
-                achievement_id=achievement.id
-            )
-            db.session.add(user_achievement)
-            
-            # Adicionar XP da conquista
-            if xp_reward > 0:
-                self.user.xp += xp_reward
-                self.update_user_level()
-            
-            db.session.commit()
+    def check_achievements(self, context=None):
+        """
+        Verifica e desbloqueia conquistas avaliando apenas as regras dos contadores que mudaram.
+        context: deltas do evento, ex. {'questions_answered': 10, 'correct_answers': 8,
+        'sessions_completed': 1, 'specialties': [...]}
+        """
+        context = context or {}
+        changes = dict(self.pending_changes)
+        self.pending_changes = {}
+        
+        answered_delta = context.get('questions_answered', 0)
+        correct_delta = context.get('correct_answers', 0)
+        
+        if answered_delta:
+            stats = read_user_stats(self.user_id)
+            total, correct = stats.total_answered, stats.total_correct
             
-            return {
-                'achievement': achievement.to_dict(),
-                'xp_reward': xp_reward,
-                'unlocked_at': user_achievement.unlocked_at.isoformat()
+            # Conquistas básicas e de desempenho
+            changes['questions_answered'] = (total - answered_delta, total)
+            changes['accuracy'] = ((total - answered_delta, correct - correct_delta), (total, correct))
+        
+        # Conquistas de especialidade (apenas as especialidades estudadas no evento)
+        if context.get('specialties'):
+            priorities = UserTopicPriority.query.filter(
+                UserTopicPriority.user_id == self.user_id,
+                UserTopicPriority.specialty.in_(context['specialties'])
+            ).all()
+            changes['specialty_mastery'] = {
+                p.specialty: (p.questions_answered, p.accuracy_rate) for p in priorities
             }
         
-        return None
+        # Conquistas de consistência (sessões completadas nos últimos 7 dias)
+        if context.get('sessions_completed'):
+            week_ago = datetime.utcnow() - timedelta(days=7)
+            recent_sessions = StudySession.query.filter(
+                StudySession.user_id == self.user_id,
+                StudySession.completed_at >= week_ago,
+                StudySession.completed_at.isnot(None)
+            ).count()
+            changes['weekly_sessions'] = (recent_sessions - context['sessions_completed'], recent_sessions)
+        
+        return AchievementEngine(self.user).evaluate(changes)
     
     def get_user_achievements(self):
         """Retorna todas as conquistas do usuário"""
-        user_achievements = db.session.query(UserAchievement, Achievement).join(
-            Achievement
-        ).filter(UserAchievement.user_id == self.user_id).all()
+        user_achievements = UserAchievement.query.filter_by(user_id=self.user_id).all()
         
         achievements = []
-        for user_ach, achievement in user_achievements:
+        for user_ach in user_achievements:
+            achievement = achievement_catalog.get(user_ach.achievement_id)
+            if not achievement:
+                continue
             achievements.append({
                 'achievement': achievement.to_dict(),
                 'unlocked_at': user_ach.unlocked_at.isoformat()
@@ -332,25 +174,21 @@ class GamificationService:
     
     def get_available_achievements(self):
         """Retorna conquistas ainda não desbloqueadas"""
-        unlocked_ids = db.session.query(UserAchievement.achievement_id).filter_by(
-            user_id=self.user_id
-        ).subquery()
-        
-        available = Achievement.query.filter(
-            ~Achievement.id.in_(unlocked_ids)
-        ).all()
+        unlocked_ids = {
+            row[0] for row in db.session.query(UserAchievement.achievement_id).filter_by(
+                user_id=self.user_id
+            ).all()
+        }
         
-        return [ach.to_dict() for ach in available]
+        return [ach.to_dict() for ach in achievement_catalog.all() if ach.id not in unlocked_ids]
     
     def get_daily_goal_progress(self):
         """Retorna progresso da meta diária"""
         today = datetime.utcnow().date()
         
-        # Questões respondidas hoje
-        today_answers = UserAnswer.query.filter(
-            UserAnswer.user_id == self.user_id,
-            db.func.date(UserAnswer.answered_at) == today
-        ).count()
+        # Questões respondidas hoje (rollup diário)
+        today_activity = get_daily_activity(self.user_id, today, today).get(today)
+        today_answers = today_activity.questions_answered if today_activity else 0
         
         daily_goal = self.user.daily_goal or 10
         progress_percentage = min((today_answers / daily_goal) * 100, 100)
@@ -366,24 +204,19 @@ class GamificationService:
         """Retorna resumo semanal de atividades"""
         week_ago = datetime.utcnow() - timedelta(days=7)
         
-        # Questões da semana
-        weekly_answers = UserAnswer.query.filter(
-            UserAnswer.user_id == self.user_id,
-            UserAnswer.answered_at >= week_ago
-        ).count()
+        # Questões e XP da semana (rollup diário)
+        weekly_activity = sum_daily_activity(self.user_id, week_ago.date())
+        weekly_answers = weekly_activity['questions_answered']
         
         # Sessões da semana
         weekly_sessions = StudySession.query.filter(
             StudySession.user_id == self.user_id,
-            StudySession.created_at >= week_ago,
+            StudySession.started_at >= week_ago,
             StudySession.completed_at.isnot(None)
         ).count()
         
         # XP ganho na semana
-        weekly_xp = db.session.query(db.func.sum(StudySession.xp_earned)).filter(
-            StudySession.user_id == self.user_id,
-            StudySession.created_at >= week_ago
-        ).scalar() or 0
+        weekly_xp = weekly_activity['xp_earned']
         
         return {
             'questions_answered': weekly_answers,
@@ -0,0 +1,70 @@
+import threading
+import time
+from sqlalchemy import desc
+from sqlalchemy.orm import joinedload
+from src.models.user import db
+from src.models.achievement import Leaderboard, get_week_start
+
+class LeaderboardService:
+    """Leitura do ranking semanal materializado (sem escritas), com cache curto das posições"""
+    
+    rank_ttl = 60  # segundos
+    max_cached_ranks = 10000
+    
+    _rank_cache = {}  # (week_start, user_id, weekly_xp) -> (rank, expira_em)
+    _lock = threading.Lock()
+    
+    def __init__(self, week_start=None):
+        self.week_start = week_start or get_week_start()
+    
+    def get_top(self, limit=10):
+        """
+        Retorna o top N da semana com a posição calculada na própria leitura. Empatados
+        dividem a posição (1, 2, 2, 4), a mesma regra de get_user_rank.
+        """
+        entries = Leaderboard.query.options(joinedload(Leaderboard.user)).filter(
+            Leaderboard.week_start == self.week_start
+        ).order_by(desc(Leaderboard.weekly_xp), Leaderboard.id).limit(limit).all()
+        
+        top = []
+        rank = 0
+        for position, entry in enumerate(entries, 1):
+            if not top or entry.weekly_xp != top[-1]['weekly_xp']:
+                rank = position
+            data = entry.to_dict()
+            data['rank'] = rank
+            top.append(data)
+        
+        return top
+    
+    def get_user_entry(self, user_id):
+        """Linha do usuário na semana (None se ainda não pontuou)"""
+        return Leaderboard.query.filter_by(
+            user_id=user_id,
+            week_start=self.week_start
+        ).first()
+    
+    def get_user_rank(self, user_id, weekly_xp):
+        """
+        Posição do usuário (1 + usuários com mais XP na semana; empatados dividem a posição),
+        calculada sob demanda e guardada por alguns segundos
+        """
+        key = (self.week_start, user_id, weekly_xp)
+        now = time.monotonic()
+        
+        cached = self._rank_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        
+        higher_ranked = db.session.query(db.func.count(Leaderboard.id)).filter(
+            Leaderboard.week_start == self.week_start,
+            Leaderboard.weekly_xp > weekly_xp
+        ).scalar()
+        rank = higher_ranked + 1
+        
+        with self._lock:
+            if len(self._rank_cache) >= self.max_cached_ranks:
+                self._rank_cache.clear()
+            self._rank_cache[key] = (rank, now + self.rank_ttl)
+        
+        return rank
@@ -7,9 +7,10 @@ from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
 from src.models.question import Question, UserAnswer, StudySession
-from src.models.flashcard import Flashcard, FlashcardReview, UserFlashcardProgress
+from src.models.flashcard import Flashcard, FlashcardContent, FlashcardReview, UserFlashcardProgress, SchedulerParameters
 from src.models.achievement import Achievement, UserAchievement, UserProgress, Leaderboard
 from src.models.priority import TopicFrequency, UserTopicPriority, QuestionSelectionLog
+from src.models.user_stats import UserStats, DailyActivity, DailyRetention
 
 # Importar rotas
 from src.routes.user import user_bp
@@ -18,9 +19,20 @@ from src.routes.questions import questions_bp
 from src.routes.flashcards import flashcards_bp
 from src.routes.progress import progress_bp
 from src.routes.gamification import gamification_bp
+from src.services.principal_cache import principal_cache
+from src.services.flashcard_stats_cache import flashcard_stats_cache
+from src.services.answer_ingestion import answer_ingestion_queue
+from src.services.answer_key import answer_key_store
+from src.services.achievement_catalog import sync_achievement_definitions
+from src.services.achievement_engine import all_rules
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'medstudy-secret-key-2024'
+app.config['SCHEDULER_ENGINE'] = os.environ.get('SCHEDULER_ENGINE', 'sm2')  # sm2 ou fsrs
+app.config['REVIEW_LOAD_BALANCING'] = os.environ.get('REVIEW_LOAD_BALANCING', '1') == '1'
+app.config['REVIEW_DAILY_CAP'] = int(os.environ.get('REVIEW_DAILY_CAP', 200))
+app.config['ANSWER_INGESTION_MODE'] = os.environ.get('ANSWER_INGESTION_MODE', 'sync')  # sync ou write_behind
+app.config['QUESTION_SELECTION_MODE'] = os.environ.get('QUESTION_SELECTION_MODE', 'pool')  # pool ou window
 
 # Habilitar CORS para todas as rotas
 CORS(app, origins="*")
@@ -38,9 +50,12 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirnam
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
-# Criar todas as tabelas
+# Criar todas as tabelas, garantir o catálogo de conquistas e carregar o gabarito
 with app.app_context():
     db.create_all()
+    sync_achievement_definitions(all_rules())
+    db.session.commit()
+    answer_key_store.warm()
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -60,7 +75,13 @@ def serve(path):
 
 @app.route('/api/health')
 def health_check():
-    return {'status': 'ok', 'message': 'MedStudy API is running'}
+    return {
+        'status': 'ok',
+        'message': 'MedStudy API is running',
+        'auth_cache': principal_cache.get_stats(),
+        'flashcard_stats_cache': flashcard_stats_cache.get_stats(),
+        'answer_ingestion': answer_ingestion_queue.get_stats()
+    }
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
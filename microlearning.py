@@ -1,11 +1,29 @@
 from datetime import datetime, timedelta
+from flask import current_app
 from src.models.user import db, User
 from src.models.study_session import StudySession
-from src.models.question import UserAnswer
+from src.models.question import UserAnswer, record_question_stats
 from src.services.question_selector import IntelligentQuestionSelector
-from src.services.gamification import GamificationService
+from src.services.gamification import GamificationService, xp_for_answer
+from src.models.user_stats import record_answer_stats, record_session_completed_stats, record_xp_earned
+from src.services.answer_ingestion import answer_ingestion_queue, ingestion_mode, apply_answer_batch
+from src.services.answer_key import answer_key_store, get_explanations
+import hashlib
+import json
 import random
 
+# Mensagem devolvida quando o lote de respostas falha por erro interno (o detalhe vai para o log)
+BATCH_SUBMIT_ERROR = "Não foi possível registrar as respostas da sessão"
+
+# Campos das questões enviados no pacote da sessão (sem gabarito nem explicação)
+BUNDLE_QUESTION_FIELDS = ('id', 'content', 'options', 'specialty', 'difficulty', 'exam_source', 'exam_year')
+
+def _bundle_question(question):
+    """Questão no formato do pacote da sessão"""
+    item = {field: getattr(question, field) for field in BUNDLE_QUESTION_FIELDS}
+    item['options'] = json.loads(item['options'])
+    return item
+
 class MicroLearningService:
     """Serviço de micro-learning para sessões curtas e eficazes"""
     
@@ -23,7 +41,8 @@ class MicroLearningService:
             questions = selector.select_questions(
                 limit=self.session_length,
                 specialty=specialty,
-                difficulty=difficulty
+                difficulty=difficulty,
+                log_selections=False  # Registrado uma única vez após criar a sessão
             )
             
             if not questions:
@@ -48,6 +67,14 @@ class MicroLearningService:
         except Exception as e:
             return None, str(e)
     
+    def create_session_bundle(self, specialty=None, difficulty=None, session_type='daily'):
+        """Cria uma micro-sessão e já retorna o pacote com as questões (uma única requisição)"""
+        session, error = self.create_micro_session(specialty, difficulty, session_type)
+        if error:
+            return None, error
+        # As questões expiraram no commit; o pacote as relê numa consulta só com os campos enviados
+        return self.get_session_bundle(session.id)
+    
     def get_session_questions(self, session_id):
         """Retorna as questões de uma sessão"""
         session = StudySession.query.get(session_id)
@@ -74,8 +101,56 @@ class MicroLearningService:
         
         return ordered_questions, None
     
-    def submit_session_answer(self, session_id, question_id, selected_option, response_time=None):
-        """Submete resposta de uma questão na sessão"""
+    def get_session_bundle(self, session_id):
+        """
+        Pacote da sessão para o cliente: dados da sessão e todas as questões (enunciado, opções,
+        especialidade, dificuldade) numa única resposta compacta. Gabarito e explicações não vão
+        no pacote; chegam com a correção das respostas. `version` é o hash do conteúdo (ETag).
+        """
+        session = StudySession.query.get(session_id)
+        
+        if not session or session.user_id != self.user_id:
+            return None, "Sessão não encontrada"
+        
+        if not session.questions_data:
+            return None, "Sessão sem questões"
+        
+        from src.models.question import Question
+        questions = db.session.query(
+            *[getattr(Question, field) for field in BUNDLE_QUESTION_FIELDS]
+        ).filter(Question.id.in_(session.questions_data)).all()
+        by_id = {question.id: question for question in questions}
+        
+        bundle = {
+            'session': {
+                'id': session.id,
+                'session_type': session.session_type,
+                'total_questions': session.total_questions,
+                'target_time': session.target_time,
+                'started_at': session.started_at.isoformat()
+            },
+            'questions': [
+                _bundle_question(by_id[question_id])
+                for question_id in session.questions_data if question_id in by_id
+            ]
+        }
+        payload = json.dumps(bundle, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        bundle['version'] = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+        
+        return bundle, None
+    
+    def submit_session_answer(self, session_id, question_id, selected_option, response_time=None,
+                              include_explanation=True):
+        """
+        Submete resposta de uma questão na sessão. A correção usa o gabarito em memória; a
+        explicação só é lida quando include_explanation. No modo write_behind os efeitos
+        colaterais são aplicados em lote pelo worker de ingestão.
+        """
+        if ingestion_mode() == 'write_behind':
+            return answer_ingestion_queue.submit(
+                self.user_id, session_id, question_id, selected_option, response_time, include_explanation
+            )
+        
         try:
             session = StudySession.query.get(session_id)
             
@@ -86,36 +161,46 @@ class MicroLearningService:
             if question_id not in session.questions_data:
                 return None, "Questão não pertence a esta sessão"
             
-            # Buscar questão
-            from src.models.question import Question
-            question = Question.query.get(question_id)
+            # Gabarito da questão (sem carregar a questão)
+            graded = answer_key_store.grade(question_id, selected_option)
             
-            if not question:
+            if graded is None:
                 return None, "Questão não encontrada"
+            is_correct, (correct_option, specialty, difficulty) = graded
             
-            # Verificar se já foi respondida nesta sessão
+            # Resposta anterior do usuário a esta questão (uma por usuário e questão)
             existing_answer = UserAnswer.query.filter_by(
                 user_id=self.user_id,
-                question_id=question_id,
-                session_id=session_id
+                question_id=question_id
             ).first()
             
-            if existing_answer:
+            if existing_answer and existing_answer.session_id == session_id:
                 return None, "Questão já foi respondida nesta sessão"
             
-            # Verificar resposta
-            is_correct = selected_option == question.correct_option
-            
-            # Criar resposta
-            answer = UserAnswer(
-                user_id=self.user_id,
-                question_id=question_id,
-                selected_option=selected_option,
-                is_correct=is_correct,
-                response_time=response_time,
-                session_id=session_id
-            )
-            db.session.add(answer)
+            if existing_answer:
+                # Respondida em outra sessão (revisão): substituir a resposta anterior
+                record_answer_stats(
+                    self.user_id, is_correct, response_time,
+                    previous_answer=(existing_answer.is_correct, existing_answer.time_spent, existing_answer.answered_at)
+                )
+                existing_answer.selected_answer = selected_option
+                existing_answer.is_correct = is_correct
+                existing_answer.time_spent = response_time
+                existing_answer.session_id = session_id
+                existing_answer.answered_at = datetime.utcnow()
+            else:
+                # Criar resposta
+                answer = UserAnswer(
+                    user_id=self.user_id,
+                    question_id=question_id,
+                    selected_answer=selected_option,
+                    is_correct=is_correct,
+                    time_spent=response_time,
+                    session_id=session_id
+                )
+                db.session.add(answer)
+                record_answer_stats(self.user_id, is_correct, response_time)
+            record_question_stats(question_id, 1, int(is_correct))
             
             # Atualizar estatísticas da sessão
             session.questions_answered += 1
@@ -123,17 +208,15 @@ class MicroLearningService:
                 session.correct_answers += 1
             
             # Calcular XP
-            gamification = GamificationService(self.user_id)
-            xp_earned = gamification.calculate_xp_for_answer(
-                is_correct, question.difficulty, response_time
-            )
+            xp_earned = xp_for_answer(is_correct, difficulty, response_time)
             
             session.xp_earned += xp_earned
             self.user.xp += xp_earned
+            record_xp_earned(self.user_id, xp_earned)
             
             # Atualizar sistema de priorização
             selector = IntelligentQuestionSelector(self.user_id)
-            selector.update_user_performance(question_id, is_correct, response_time)
+            selector.update_user_performance(question_id, is_correct, response_time, specialty=specialty)
             
             # Verificar se a sessão foi completada
             session_completed = session.questions_answered >= session.total_questions
@@ -145,8 +228,8 @@ class MicroLearningService:
             
             return {
                 'is_correct': is_correct,
-                'correct_option': question.correct_option,
-                'explanation': question.explanation,
+                'correct_option': correct_option,
+                'explanation': get_explanations([question_id]).get(question_id) if include_explanation else None,
                 'xp_earned': xp_earned,
                 'session_progress': {
                     'answered': session.questions_answered,
@@ -161,6 +244,113 @@ class MicroLearningService:
             db.session.rollback()
             return None, str(e)
     
+    def submit_session_answers(self, session_id, answers, include_explanation=True):
+        """
+        Submete de uma vez as respostas de uma sessão. answers: lista de dicts com question_id,
+        selected_option e response_time. Corrige tudo pelo gabarito em memória e aplica
+        respostas, XP, prioridades e, se a sessão terminar, bônus, streak e conquistas numa
+        única transação. Retorna o feedback de cada questão e o resumo da sessão.
+        """
+        try:
+            session = StudySession.query.get(session_id)
+            
+            if not session or session.user_id != self.user_id:
+                return None, "Sessão não encontrada"
+            
+            if session.completed_at:
+                return None, "Sessão já foi completada"
+            
+            if not answers:
+                return None, "Nenhuma resposta enviada"
+            
+            # Respostas já gravadas (e, no modo write_behind, ainda na fila)
+            answered = answer_ingestion_queue.discard_session(session_id)
+            answered.update(
+                row[0] for row in db.session.query(UserAnswer.question_id).filter(
+                    UserAnswer.user_id == self.user_id,
+                    UserAnswer.session_id == session_id
+                ).all()
+            )
+            
+            question_ids = [answer.get('question_id') for answer in answers]
+            session_questions = set(session.questions_data or [])
+            for question_id in question_ids:
+                if question_id not in session_questions:
+                    return None, f"Questão {question_id} não pertence a esta sessão"
+                if question_id in answered:
+                    return None, f"Questão {question_id} já foi respondida nesta sessão"
+                answered.add(question_id)
+            
+            # Corrigir todas as respostas pelo gabarito em memória
+            keys = answer_key_store.lookup_many(question_ids)
+            answered_at = datetime.utcnow()
+            items = []
+            results = []
+            for answer in answers:
+                question_id = answer['question_id']
+                if question_id not in keys:
+                    return None, f"Questão {question_id} não encontrada"
+                
+                correct_option, specialty, difficulty = keys[question_id]
+                is_correct = answer.get('selected_option') == correct_option
+                response_time = answer.get('response_time')
+                xp_earned = xp_for_answer(is_correct, difficulty, response_time)
+                
+                items.append({
+                    'user_id': self.user_id,
+                    'session_id': session_id,
+                    'question_id': question_id,
+                    'selected_option': answer.get('selected_option'),
+                    'is_correct': is_correct,
+                    'response_time': response_time,
+                    'xp': xp_earned,
+                    'specialty': specialty,
+                    'answered_at': answered_at
+                })
+                results.append({
+                    'question_id': question_id,
+                    'is_correct': is_correct,
+                    'correct_option': correct_option,
+                    'xp_earned': xp_earned
+                })
+            
+            # Efeitos colaterais do lote; a conclusão da sessão faz o commit da mesma transação
+            completed = apply_answer_batch(items, commit=False)
+            completion = None
+            
+            if completed:
+                completion, error = self.complete_session(session_id)
+                if error:
+                    current_app.logger.error('Falha ao completar a sessão %s: %s', session_id, error)
+                    return None, BATCH_SUBMIT_ERROR
+            else:
+                db.session.commit()
+            
+            if include_explanation:
+                explanations = get_explanations(question_ids)
+                for result in results:
+                    result['explanation'] = explanations.get(result['question_id'])
+            
+            response = {
+                'results': results,
+                'session_progress': {
+                    'answered': session.questions_answered,
+                    'total': session.total_questions,
+                    'correct': session.correct_answers,
+                    'accuracy': (session.correct_answers / session.questions_answered * 100) if session.questions_answered > 0 else 0
+                },
+                'session_completed': completion is not None
+            }
+            if completion:
+                response.update(completion)
+            
+            return response, None
+            
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Falha ao registrar as respostas da sessão %s', session_id)
+            return None, BATCH_SUBMIT_ERROR
+    
     def complete_session(self, session_id):
         """Completa uma micro-sessão"""
         try:
@@ -174,6 +364,7 @@ class MicroLearningService:
             
             # Marcar como completada
             session.completed_at = datetime.utcnow()
+            record_session_completed_stats(self.user_id)
             
             # Calcular bonus de conclusão
             gamification = GamificationService(self.user_id)
@@ -181,13 +372,25 @@ class MicroLearningService:
             
             session.xp_earned += completion_bonus
             self.user.xp += completion_bonus
+            record_xp_earned(self.user_id, completion_bonus)
             
             # Atualizar nível e streak
             level_up, levels_gained = gamification.update_user_level()
             new_streak = gamification.update_streak()
             
-            # Verificar conquistas
-            achievements = gamification.check_achievements()
+            # Verificar conquistas (apenas regras afetadas por esta sessão)
+            from src.models.question import Question
+            specialties = [
+                row[0] for row in db.session.query(Question.specialty).filter(
+                    Question.id.in_(session.questions_data or [])
+                ).distinct().all()
+            ]
+            achievements = gamification.check_achievements({
+                'questions_answered': session.questions_answered,
+                'correct_answers': session.correct_answers,
+                'sessions_completed': 1,
+                'specialties': specialties
+            })
             
             db.session.commit()
             
@@ -198,7 +401,7 @@ class MicroLearningService:
                     'accuracy_rate': (session.correct_answers / session.questions_answered * 100) if session.questions_answered > 0 else 0,
                     'total_xp_earned': session.xp_earned,
                     'completion_bonus': completion_bonus,
-                    'session_duration': (session.completed_at - session.created_at).total_seconds()
+                    'session_duration': (session.completed_at - session.started_at).total_seconds()
                 },
                 'user_progress': {
                     'level_up': level_up,
@@ -263,20 +466,20 @@ class MicroLearningService:
         # Verificar última atividade
         last_session = StudySession.query.filter_by(
             user_id=self.user_id
-        ).order_by(StudySession.created_at.desc()).first()
+        ).order_by(StudySession.started_at.desc()).first()
         
         if not last_session:
             return 'introduction', "Primeira sessão - Vamos começar com questões variadas"
         
         # Verificar se estudou hoje
         today = datetime.utcnow().date()
-        if last_session.created_at.date() < today:
+        if last_session.started_at.date() < today:
             return 'daily', "Sessão diária - Mantenha sua sequência de estudos"
         
         # Verificar desempenho recente
         recent_sessions = StudySession.query.filter(
             StudySession.user_id == self.user_id,
-            StudySession.created_at >= datetime.utcnow() - timedelta(days=7),
+            StudySession.started_at >= datetime.utcnow() - timedelta(days=7),
             StudySession.completed_at.isnot(None)
         ).all()
         
@@ -307,7 +510,7 @@ class MicroLearningService:
         # Agrupar por hora do dia
         hour_performance = {}
         for session in sessions_with_good_performance:
-            hour = session.created_at.hour
+            hour = session.started_at.hour
             accuracy = (session.correct_answers / session.questions_answered * 100) if session.questions_answered > 0 else 0
             
             if hour not in hour_performance:
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import select
+from src.models.user import db
+from src.models.achievement import Achievement, UserAchievement
+from src.main import app
+
+def merge_duplicate_achievements(connection):
+    """
+    Une as conquistas com o mesmo nome (criadas por sincronizações concorrentes) na de menor id:
+    os desbloqueios passam para ela e as cópias são removidas.
+    """
+    achievements = Achievement.__table__
+    user_achievements = UserAchievement.__table__
+
+    rows = connection.execute(
+        select(achievements.c.id, achievements.c.name).order_by(achievements.c.id)
+    ).all()
+    kept = {}
+    duplicates = {}
+    for achievement_id, name in rows:
+        if name in kept:
+            duplicates[achievement_id] = kept[name]
+        else:
+            kept[name] = achievement_id
+
+    for duplicate_id, kept_id in duplicates.items():
+        owners = select(user_achievements.c.user_id).where(user_achievements.c.achievement_id == kept_id)
+        # Quem já tem a conquista mantida perde apenas a cópia; os demais são repontados
+        connection.execute(user_achievements.delete().where(
+            user_achievements.c.achievement_id == duplicate_id,
+            user_achievements.c.user_id.in_(owners)
+        ))
+        connection.execute(user_achievements.update().where(
+            user_achievements.c.achievement_id == duplicate_id
+        ).values(achievement_id=kept_id))
+        connection.execute(achievements.delete().where(achievements.c.id == duplicate_id))
+
+    return len(duplicates)
+
+def migrate_achievements():
+    """Remove as conquistas duplicadas e cria o índice único em achievement.name"""
+    with db.engine.begin() as connection:
+        merged = merge_duplicate_achievements(connection)
+
+        for index in Achievement.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+    return merged
+
+if __name__ == '__main__':
+    with app.app_context():
+        merged = migrate_achievements()
+        print(f"🏆 Conquistas duplicadas unidas: {merged}")
+        print("📇 Índice único de nome das conquistas criado")
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+from src.models.user import db, User
+from src.models.question import Question
+from src.models.flashcard import Flashcard, FlashcardContent, FlashcardReview
+from src.services.flashcard_content import get_content_ids
+from src.services.spaced_repetition import SpacedRepetitionService
+from src.main import app
+
+# Colunas de agendamento adicionadas ao flashcard (bancos criados antes delas)
+SCHEDULE_COLUMNS = (
+    'user_id', 'ease_factor', 'interval_days', 'review_count',
+    'next_review_date', 'last_reviewed', 'is_active', 'is_custom',
+    'stability', 'memory_difficulty', 'content_id'
+)
+
+# Texto próprio do card: opcional desde que os cards gerados passaram a usar o conteúdo compartilhado
+NULLABLE_TEXT_COLUMNS = ('front_content', 'back_content')
+
+# Colunas do histórico de revisões (quality_rating, intervalos anteriores, data e duração da revisão)
+REVIEW_LOG_COLUMNS = ('quality_rating', 'previous_interval', 'previous_ease_factor', 'reviewed_at', 'time_spent')
+
+# Engine de agendamento escolhido pelo usuário e versão dos tokens (revogação)
+USER_COLUMNS = ('scheduler_engine', 'token_version')
+
+FLASHCARD_INDEXES = ('ix_flashcard_user_active_due', 'ix_flashcard_active_due')
+
+def _add_missing_columns(connection, table, names):
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+
+    added = []
+    for name in names:
+        if name in existing:
+            continue
+        column = table.columns[name]
+        definition = column.type.compile(dialect=connection.dialect)
+        # Colunas com default no servidor podem entrar já como NOT NULL (as linhas existentes recebem o default)
+        if column.server_default is not None:
+            definition += f' DEFAULT {column.server_default.arg}'
+            if not column.nullable:
+                definition += ' NOT NULL'
+        connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} {definition}'))
+        added.append(f'{table.name}.{name}')
+    return added
+
+def _rebuild_sqlite_table(connection, table):
+    """SQLite não altera restrições de colunas: recria a tabela com o schema atual e copia os dados"""
+    existing = [column['name'] for column in inspect(connection).get_columns(table.name)]
+    columns = ', '.join(name for name in existing if name in table.columns)
+    # Mesmo metadata para resolver as chaves estrangeiras; a cópia sai dele logo após o CREATE
+    rebuilt = table.to_metadata(table.metadata, name=f'{table.name}_rebuild')
+    try:
+        connection.execute(CreateTable(rebuilt))
+    finally:
+        table.metadata.remove(rebuilt)
+
+    connection.execute(text(f'INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {table.name}'))
+    connection.execute(text(f'DROP TABLE {table.name}'))
+    connection.execute(text(f'ALTER TABLE {rebuilt.name} RENAME TO {table.name}'))
+
+def _relax_not_null(connection, table, names):
+    columns = {column['name']: column for column in inspect(connection).get_columns(table.name)}
+    strict = [name for name in names if name in columns and not columns[name]['nullable']]
+    if not strict:
+        return []
+
+    if connection.dialect.name == 'sqlite':
+        _rebuild_sqlite_table(connection, table)
+    else:
+        for name in strict:
+            connection.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {name} DROP NOT NULL'))
+    return [f'{table.name}.{name}' for name in strict]
+
+def link_shared_content():
+    """
+    Aponta para o conteúdo compartilhado os cards gerados antes dele cujo texto é igual ao
+    derivado da versão atual da questão, liberando a cópia do texto. Cards editados ficam como estão.
+    """
+    cards = Flashcard.query.filter(
+        Flashcard.question_id.isnot(None),
+        Flashcard.content_id.is_(None),
+        Flashcard.is_custom == False
+    ).all()
+    if not cards:
+        return 0
+
+    questions = Question.query.filter(Question.id.in_({card.question_id for card in cards})).all()
+    content_ids = get_content_ids(questions)
+    contents = {
+        content.id: content
+        for content in FlashcardContent.query.filter(FlashcardContent.id.in_(content_ids.values()))
+    }
+
+    linked = 0
+    for card in cards:
+        content = contents.get(content_ids.get(card.question_id))
+        if content is None:
+            continue
+        if (card.front_content, card.back_content) == (content.front_content, content.back_content):
+            card.content_id = content.id
+            card.front_content = None
+            card.back_content = None
+            linked += 1
+
+    db.session.commit()
+    return linked
+
+def migrate_flashcard_schedule():
+    """Adiciona as colunas de agendamento que faltarem e cria os índices de flashcards pendentes"""
+    table = Flashcard.__table__
+    review_table = FlashcardReview.__table__
+
+    with db.engine.begin() as connection:
+        FlashcardContent.__table__.create(connection, checkfirst=True)
+
+        added = _add_missing_columns(connection, table, SCHEDULE_COLUMNS)
+        added += _add_missing_columns(connection, review_table, REVIEW_LOG_COLUMNS)
+        added += _add_missing_columns(connection, User.__table__, USER_COLUMNS)
+
+        # Valores padrão para as linhas existentes
+        if 'flashcard.is_active' in added:
+            connection.execute(table.update().values(is_active=True))
+        if 'flashcard.next_review_date' in added:
+            connection.execute(table.update().values(next_review_date=datetime.utcnow()))
+        if 'flashcard_review.reviewed_at' in added:
+            connection.execute(review_table.update().values(reviewed_at=review_table.c.created_at))
+        if 'user.token_version' in added:
+            user_table = User.__table__
+            connection.execute(user_table.update().where(user_table.c.token_version.is_(None)).values(token_version=0))
+
+        added += _relax_not_null(connection, table, NULLABLE_TEXT_COLUMNS)
+
+        for index in list(table.indexes) + list(review_table.indexes):
+            index.create(connection, checkfirst=True)
+
+    return added
+
+def _due_queries(user_id=1):
+    """Consultas do serviço de repetição espaçada que devem usar os índices (as mesmas que ele executa)"""
+    service = SpacedRepetitionService(user_id)
+    now = datetime.utcnow()
+
+    return {
+        'due': service.due_flashcards_query(now),
+        'stats': service.flashcard_stats_query(now),
+        'stats_key': service.flashcard_stats_key_query(),
+        'due_day_counts': service.due_day_counts_query(now + timedelta(days=30))
+    }
+
+def _explain(connection, query):
+    dialect = connection.dialect.name
+    sql = str(query.statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect == 'sqlite':
+        return [row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+    if dialect == 'postgresql':
+        # Em tabelas pequenas o planner prefere seq scan; desabilitá-lo mostra se o índice é elegível
+        connection.execute(text('SET LOCAL enable_seqscan = off'))
+        return [row[0] for row in connection.execute(text(f'EXPLAIN {sql}'))]
+
+    return None
+
+def _uses_flashcard_index(plan):
+    plan_text = '\n'.join(plan)
+    if not any(name in plan_text for name in FLASHCARD_INDEXES):
+        return False
+    # SQLite: "SCAN flashcard" sem índice indica varredura completa da tabela
+    return not any(line.startswith('SCAN flashcard') and 'INDEX' not in line for line in plan)
+
+def check_query_plans():
+    """Verifica pelo plano de execução que nenhuma consulta de pendentes faz varredura completa"""
+    failures = []
+
+    with db.engine.connect() as connection:
+        for name, query in _due_queries().items():
+            plan = _explain(connection, query)
+            if plan is None:
+                print(f"⚠️  Dialeto {connection.dialect.name} sem verificação de plano")
+                return True
+
+            ok = _uses_flashcard_index(plan)
+            print(f"{'✅' if ok else '❌'} {name}: {' | '.join(plan)}")
+            if not ok:
+                failures.append(name)
+
+    return not failures
+
+if __name__ == '__main__':
+    with app.app_context():
+        if '--check' not in sys.argv:
+            added = migrate_flashcard_schedule()
+            print(f"🗂️  Colunas adicionadas: {', '.join(added) if added else 'nenhuma'}")
+            print("📇 Índices de flashcards pendentes criados")
+            print(f"🔗 Cards ligados ao conteúdo compartilhado: {link_shared_content()}")
+
+        if not check_query_plans():
+            sys.exit(1)
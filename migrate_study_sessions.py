@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.models.user import db
+from src.models.question import UserAnswer, StudySession
+from src.main import app
+from migrate_flashcard_schedule import _add_missing_columns
+
+# Colunas usadas pelas sessões de micro-learning (bancos criados antes delas)
+SESSION_COLUMNS = ('total_questions', 'questions_data', 'target_time')
+ANSWER_COLUMNS = ('session_id',)
+
+def migrate_study_sessions():
+    """Adiciona as colunas de sessão que faltarem em study_session e user_answer"""
+    with db.engine.begin() as connection:
+        added = _add_missing_columns(connection, StudySession.__table__, SESSION_COLUMNS)
+        added += _add_missing_columns(connection, UserAnswer.__table__, ANSWER_COLUMNS)
+
+        if 'study_session.total_questions' in added:
+            connection.execute(StudySession.__table__.update().values(total_questions=0))
+
+    return added
+
+if __name__ == '__main__':
+    with app.app_context():
+        added = migrate_study_sessions()
+        print(f"🗂️  Colunas adicionadas: {', '.join(added) if added else 'nenhuma'}")
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.services.scheduler_optimizer import optimize_scheduler_parameters
+from src.main import app
+
+def optimize_schedulers(user_id=None):
+    """Ajusta os parâmetros de agendamento com as revisões registradas desde a última execução"""
+    
+    with app.app_context():
+        updated = optimize_scheduler_parameters(user_id)
+        print(f"🧠 Parâmetros de agendamento atualizados: {updated} conjuntos (usuário/especialidade)")
+
+if __name__ == '__main__':
+    optimize_schedulers(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from src.models.user import db, User
+from src.services.session_hooks import after_transaction_of
+
+# Campos do usuário mantidos no cache; o restante é carregado do banco sob demanda
+PRINCIPAL_FIELDS = (
+    'id', 'username', 'email', 'xp', 'level', 'streak', 'daily_goal',
+    'avatar_url', 'target_specialty', 'token_version'
+)
+
+class CachedPrincipal:
+    """
+    Usuário autenticado vindo do cache. Os campos mais usados são lidos do snapshot;
+    qualquer outro atributo (ou escrita) carrega o User real da sessão atual.
+    """
+
+    __slots__ = ('_fields', '_user')
+
+    def __init__(self, fields):
+        object.__setattr__(self, '_fields', fields)
+        object.__setattr__(self, '_user', None)
+
+    def _load(self):
+        user = object.__getattribute__(self, '_user')
+        if user is None:
+            user = User.query.get(object.__getattribute__(self, '_fields')['id'])
+            object.__setattr__(self, '_user', user)
+        return user
+
+    def __getattr__(self, name):
+        fields = object.__getattribute__(self, '_fields')
+        if object.__getattribute__(self, '_user') is None and name in fields:
+            return fields[name]
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        return f"<CachedPrincipal {object.__getattribute__(self, '_fields')['username']}>"
+
+class PrincipalCache:
+    """
+    Cache LRU com TTL dos usuários autenticados, indexado por user_id e versão do token.
+    A versão vigente do token é conferida no banco a cada acesso (consulta escalar pela chave
+    primária), então uma revogação feita em qualquer processo vale na requisição seguinte; os
+    demais campos do snapshot podem atrasar até o TTL em outros processos.
+    """
+
+    def __init__(self, max_size=5000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (token_version, campos, expira_em)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, token_version):
+        """Retorna o principal em cache se a versão do token ainda for a vigente"""
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if not entry or entry[0] != token_version or entry[2] <= now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+
+        current = db.session.query(User.token_version).filter(User.id == user_id).first()
+        if current is None or (current[0] or 0) != token_version:
+            # Usuário removido ou tokens revogados (possivelmente por outro processo)
+            self.invalidate(user_id)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return CachedPrincipal(entry[1])
+
+    def put(self, user):
+        """Guarda o snapshot dos campos do usuário"""
+        fields = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+
+        with self._lock:
+            self._entries[user.id] = (user.token_version or 0, fields, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 2) if total else 0
+        }
+
+principal_cache = PrincipalCache()
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_principal(mapper, connection, target):
+    # No fim da transação: invalidar no flush deixaria outra requisição recolocar o valor antigo
+    user_id = target.id
+    after_transaction_of(target, ('principal', user_id), lambda: principal_cache.invalidate(user_id))
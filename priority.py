@@ -258,7 +258,56 @@ def get_user_topic_priority(user_id, specialty):
             final_priority=base_priority
         )
         db.session.add(priority)
-        db.session.commit()
+        # flush: o registro entra na transação de quem chamou (que faz o commit)
+        db.session.flush()
     
     return priority
 
+def log_question_selections(user_id, selections, session_id=None):
+    """
+    Registra em lote as seleções de uma sessão.
+    selections: lista de (question_id, specialty, selection_method).
+    Carrega as prioridades do usuário com uma consulta e grava todos os logs com um único executemany.
+    """
+    if not selections:
+        return 0
+    
+    specialties = {specialty for _, specialty, _ in selections}
+    
+    priority_scores = dict(db.session.query(
+        UserTopicPriority.specialty,
+        UserTopicPriority.final_priority
+    ).filter(
+        UserTopicPriority.user_id == user_id,
+        UserTopicPriority.specialty.in_(specialties)
+    ).all())
+    
+    # Tópicos ainda sem prioridade usam a importância base (sem criar registros aqui)
+    missing = specialties - set(priority_scores)
+    if missing:
+        priority_scores.update(db.session.query(
+            TopicFrequency.specialty,
+            TopicFrequency.importance_score
+        ).filter(
+            TopicFrequency.specialty.in_(missing),
+            TopicFrequency.exam_source == 'ALL'
+        ).all())
+    
+    selected_at = datetime.utcnow()
+    rows = [
+        {
+            'user_id': user_id,
+            'session_id': session_id,
+            'specialty': specialty,
+            'selection_method': method,
+            'priority_score': priority_scores.get(specialty, 1.0),
+            'question_id': question_id,
+            'selected_at': selected_at
+        }
+        for question_id, specialty, method in selections
+    ]
+    
+    db.session.execute(QuestionSelectionLog.__table__.insert(), rows)
+    db.session.commit()
+    
+    return len(rows)
@@ -1,8 +1,13 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
-from src.models.achievement import UserProgress, Achievement, UserAchievement, Leaderboard
+from src.models.achievement import UserProgress, UserAchievement, Leaderboard
 from src.models.question import UserAnswer, StudySession
 from src.models.flashcard import FlashcardReview
+from src.models.user_stats import read_user_stats, get_daily_activity
+from src.services.leaderboard import LeaderboardService
+from src.services.achievement_catalog import achievement_catalog
+from src.services.achievement_engine import SPECIALTY_MASTERY_PREFIX, min_answers_for
+from src.models.priority import UserTopicPriority
 from src.routes.auth import token_required
 from datetime import datetime, timedelta, date
 from sqlalchemy import func, desc
@@ -14,16 +19,15 @@ progress_bp = Blueprint('progress', __name__)
 def get_dashboard_data(current_user):
     """Obter dados do dashboard principal"""
     try:
-        # Estatísticas gerais
-        total_questions = UserAnswer.query.filter_by(user_id=current_user.id).count()
-        correct_answers = UserAnswer.query.filter_by(user_id=current_user.id, is_correct=True).count()
+        # Estatísticas gerais (contadores pré-agregados)
+        stats = read_user_stats(current_user.id)
+        total_questions = stats.total_answered
+        correct_answers = stats.total_correct
         
-        # Atividade hoje
+        # Atividade hoje (rollup diário)
         today = date.today()
-        questions_today = UserAnswer.query.filter(
-            UserAnswer.user_id == current_user.id,
-            func.date(UserAnswer.answered_at) == today
-        ).count()
+        today_activity = get_daily_activity(current_user.id, today, today).get(today)
+        questions_today = today_activity.questions_answered if today_activity else 0
         
         # Flashcards devido hoje
         flashcards_due = FlashcardReview.query.filter(
@@ -41,11 +45,21 @@ def get_dashboard_data(current_user):
         # Progresso por especialidade
         specialty_progress = UserProgress.query.filter_by(user_id=current_user.id).all()
         
-        # Conquistas recentes
+        # Conquistas recentes (definições vindas do catálogo em memória)
         recent_achievements = UserAchievement.query.filter_by(
             user_id=current_user.id
         ).order_by(desc(UserAchievement.unlocked_at)).limit(3).all()
         
+        recent_achievements_data = []
+        for user_achievement in recent_achievements:
+            achievement = achievement_catalog.get(user_achievement.achievement_id)
+            recent_achievements_data.append({
+                'id': user_achievement.id,
+                'achievement_id': user_achievement.achievement_id,
+                'achievement': achievement.to_dict() if achievement else None,
+                'unlocked_at': user_achievement.unlocked_at.isoformat()
+            })
+        
         return jsonify({
             'user_stats': {
                 'xp': current_user.xp,
@@ -62,7 +76,7 @@ def get_dashboard_data(current_user):
             },
             'recent_sessions': [session.to_dict() for session in recent_sessions],
             'specialty_progress': [progress.to_dict() for progress in specialty_progress],
-            'recent_achievements': [achievement.to_dict() for achievement in recent_achievements]
+            'recent_achievements': recent_achievements_data
         }), 200
         
     except Exception as e:
@@ -79,25 +93,19 @@ def get_detailed_progress(current_user):
         # Data de início
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        # Progresso diário
-        daily_progress = db.session.query(
-            func.date(UserAnswer.answered_at).label('date'),
-            func.count(UserAnswer.id).label('questions'),
-            func.sum(func.case([(UserAnswer.is_correct == True, 1)], else_=0)).label('correct')
-        ).filter(
-            UserAnswer.user_id == current_user.id,
-            UserAnswer.answered_at >= start_date
-        ).group_by(func.date(UserAnswer.answered_at)).all()
+        # Progresso diário (leitura por intervalo do rollup diário)
+        daily_activity = get_daily_activity(current_user.id, start_date.date())
         
         # Converter para formato de resposta
         daily_data = []
-        for day in daily_progress:
-            accuracy = (day.correct / day.questions * 100) if day.questions > 0 else 0
+        for day in daily_activity.values():
+            if not day.questions_answered:
+                continue
             daily_data.append({
-                'date': day.date.isoformat(),
-                'questions_answered': day.questions,
-                'correct_answers': day.correct,
-                'accuracy_rate': round(accuracy, 2)
+                'date': day.day.isoformat(),
+                'questions_answered': day.questions_answered,
+                'correct_answers': day.correct_answers,
+                'accuracy_rate': round(day.get_accuracy_rate(), 2)
             })
         
         # Progresso por especialidade (se especificado)
@@ -112,19 +120,13 @@ def get_detailed_progress(current_user):
                 specialty_data = specialty_progress.to_dict()
         
         # Tempo de estudo por dia
-        study_time = db.session.query(
-            func.date(UserAnswer.answered_at).label('date'),
-            func.sum(UserAnswer.time_spent).label('total_time')
-        ).filter(
-            UserAnswer.user_id == current_user.id,
-            UserAnswer.answered_at >= start_date
-        ).group_by(func.date(UserAnswer.answered_at)).all()
-        
         time_data = []
-        for day in study_time:
+        for day in daily_activity.values():
+            if not day.questions_answered:
+                continue
             time_data.append({
-                'date': day.date.isoformat(),
-                'study_time_minutes': round((day.total_time or 0) / 60, 2)
+                'date': day.day.isoformat(),
+                'study_time_minutes': round((day.seconds_studied or 0) / 60, 2)
             })
         
         return jsonify({
@@ -143,29 +145,36 @@ def get_user_achievements(current_user):
     """Obter conquistas do usuário"""
     try:
         # Conquistas desbloqueadas
-        unlocked = db.session.query(UserAchievement, Achievement).join(
-            Achievement
-        ).filter(
+        unlocked = UserAchievement.query.filter(
             UserAchievement.user_id == current_user.id
         ).order_by(desc(UserAchievement.unlocked_at)).all()
         
-        # Todas as conquistas disponíveis
-        all_achievements = Achievement.query.all()
+        # Todas as conquistas disponíveis (catálogo em memória)
+        all_achievements = achievement_catalog.all()
         
-        unlocked_ids = {ua.achievement_id for ua, a in unlocked}
+        unlocked_ids = {ua.achievement_id for ua in unlocked}
         
         unlocked_data = []
-        for user_achievement, achievement in unlocked:
+        for user_achievement in unlocked:
+            achievement = achievement_catalog.get(user_achievement.achievement_id)
+            if not achievement:
+                continue
             data = achievement.to_dict()
             data['unlocked_at'] = user_achievement.unlocked_at.isoformat()
             unlocked_data.append(data)
         
+        locked = [achievement for achievement in all_achievements if achievement.id not in unlocked_ids]
+        
+        # Métricas do usuário calculadas uma única vez e avaliadas em memória
+        snapshot = build_progress_snapshot(
+            current_user, {achievement.criteria_type for achievement in locked}
+        )
+        
         available_data = []
-        for achievement in all_achievements:
-            if achievement.id not in unlocked_ids:
-                data = achievement.to_dict()
-                data['progress'] = calculate_achievement_progress(current_user, achievement)
-                available_data.append(data)
+        for achievement in locked:
+            data = achievement.to_dict()
+            data['progress'] = calculate_achievement_progress(current_user, achievement, snapshot)
+            available_data.append(data)
         
         return jsonify({
             'unlocked': unlocked_data,
@@ -177,26 +186,62 @@ def get_user_achievements(current_user):
     except Exception as e:
         return jsonify({'message': f'Failed to get achievements: {str(e)}'}), 500
 
-def calculate_achievement_progress(user, achievement):
+def build_progress_snapshot(user, criteria_types=None):
+    """
+    Calcula uma única vez as métricas de progresso do usuário usadas pelas conquistas.
+    criteria_types limita as consultas opcionais às métricas realmente necessárias.
+    """
+    stats = read_user_stats(user.id)
+    
+    snapshot = {
+        'questions_answered': stats.total_answered,
+        'accuracy': stats.get_accuracy_rate(),
+        'streak': user.streak or 0,
+        'xp': user.xp or 0,
+        'level': user.level or 1,
+        'specialty_mastery': {},
+        'weekly_sessions': 0
+    }
+    
+    if criteria_types is None or 'specialty_mastery' in criteria_types:
+        # especialidade -> (respondidas, acurácia)
+        snapshot['specialty_mastery'] = {
+            specialty: (answered or 0, accuracy or 0)
+            for specialty, answered, accuracy in db.session.query(
+                UserTopicPriority.specialty,
+                UserTopicPriority.questions_answered,
+                UserTopicPriority.accuracy_rate
+            ).filter(UserTopicPriority.user_id == user.id).all()
+        }
+    
+    if criteria_types is None or 'weekly_sessions' in criteria_types:
+        snapshot['weekly_sessions'] = StudySession.query.filter(
+            StudySession.user_id == user.id,
+            StudySession.completed_at >= datetime.utcnow() - timedelta(days=7)
+        ).count()
+    
+    return snapshot
+
+def calculate_achievement_progress(user, achievement, snapshot=None):
     """Calcular progresso para uma conquista específica"""
     try:
-        if achievement.criteria_type == 'questions_answered':
-            current_value = UserAnswer.query.filter_by(user_id=user.id).count()
-        elif achievement.criteria_type == 'streak':
-            current_value = user.streak
-        elif achievement.criteria_type == 'accuracy':
-            total = UserAnswer.query.filter_by(user_id=user.id).count()
-            correct = UserAnswer.query.filter_by(user_id=user.id, is_correct=True).count()
-            current_value = (correct / total * 100) if total > 0 else 0
-        elif achievement.criteria_type == 'xp':
-            current_value = user.xp
-        elif achievement.criteria_type == 'level':
-            current_value = user.level
+        if snapshot is None:
+            snapshot = build_progress_snapshot(user, {achievement.criteria_type})
+        
+        if achievement.criteria_type == 'specialty_mastery':
+            specialty = achievement.name[len(SPECIALTY_MASTERY_PREFIX):]
+            answered, current_value = snapshot['specialty_mastery'].get(specialty, (0, 0))
         else:
-            current_value = 0
+            answered = snapshot['questions_answered']
+            current_value = snapshot.get(achievement.criteria_type, 0)
         
         progress_percentage = min(100, (current_value / achievement.criteria_value * 100))
         
+        # Regras de acerto só desbloqueiam com o mínimo de respostas (como no motor de conquistas)
+        min_answers = min_answers_for(achievement.criteria_type, achievement.name)
+        if min_answers:
+            progress_percentage = min(progress_percentage, answered / min_answers * 100)
+        
         return {
             'current_value': current_value,
             'target_value': achievement.criteria_value,
@@ -210,84 +255,35 @@ def calculate_achievement_progress(user, achievement):
 def get_leaderboard(current_user):
     """Obter ranking semanal"""
     try:
-        # Calcular início da semana atual
-        today = date.today()
-        week_start = today - timedelta(days=today.weekday())
-        
-        # Buscar ou criar entrada do leaderboard para o usuário atual
-        user_entry = Leaderboard.query.filter_by(
-            user_id=current_user.id,
-            week_start=week_start
-        ).first()
-        
-        if not user_entry:
-            user_entry = Leaderboard(
-                user_id=current_user.id,
-                week_start=week_start
-            )
-            db.session.add(user_entry)
-        
-        # Atualizar estatísticas da semana atual
-        week_end = week_start + timedelta(days=7)
-        
-        # XP ganho esta semana (aproximação baseada em respostas)
-        weekly_answers = UserAnswer.query.filter(
-            UserAnswer.user_id == current_user.id,
-            func.date(UserAnswer.answered_at) >= week_start,
-            func.date(UserAnswer.answered_at) < week_end
-        ).all()
-        
-        weekly_xp = sum(10 if answer.is_correct else 0 for answer in weekly_answers)
-        user_entry.weekly_xp = weekly_xp
-        user_entry.questions_answered = len(weekly_answers)
-        
-        # Sessões de estudo esta semana
-        weekly_sessions = StudySession.query.filter(
-            StudySession.user_id == current_user.id,
-            func.date(StudySession.started_at) >= week_start,
-            func.date(StudySession.started_at) < week_end,
-            StudySession.completed_at.isnot(None)
-        ).count()
-        
-        user_entry.study_sessions = weekly_sessions
-        
-        db.session.commit()
+        # O ranking é mantido incrementalmente nas escritas; aqui apenas lemos
+        leaderboard = LeaderboardService()
         
         # Buscar top 10 do ranking
-        top_users = db.session.query(Leaderboard).filter_by(
-            week_start=week_start
-        ).order_by(desc(Leaderboard.weekly_xp)).limit(10).all()
+        leaderboard_data = leaderboard.get_top(10)
         
-        # Atualizar ranks
-        for i, entry in enumerate(top_users, 1):
-            entry.rank = i
+        # Posição do usuário atual (top 10 ou cálculo sob demanda com cache)
+        user_entry = leaderboard.get_user_entry(current_user.id)
+        weekly_xp = user_entry.weekly_xp if user_entry else 0
         
-        db.session.commit()
-        
-        # Buscar posição do usuário atual se não estiver no top 10
-        user_rank = user_entry.rank
+        user_rank = next(
+            (entry['rank'] for entry in leaderboard_data if entry['user']['id'] == current_user.id),
+            None
+        )
         if not user_rank:
-            higher_ranked = Leaderboard.query.filter(
-                Leaderboard.week_start == week_start,
-                Leaderboard.weekly_xp > user_entry.weekly_xp
-            ).count()
-            user_rank = higher_ranked + 1
-        
-        leaderboard_data = [entry.to_dict() for entry in top_users]
+            user_rank = leaderboard.get_user_rank(current_user.id, weekly_xp)
         
         return jsonify({
             'leaderboard': leaderboard_data,
             'user_position': {
                 'rank': user_rank,
-                'weekly_xp': user_entry.weekly_xp,
-                'questions_answered': user_entry.questions_answered,
-                'study_sessions': user_entry.study_sessions
+                'weekly_xp': weekly_xp,
+                'questions_answered': user_entry.questions_answered if user_entry else 0,
+                'study_sessions': user_entry.study_sessions if user_entry else 0
             },
-            'week_start': week_start.isoformat()
+            'week_start': leaderboard.week_start.isoformat()
         }), 200
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({'message': f'Failed to get leaderboard: {str(e)}'}), 500
 
 @progress_bp.route('/study-streak', methods=['GET'])
@@ -299,16 +295,10 @@ def get_study_streak(current_user):
         days = 30
         start_date = date.today() - timedelta(days=days-1)
         
-        daily_activity = db.session.query(
-            func.date(UserAnswer.answered_at).label('date'),
-            func.count(UserAnswer.id).label('questions')
-        ).filter(
-            UserAnswer.user_id == current_user.id,
-            func.date(UserAnswer.answered_at) >= start_date
-        ).group_by(func.date(UserAnswer.answered_at)).all()
+        daily_activity = get_daily_activity(current_user.id, start_date)
         
         # Criar mapa de atividade
-        activity_map = {day.date: day.questions for day in daily_activity}
+        activity_map = {day: activity.questions_answered for day, activity in daily_activity.items()}
         
         # Gerar dados para os últimos 30 dias
         streak_data = []
@@ -349,23 +339,19 @@ def get_study_streak(current_user):
 def get_progress_summary(current_user):
     """Obter resumo geral do progresso"""
     try:
-        # Estatísticas gerais
-        total_questions = UserAnswer.query.filter_by(user_id=current_user.id).count()
-        correct_answers = UserAnswer.query.filter_by(user_id=current_user.id, is_correct=True).count()
+        # Estatísticas gerais (contadores pré-agregados)
+        stats = read_user_stats(current_user.id)
+        total_questions = stats.total_answered
+        correct_answers = stats.total_correct
         
         # Tempo total de estudo
-        total_time = db.session.query(
-            func.sum(UserAnswer.time_spent)
-        ).filter_by(user_id=current_user.id).scalar() or 0
+        total_time = stats.total_time_spent
         
         # Sessões completadas
-        completed_sessions = StudySession.query.filter(
-            StudySession.user_id == current_user.id,
-            StudySession.completed_at.isnot(None)
-        ).count()
+        completed_sessions = stats.sessions_completed
         
         # Flashcards revisados
-        flashcards_reviewed = FlashcardReview.query.filter_by(user_id=current_user.id).count()
+        flashcards_reviewed = stats.flashcards_reviewed
         
         # Conquistas desbloqueadas
         achievements_unlocked = UserAchievement.query.filter_by(user_id=current_user.id).count()
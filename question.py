@@ -72,6 +72,7 @@ class UserAnswer(db.Model):
     selected_answer = db.Column(db.String(1), nullable=False)
     is_correct = db.Column(db.Boolean, nullable=False)
     time_spent = db.Column(db.Integer)  # tempo em segundos
+    session_id = db.Column(db.Integer, db.ForeignKey('study_session.id'))
     answered_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Índice único para evitar respostas duplicadas
@@ -84,6 +85,7 @@ class UserAnswer(db.Model):
             'selected_answer': self.selected_answer,
             'is_correct': self.is_correct,
             'time_spent': self.time_spent,
+            'session_id': self.session_id,
             'answered_at': self.answered_at.isoformat()
         }
 
@@ -94,6 +96,9 @@ class StudySession(db.Model):
     correct_answers = db.Column(db.Integer, default=0)
     xp_earned = db.Column(db.Integer, default=0)
     session_type = db.Column(db.String(50), default='practice')  # practice, exam, review
+    total_questions = db.Column(db.Integer, default=0)
+    questions_data = db.Column(db.JSON)  # ids das questões na ordem da sessão
+    target_time = db.Column(db.Integer)  # em segundos
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
     
@@ -112,7 +117,15 @@ class StudySession(db.Model):
             'accuracy_rate': self.get_accuracy_rate(),
             'xp_earned': self.xp_earned,
             'session_type': self.session_type,
+            'total_questions': self.total_questions,
             'started_at': self.started_at.isoformat(),
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
+
+def record_question_stats(question_id, answered, correct):
+    """Incrementa no banco as estatísticas da questão, sem carregá-la"""
+    db.session.query(Question).filter(Question.id == question_id).update({
+        Question.times_answered: db.func.coalesce(Question.times_answered, 0) + answered,
+        Question.times_correct: db.func.coalesce(Question.times_correct, 0) + correct
+    }, synchronize_session=False)
@@ -0,0 +1,196 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import event, inspect
+from src.models.user import db
+from src.models.question import Question, UserAnswer
+
+
+class QuestionPoolIndex:
+    """
+    Índice em memória das questões: especialidade -> dificuldade -> array de ids.
+    Mantém também um bitset por usuário com as questões já respondidas, para que
+    o seletor sorteie todas as questões da sessão sem consultar o banco.
+    """
+
+    def __init__(self, max_users=2048):
+        self._lock = threading.RLock()
+        self._pools = {}
+        self._max_id = 0
+        self._version = 0
+        self._dirty = True
+        self._max_users = max_users
+        self._answered = OrderedDict()  # user_id -> (versão, bitset)
+
+    def invalidate(self):
+        """Marca o índice para ser reconstruído na próxima leitura"""
+        with self._lock:
+            self._dirty = True
+
+    def _ensure_loaded(self):
+        if not self._dirty:
+            return
+
+        with self._lock:
+            if not self._dirty:
+                return
+
+            rows = db.session.query(
+                Question.id, Question.specialty, Question.difficulty
+            ).all()
+
+            buckets = {}
+            max_id = 0
+            for question_id, specialty, difficulty in rows:
+                buckets.setdefault(specialty, {}).setdefault(difficulty or 'medium', []).append(question_id)
+                max_id = max(max_id, question_id)
+
+            self._pools = {
+                specialty: {
+                    difficulty: np.array(ids, dtype=np.int64)
+                    for difficulty, ids in by_difficulty.items()
+                }
+                for specialty, by_difficulty in buckets.items()
+            }
+            self._max_id = max_id
+            self._version += 1
+            self._dirty = False
+
+    @property
+    def version(self):
+        self._ensure_loaded()
+        return self._version
+
+    def specialties(self):
+        """Retorna as especialidades presentes no índice"""
+        self._ensure_loaded()
+        return list(self._pools.keys())
+
+    def get_pool(self, specialty=None, difficulty=None):
+        """Retorna os ids das questões de uma especialidade (ou de todas) e dificuldade"""
+        self._ensure_loaded()
+
+        if specialty is None:
+            by_specialty = list(self._pools.values())
+        else:
+            by_specialty = [self._pools.get(specialty, {})]
+
+        arrays = []
+        for by_difficulty in by_specialty:
+            if difficulty:
+                if difficulty in by_difficulty:
+                    arrays.append(by_difficulty[difficulty])
+            else:
+                arrays.extend(by_difficulty.values())
+
+        if not arrays:
+            return np.empty(0, dtype=np.int64)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.concatenate(arrays)
+
+    def answered_mask(self, user_id):
+        """Bitset (array booleano indexado por id) das questões respondidas pelo usuário"""
+        self._ensure_loaded()
+
+        with self._lock:
+            cached = self._answered.get(user_id)
+            if cached and cached[0] == self._version:
+                self._answered.move_to_end(user_id)
+                return cached[1]
+
+        answered_ids = [
+            row[0] for row in db.session.query(UserAnswer.question_id).filter_by(
+                user_id=user_id
+            ).all()
+        ]
+
+        mask = np.zeros(self._max_id + 1, dtype=bool)
+        answered = np.array([i for i in answered_ids if i <= self._max_id], dtype=np.int64)
+        mask[answered] = True
+
+        with self._lock:
+            self._answered[user_id] = (self._version, mask)
+            self._answered.move_to_end(user_id)
+            while len(self._answered) > self._max_users:
+                self._answered.popitem(last=False)
+
+        return mask
+
+    def mark_answered(self, user_id, question_id):
+        """Atualiza o bitset do usuário após uma nova resposta"""
+        with self._lock:
+            cached = self._answered.get(user_id)
+            if cached and question_id < len(cached[1]):
+                cached[1][question_id] = True
+
+    def sample(self, user_id, specialty=None, count=1, difficulty=None,
+               exclude_answered=True, exclude_ids=None, rng=None):
+        """Sorteia até `count` ids distintos de um pool, aplicando as exclusões em memória"""
+        if count <= 0:
+            return []
+
+        rng = rng or np.random.default_rng()
+        pool = self.get_pool(specialty, difficulty)
+
+        if exclude_answered and len(pool):
+            pool = pool[~self.answered_mask(user_id)[pool]]
+
+        if exclude_ids and len(pool):
+            pool = pool[~np.isin(pool, np.fromiter(exclude_ids, dtype=np.int64))]
+
+        if not len(pool):
+            return []
+
+        return rng.choice(pool, size=min(count, len(pool)), replace=False).tolist()
+
+    def sample_many(self, user_id, counts, difficulty=None, exclude_answered=True,
+                    exclude_ids=None, rng=None):
+        """
+        Sorteia os ids de vários tópicos de uma vez: `counts` mapeia especialidade -> quantidade.
+        O bitset do usuário e as exclusões são calculados uma única vez para a sessão inteira.
+        """
+        rng = rng or np.random.default_rng()
+        mask = self.answered_mask(user_id).copy() if exclude_answered else np.zeros(self._max_id + 1, dtype=bool)
+
+        if exclude_ids:
+            excluded = np.fromiter(exclude_ids, dtype=np.int64)
+            mask[excluded[excluded <= self._max_id]] = True
+
+        selected = {}
+        for specialty, count in counts.items():
+            pool = self.get_pool(specialty, difficulty)
+            if count <= 0 or not len(pool):
+                continue
+
+            pool = pool[~mask[pool]]
+            if not len(pool):
+                continue
+
+            ids = rng.choice(pool, size=min(count, len(pool)), replace=False)
+            mask[ids] = True  # Evita repetir questões entre tópicos
+            selected[specialty] = ids.tolist()
+
+        return selected
+
+
+question_pool_index = QuestionPoolIndex()
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_delete')
+def _invalidate_question_pool(mapper, connection, target):
+    question_pool_index.invalidate()
+
+
+@event.listens_for(Question, 'after_update')
+def _invalidate_question_pool_on_edit(mapper, connection, target):
+    # Atualizações de estatísticas (times_answered) não alteram o índice
+    state = inspect(target)
+    if state.attrs.specialty.history.has_changes() or state.attrs.difficulty.history.has_changes():
+        question_pool_index.invalidate()
+
+
+@event.listens_for(UserAnswer, 'after_insert')
+def _mark_question_answered(mapper, connection, target):
+    question_pool_index.mark_answered(target.user_id, target.question_id)
@@ -1,10 +1,22 @@
 import random
 import numpy as np
 from datetime import datetime, timedelta
+from flask import current_app, has_app_context
 from sqlalchemy import func, and_, or_
 from src.models.user import db
 from src.models.question import Question, UserAnswer
-from src.models.priority import TopicFrequency, UserTopicPriority, QuestionSelectionLog, get_user_topic_priority
+from src.models.priority import TopicFrequency, UserTopicPriority, QuestionSelectionLog, get_user_topic_priority, log_question_selections
+from src.services.question_pool import question_pool_index
+
+def selection_mode():
+    """
+    Modo de busca das questões da instalação (config QUESTION_SELECTION_MODE): 'pool' sorteia no
+    índice em memória do processo; 'window' usa a consulta única com window function, indicada
+    com vários processos, em que cada índice pode ficar defasado.
+    """
+    if has_app_context():
+        return current_app.config.get('QUESTION_SELECTION_MODE', 'pool')
+    return 'pool'
 
 class IntelligentQuestionSelector:
     """Seletor inteligente de questões baseado na regra de Pareto e desempenho individual"""
@@ -13,67 +25,67 @@ class IntelligentQuestionSelector:
         self.user_id = user_id
         self.pareto_weight = 0.8  # 80% das questões dos temas importantes
         self.performance_weight = 0.6  # Peso do desempenho individual
+        self.pool = question_pool_index  # Índice em memória compartilhado pelo processo
+        self.use_pool_index = selection_mode() != 'window'
+        self.selection_methods = {}
+        
+    def select_questions(self, limit=10, specialty=None, difficulty=None, session_id=None, log_selections=True):
+        """
+        Seleciona questões usando algoritmo inteligente baseado em Pareto + desempenho.
+        Use log_selections=False quando a sessão ainda vai ser criada e registrada depois.
+        """
+        # 1. Planejar quantas questões cada bucket (especialidade, dificuldade) precisa
+        plan = self._plan_session(limit, specialty, difficulty)
+        
+        # 2. Buscar todos os buckets de uma vez (índice em memória ou consulta única)
+        if self.use_pool_index:
+            selected = self._draw_from_pool(plan, limit, specialty, difficulty)
+        else:
+            selected = self._fetch_planned_questions(plan, limit, specialty, difficulty)
         
-    def select_questions(self, limit=10, specialty=None, difficulty=None, session_id=None):
+        self.selection_methods = {q.id: method for q, method in selected}
+        selected_questions = [q for q, method in selected]
+        
+        # 3. Embaralhar a ordem final
+        random.shuffle(selected_questions)
+        
+        # 4. Registrar logs de seleção
+        if log_selections:
+            self._log_selections(selected_questions, session_id)
+        
+        return selected_questions
+    
+    def _plan_session(self, limit, specialty=None, difficulty=None):
         """
-        Seleciona questões usando algoritmo inteligente baseado em Pareto + desempenho
+        Calcula, para a sessão inteira, quantas questões cada bucket (especialidade, dificuldade)
+        precisa: {(especialidade, dificuldade): {'pareto': n, 'performance': m}}
         """
-        selected_questions = []
-        selection_logs = []
+        plan = {}
         
         # Calcular quantas questões de cada tipo selecionar
         pareto_count = int(limit * self.pareto_weight)  # 80% dos temas importantes
         performance_count = limit - pareto_count  # 20% baseado em desempenho
         
-        # 1. Selecionar questões dos temas importantes (Pareto)
-        pareto_questions = self._select_pareto_questions(
-            count=pareto_count,
-            specialty=specialty,
-            difficulty=difficulty
-        )
-        selected_questions.extend(pareto_questions)
+        for topic, count in self._plan_pareto_topics(pareto_count, specialty).items():
+            bucket = plan.setdefault((topic, difficulty), {'pareto': 0, 'performance': 0})
+            bucket['pareto'] += count
         
-        # 2. Selecionar questões baseadas no desempenho individual
-        performance_questions = self._select_performance_questions(
-            count=performance_count,
-            specialty=specialty,
-            difficulty=difficulty,
-            exclude_ids=[q.id for q in pareto_questions]
-        )
-        selected_questions.extend(performance_questions)
-        
-        # 3. Se não temos questões suficientes, completar com seleção aleatória
-        if len(selected_questions) < limit:
-            remaining = limit - len(selected_questions)
-            random_questions = self._select_random_questions(
-                count=remaining,
-                specialty=specialty,
-                difficulty=difficulty,
-                exclude_ids=[q.id for q in selected_questions]
-            )
-            selected_questions.extend(random_questions)
+        for topic, count in self._plan_performance_topics(performance_count, specialty, difficulty).items():
+            bucket = plan.setdefault((topic, difficulty), {'pareto': 0, 'performance': 0})
+            bucket['performance'] += count
         
-        # 4. Embaralhar a ordem final
-        random.shuffle(selected_questions)
-        
-        # 5. Registrar logs de seleção
-        self._log_selections(selected_questions, session_id)
-        
-        return selected_questions[:limit]
+        return plan
     
-    def _select_pareto_questions(self, count, specialty=None, difficulty=None):
-        """Seleciona questões dos temas que mais caem (top 20%)"""
+    def _plan_pareto_topics(self, count, specialty=None):
+        """Distribui as questões entre os temas que mais caem (top 20%)"""
         if count <= 0:
-            return []
+            return {}
         
         # Buscar temas do top 20% (Pareto)
         top_topics = TopicFrequency.query.filter(
             TopicFrequency.pareto_tier.in_(['top20', 'important'])
         ).all()
         
-        if not top_topics:
-            return []
-        
         # Criar distribuição de probabilidades baseada na importância
         topic_weights = []
         topic_names = []
@@ -85,7 +97,7 @@ class IntelligentQuestionSelector:
             topic_weights.append(topic.importance_score)
         
         if not topic_names:
-            return []
+            return {}
         
         # Normalizar pesos
         total_weight = sum(topic_weights)
@@ -99,140 +111,173 @@ class IntelligentQuestionSelector:
             replace=True
         )
         
-        # Buscar questões dos temas selecionados
-        questions = []
-        for topic in selected_topics:
-            question = self._get_random_question_from_topic(
-                topic, difficulty, exclude_answered=True
-            )
-            if question:
-                questions.append(question)
-        
-        return questions
+        topics, counts = np.unique(selected_topics, return_counts=True)
+        return dict(zip(topics.tolist(), counts.tolist()))
     
-    def _select_performance_questions(self, count, specialty=None, difficulty=None, exclude_ids=None):
-        """Seleciona questões baseadas no desempenho individual do usuário"""
+    def _plan_performance_topics(self, count, specialty=None, difficulty=None):
+        """Distribui as questões entre os temas prioritários para o usuário que têm questões disponíveis"""
         if count <= 0:
-            return []
+            return {}
         
-        exclude_ids = exclude_ids or []
+        # Buscar prioridades do usuário (maior = mais importante para o usuário)
+        query = UserTopicPriority.query.filter_by(user_id=self.user_id)
         
-        # Buscar prioridades do usuário
-        user_priorities = UserTopicPriority.query.filter_by(
-            user_id=self.user_id
-        ).all()
+        if specialty:
+            query = query.filter(UserTopicPriority.specialty == specialty)
         
-        if not user_priorities:
-            return []
+        # Temas sem nenhuma questão (na dificuldade pedida) não ocupam vaga da cota
+        available = Question.query.filter(Question.specialty == UserTopicPriority.specialty)
+        if difficulty:
+            available = available.filter(Question.difficulty == difficulty)
+        query = query.filter(available.exists())
         
-        # Filtrar por especialidade se especificado
-        if specialty:
-            user_priorities = [p for p in user_priorities if p.specialty == specialty]
+        user_priorities = query.order_by(UserTopicPriority.final_priority.desc()).all()
         
-        # Ordenar por prioridade final (maior = mais importante para o usuário)
-        user_priorities.sort(key=lambda x: x.final_priority, reverse=True)
+        # Uma questão por tema prioritário
+        return {priority.specialty: 1 for priority in user_priorities[:count]}
+    
+    def _draw_from_pool(self, plan, limit, specialty=None, difficulty=None):
+        """Executa o plano sorteando os ids em memória e carregando as questões de uma vez"""
+        methods = {}
+        
+        # Pareto: apenas questões ainda não respondidas
+        pareto = self.pool.sample_many(
+            self.user_id,
+            {topic: bucket['pareto'] for (topic, _), bucket in plan.items()},
+            difficulty=difficulty,
+            exclude_answered=True
+        )
+        for ids in pareto.values():
+            methods.update((question_id, 'pareto') for question_id in ids)
         
-        # Selecionar questões dos temas prioritários
-        questions = []
-        for priority in user_priorities:
-            if len(questions) >= count:
-                break
+        # Desempenho: permite questões já respondidas para revisão
+        performance = self.pool.sample_many(
+            self.user_id,
+            {topic: bucket['performance'] for (topic, _), bucket in plan.items()},
+            difficulty=difficulty,
+            exclude_answered=False,
+            exclude_ids=list(methods)
+        )
+        for ids in performance.values():
+            methods.update((question_id, 'performance') for question_id in ids)
+        
+        # Completar com seleção aleatória se não temos questões suficientes
+        if len(methods) < limit:
+            random_ids = self.pool.sample(
+                self.user_id,
+                specialty,
+                count=limit - len(methods),
+                difficulty=difficulty,
+                exclude_answered=True,
+                exclude_ids=list(methods)
+            )
+            methods.update((question_id, 'random') for question_id in random_ids)
+        
+        questions = self._hydrate_questions(list(methods)[:limit])
+        return [(q, methods[q.id]) for q in questions]
+    
+    def _fetch_planned_questions(self, plan, limit, specialty=None, difficulty=None):
+        """
+        Executa o plano com uma única consulta: ROW_NUMBER() OVER (PARTITION BY specialty)
+        sorteia cada bucket e a cota de cada um é aplicada no próprio SQL.
+        """
+        answered_ids = db.session.query(UserAnswer.question_id).filter(
+            UserAnswer.user_id == self.user_id
+        )
+        answered = db.case((Question.id.in_(answered_ids), 1), else_=0)
+        
+        selected = []
+        
+        if plan:
+            base = db.session.query(
+                Question.id.label('id'),
+                answered.label('answered'),
+                func.row_number().over(
+                    partition_by=Question.specialty,
+                    order_by=(answered, func.random())  # Não respondidas primeiro
+                ).label('rn')
+            ).filter(Question.specialty.in_([topic for topic, _ in plan]))
             
-            question = self._get_random_question_from_topic(
-                priority.specialty, 
-                difficulty, 
-                exclude_answered=False,  # Permitir questões já respondidas para revisão
-                exclude_ids=exclude_ids
+            if difficulty:
+                base = base.filter(Question.difficulty == difficulty)
+            
+            ranked = base.subquery()
+            
+            # Cota total do bucket; questões respondidas só entram na cota de desempenho
+            quota = db.case(
+                *[(Question.specialty == topic, bucket['pareto'] + bucket['performance'])
+                  for (topic, _), bucket in plan.items()],
+                else_=0
             )
+            performance_topics = [topic for (topic, _), bucket in plan.items() if bucket['performance']]
+            
+            rows = db.session.query(Question, ranked.c.rn, ranked.c.answered).join(
+                ranked, ranked.c.id == Question.id
+            ).filter(
+                ranked.c.rn <= quota,
+                or_(ranked.c.answered == 0, Question.specialty.in_(performance_topics))
+            ).order_by(Question.specialty, ranked.c.rn).all()
+            
+            taken = {}
+            for question, rn, is_answered in rows:
+                bucket = plan[(question.specialty, difficulty)]
+                pareto_taken = taken.get(question.specialty, 0)
+                
+                if not is_answered and pareto_taken < bucket['pareto']:
+                    taken[question.specialty] = pareto_taken + 1
+                    selected.append((question, 'pareto'))
+                else:
+                    selected.append((question, 'performance'))
+        
+        # Completar com seleção aleatória se não temos questões suficientes
+        if len(selected) < limit:
+            query = Question.query.filter(~Question.id.in_(answered_ids))
+            
+            if specialty:
+                query = query.filter(Question.specialty == specialty)
             
-            if question:
-                questions.append(question)
-                exclude_ids.append(question.id)
+            if difficulty:
+                query = query.filter(Question.difficulty == difficulty)
+            
+            if selected:
+                query = query.filter(~Question.id.in_([q.id for q, method in selected]))
+            
+            random_questions = query.order_by(func.random()).limit(limit - len(selected)).all()
+            selected.extend((q, 'random') for q in random_questions)
         
-        return questions
+        return selected[:limit]
     
-    def _select_random_questions(self, count, specialty=None, difficulty=None, exclude_ids=None):
-        """Seleção aleatória para completar a quota"""
-        if count <= 0:
+    def _hydrate_questions(self, question_ids):
+        """Carrega as questões sorteadas com uma única consulta IN (...), preservando a ordem"""
+        if not question_ids:
             return []
         
-        exclude_ids = exclude_ids or []
-        
-        query = Question.query
-        
-        if specialty:
-            query = query.filter(Question.specialty == specialty)
-        
-        if difficulty:
-            query = query.filter(Question.difficulty == difficulty)
-        
-        if exclude_ids:
-            query = query.filter(~Question.id.in_(exclude_ids))
+        questions = Question.query.filter(Question.id.in_(question_ids)).all()
+        by_id = {q.id: q for q in questions}
         
-        # Excluir questões já respondidas pelo usuário (opcional)
-        answered_ids = db.session.query(UserAnswer.question_id).filter_by(
-            user_id=self.user_id
-        ).subquery()
-        
-        query = query.filter(~Question.id.in_(answered_ids))
-        
-        questions = query.order_by(func.random()).limit(count).all()
-        return questions
-    
-    def _get_random_question_from_topic(self, topic, difficulty=None, exclude_answered=True, exclude_ids=None):
-        """Busca uma questão aleatória de um tópico específico"""
-        exclude_ids = exclude_ids or []
-        
-        query = Question.query.filter(Question.specialty == topic)
-        
-        if difficulty:
-            query = query.filter(Question.difficulty == difficulty)
-        
-        if exclude_ids:
-            query = query.filter(~Question.id.in_(exclude_ids))
-        
-        if exclude_answered:
-            # Excluir questões já respondidas
-            answered_ids = db.session.query(UserAnswer.question_id).filter_by(
-                user_id=self.user_id
-            ).subquery()
-            query = query.filter(~Question.id.in_(answered_ids))
-        
-        question = query.order_by(func.random()).first()
-        return question
+        return [by_id[question_id] for question_id in question_ids if question_id in by_id]
     
     def _log_selections(self, questions, session_id=None):
-        """Registra as seleções para análise posterior"""
-        for i, question in enumerate(questions):
-            # Determinar método de seleção baseado na posição
-            if i < int(len(questions) * self.pareto_weight):
-                method = 'pareto'
-            else:
-                method = 'performance'
-            
-            # Buscar prioridade do usuário para este tópico
-            priority = get_user_topic_priority(self.user_id, question.specialty)
-            
-            log = QuestionSelectionLog(
-                user_id=self.user_id,
-                session_id=session_id,
-                specialty=question.specialty,
-                selection_method=method,
-                priority_score=priority.final_priority,
-                question_id=question.id
-            )
-            db.session.add(log)
-        
-        db.session.commit()
+        """Registra as seleções para análise posterior (uma única inserção em lote)"""
+        log_question_selections(
+            self.user_id,
+            [(q.id, q.specialty, self.selection_methods.get(q.id, 'random')) for q in questions],
+            session_id=session_id
+        )
     
-    def update_user_performance(self, question_id, is_correct, response_time=None):
-        """Atualiza o desempenho do usuário e recalcula prioridades"""
-        question = Question.query.get(question_id)
-        if not question:
-            return
+    def update_user_performance(self, question_id, is_correct, response_time=None, specialty=None):
+        """
+        Atualiza o desempenho do usuário e recalcula prioridades
+        specialty: especialidade da questão, quando já conhecida (evita carregar a questão)
+        """
+        if specialty is None:
+            question = Question.query.get(question_id)
+            if not question:
+                return
+            specialty = question.specialty
         
         # Atualizar prioridade do tópico
-        priority = get_user_topic_priority(self.user_id, question.specialty)
+        priority = get_user_topic_priority(self.user_id, specialty)
         priority.update_performance(is_correct)
         
         # Atualizar log de seleção se existir
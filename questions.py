@@ -1,10 +1,13 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import db
-from src.models.question import Question, UserAnswer
+from src.models.question import Question, UserAnswer, record_question_stats
 from src.models.study_session import StudySession
 from src.models.priority import initialize_topic_frequencies
+from src.models.user_stats import read_user_stats, record_answer_stats
 from src.services.question_selector import IntelligentQuestionSelector
+from src.services.answer_key import answer_key_store, get_explanations
+from src.services.microlearning import MicroLearningService, BATCH_SUBMIT_ERROR
 from datetime import datetime
 import random
 
@@ -32,7 +35,8 @@ def start_question_session():
             questions = selector.select_questions(
                 limit=question_count,
                 specialty=specialty,
-                difficulty=difficulty
+                difficulty=difficulty,
+                log_selections=False  # Registrado uma única vez após criar a sessão
             )
         else:
             # Seleção tradicional aleatória
@@ -63,9 +67,8 @@ def start_question_session():
         db.session.add(session)
         db.session.commit()
         
-        # Atualizar selector com session_id se usando seleção inteligente
+        # Registrar a seleção já com o session_id
         if use_intelligent_selection:
-            selector = IntelligentQuestionSelector(user_id)
             selector._log_selections(questions, session.id)
         
         return jsonify({
@@ -80,7 +83,7 @@ def start_question_session():
 
 @questions_bp.route('/questions/<int:question_id>/answer', methods=['POST'])
 @jwt_required()
-def answer_question():
+def answer_question(question_id):
     """Responde uma questão e atualiza sistema de priorização"""
     try:
         user_id = get_jwt_identity()
@@ -89,10 +92,13 @@ def answer_question():
         selected_option = data.get('selected_option')
         session_id = data.get('session_id')
         response_time = data.get('response_time')
+        include_explanation = data.get('include_explanation', True)
         
-        question = Question.query.get(question_id)
-        if not question:
+        # Correção pelo gabarito em memória (sem carregar a questão)
+        graded = answer_key_store.grade(question_id, selected_option)
+        if graded is None:
             return jsonify({'message': 'Questão não encontrada'}), 404
+        is_correct, (correct_option, specialty, _) = graded
         
         # Verificar se já foi respondida
         existing_answer = UserAnswer.query.filter_by(
@@ -100,42 +106,143 @@ def answer_question():
             question_id=question_id
         ).first()
         
-        is_correct = selected_option == question.correct_option
-        
         if existing_answer:
             # Atualizar resposta existente
-            existing_answer.selected_option = selected_option
+            record_answer_stats(
+                user_id, is_correct, response_time,
+                previous_answer=(existing_answer.is_correct, existing_answer.time_spent, existing_answer.answered_at)
+            )
+            existing_answer.selected_answer = selected_option
             existing_answer.is_correct = is_correct
-            existing_answer.response_time = response_time
+            existing_answer.time_spent = response_time
             existing_answer.answered_at = datetime.utcnow()
         else:
             # Criar nova resposta
             answer = UserAnswer(
                 user_id=user_id,
                 question_id=question_id,
-                selected_option=selected_option,
+                selected_answer=selected_option,
                 is_correct=is_correct,
-                response_time=response_time,
+                time_spent=response_time,
                 session_id=session_id
             )
             db.session.add(answer)
+            record_answer_stats(user_id, is_correct, response_time)
+        
+        # Estatísticas da questão por incremento no banco (sem carregá-la)
+        record_question_stats(question_id, 1, int(is_correct))
         
         # Atualizar sistema de priorização inteligente
         selector = IntelligentQuestionSelector(user_id)
-        selector.update_user_performance(question_id, is_correct, response_time)
+        selector.update_user_performance(question_id, is_correct, response_time, specialty=specialty)
         
         db.session.commit()
         
         return jsonify({
             'is_correct': is_correct,
-            'correct_option': question.correct_option,
-            'explanation': question.explanation,
-            'specialty': question.specialty
+            'correct_option': correct_option,
+            # Explicação buscada só quando pedida (include_explanation=false dispensa a leitura)
+            'explanation': get_explanations([question_id]).get(question_id) if include_explanation else None,
+            'specialty': specialty
         })
         
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
+@questions_bp.route('/questions/<int:question_id>/explanation', methods=['GET'])
+@jwt_required()
+def get_question_explanation(question_id):
+    """Retorna a explicação de uma questão (carregada sob demanda após a resposta)"""
+    try:
+        explanations = get_explanations([question_id])
+        if question_id not in explanations:
+            return jsonify({'message': 'Questão não encontrada'}), 404
+        
+        return jsonify({'question_id': question_id, 'explanation': explanations[question_id]})
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+def _bundle_response(bundle, status=200):
+    """Resposta do pacote da sessão com ETag (If-None-Match devolve 304 sem corpo)"""
+    response = jsonify(bundle)
+    response.status_code = status
+    response.set_etag(bundle['version'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@questions_bp.route('/microlearning/session/bundle', methods=['POST'])
+@jwt_required()
+def create_session_bundle():
+    """Cria uma micro-sessão e retorna o pacote com todas as questões em uma única requisição"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        
+        service = MicroLearningService(user_id)
+        bundle, error = service.create_session_bundle(
+            specialty=data.get('specialty'),
+            difficulty=data.get('difficulty'),
+            session_type=data.get('session_type', 'daily')
+        )
+        if error:
+            return jsonify({'message': error}), 404
+        
+        return _bundle_response(bundle, 201)
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@questions_bp.route('/microlearning/session/<int:session_id>/bundle', methods=['GET'])
+@jwt_required()
+def get_session_bundle(session_id):
+    """Retorna o pacote de uma sessão existente (para retomar após reconexão)"""
+    try:
+        user_id = get_jwt_identity()
+        
+        service = MicroLearningService(user_id)
+        bundle, error = service.get_session_bundle(session_id)
+        if error:
+            return jsonify({'message': error}), 404
+        
+        return _bundle_response(bundle)
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@questions_bp.route('/microlearning/session/<int:session_id>/answers', methods=['POST'])
+@jwt_required()
+def submit_session_answers(session_id):
+    """Submete todas as respostas de uma micro-sessão em uma única requisição (e transação)"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        
+        answers = data.get('answers')
+        if not isinstance(answers, list):
+            return jsonify({'message': 'Lista de respostas é obrigatória'}), 400
+        
+        # Validar e normalizar os ids das questões antes de corrigir
+        for answer in answers:
+            if not isinstance(answer, dict):
+                return jsonify({'message': 'Resposta inválida'}), 400
+            try:
+                answer['question_id'] = int(answer.get('question_id'))
+            except (TypeError, ValueError):
+                return jsonify({'message': f"question_id inválido: {answer.get('question_id')!r}"}), 400
+        
+        service = MicroLearningService(user_id)
+        result, error = service.submit_session_answers(
+            session_id, answers, include_explanation=data.get('include_explanation', True)
+        )
+        if error:
+            return jsonify({'message': error}), 500 if error == BATCH_SUBMIT_ERROR else 400
+        
+        return jsonify(result)
+        
+    except Exception:
+        return jsonify({'message': BATCH_SUBMIT_ERROR}), 500
+
 @questions_bp.route('/questions/stats', methods=['GET'])
 @jwt_required()
 def get_question_stats():
@@ -143,9 +250,10 @@ def get_question_stats():
     try:
         user_id = get_jwt_identity()
         
-        # Estatísticas gerais
-        total_answered = UserAnswer.query.filter_by(user_id=user_id).count()
-        correct_answers = UserAnswer.query.filter_by(user_id=user_id, is_correct=True).count()
+        # Estatísticas gerais (contadores pré-agregados)
+        stats = read_user_stats(user_id)
+        total_answered = stats.total_answered
+        correct_answers = stats.total_correct
         
         accuracy_rate = (correct_answers / total_answered * 100) if total_answered > 0 else 0
         
@@ -216,7 +324,7 @@ def get_next_recommendation():
         selector = IntelligentQuestionSelector(user_id)
         
         # Simular seleção de uma questão para ver qual tópico seria escolhido
-        questions = selector.select_questions(limit=1)
+        questions = selector.select_questions(limit=1, log_selections=False)
         
         if questions:
             question = questions[0]
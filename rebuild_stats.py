@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.models.user_stats import rebuild_user_stats, rebuild_daily_activity, rebuild_leaderboard
+from src.services.retention_analytics import rebuild_retention_rollup
+from src.main import app
+
+def rebuild_stats(user_id=None):
+    """Recalcula as tabelas agregadas a partir do histórico completo"""
+    
+    with app.app_context():
+        users = rebuild_user_stats(user_id)
+        print(f"📊 Contadores recalculados para {users} usuários")
+        
+        days = rebuild_daily_activity(user_id)
+        print(f"📅 {days} dias de atividade reconstruídos")
+        
+        retention = rebuild_retention_rollup(user_id)
+        print(f"🧠 {retention} linhas do rollup de retenção reconstruídas")
+        
+        if user_id is None:
+            entries = rebuild_leaderboard()
+            print(f"🏆 Ranking semanal reconstruído com {entries} usuários")
+
+if __name__ == '__main__':
+    rebuild_stats(int(sys.argv[1]) if len(sys.argv) > 1 else None)
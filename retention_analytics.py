@@ -0,0 +1,263 @@
+from datetime import datetime, timedelta
+import numpy as np
+from src.models.user import db
+from src.models.user_stats import DailyRetention
+
+# Janelas padrão da retenção (dias)
+RETENTION_WINDOWS = (7, 30, 90)
+
+# Limite inferior (dias) de cada faixa do intervalo testado na revisão; a última faixa é aberta
+INTERVAL_BUCKETS = (1, 3, 7, 14, 21, 60, 180)
+
+# A partir deste intervalo o card é considerado maduro
+MATURE_INTERVAL = 21
+
+def interval_bucket(interval_days):
+    """Índice da faixa de um intervalo (intervalos ausentes ou menores que 1 dia caem na primeira)"""
+    return max(int(np.searchsorted(INTERVAL_BUCKETS, interval_days or 1, side='right')) - 1, 0)
+
+def bucket_label(index):
+    low = INTERVAL_BUCKETS[index]
+    if index + 1 < len(INTERVAL_BUCKETS):
+        return f'{low}-{INTERVAL_BUCKETS[index + 1] - 1}d'
+    return f'{low}d+'
+
+def _bucket_case(interval_column):
+    """Mesma faixa de interval_bucket calculada no SQL (reconstrução do rollup)"""
+    return db.case(
+        *[(interval_column >= low, index) for index, low in reversed(list(enumerate(INTERVAL_BUCKETS)))],
+        else_=0
+    )
+
+def _rate(recalled, reviews):
+    return round(recalled / reviews * 100, 2) if reviews else 0
+
+def record_review_retention(user_id, reviews):
+    """
+    Atualiza o rollup com revisões recém-gravadas (sem commit; persiste junto com a transação atual).
+    reviews: iterável de (reviewed_at, specialty, intervalo testado, quality_rating).
+    """
+    counters = {}
+    for reviewed_at, specialty, previous_interval, quality_rating in reviews:
+        day = reviewed_at.date() if isinstance(reviewed_at, datetime) else reviewed_at
+        key = (day, specialty, interval_bucket(previous_interval))
+        total, recalled = counters.get(key, (0, 0))
+        counters[key] = (total + 1, recalled + (1 if quality_rating >= 3 else 0))
+
+    missing = []
+    for (day, specialty, bucket), (total, recalled) in counters.items():
+        updated = db.session.query(DailyRetention).filter(
+            DailyRetention.user_id == user_id,
+            DailyRetention.day == day,
+            DailyRetention.specialty == specialty,
+            DailyRetention.interval_bucket == bucket
+        ).update(
+            {
+                DailyRetention.reviews: DailyRetention.reviews + total,
+                DailyRetention.recalled: DailyRetention.recalled + recalled
+            },
+            synchronize_session=False
+        )
+        if not updated:
+            missing.append({
+                'user_id': user_id,
+                'day': day,
+                'specialty': specialty,
+                'interval_bucket': bucket,
+                'reviews': total,
+                'recalled': recalled
+            })
+
+    if missing:
+        db.session.execute(DailyRetention.__table__.insert(), missing)
+
+def _window_query(user_id, days, specialty=None, end_day=None):
+    end_day = end_day or datetime.utcnow().date()
+    query = DailyRetention.query.filter(
+        DailyRetention.user_id == user_id,
+        DailyRetention.day > end_day - timedelta(days=days),
+        DailyRetention.day <= end_day
+    )
+    if specialty:
+        query = query.filter(DailyRetention.specialty == specialty)
+    return query, end_day
+
+def _daily_series(user_id, days, specialty=None, end_day=None):
+    """Revisões e lembradas por dia nos últimos `days` dias (posição 0 = dia mais antigo)"""
+    query, end_day = _window_query(user_id, days, specialty, end_day)
+    rows = query.with_entities(
+        DailyRetention.day,
+        db.func.sum(DailyRetention.reviews),
+        db.func.sum(DailyRetention.recalled)
+    ).group_by(DailyRetention.day).all()
+
+    reviews = np.zeros(days, dtype=np.int64)
+    recalled = np.zeros(days, dtype=np.int64)
+    start = end_day - timedelta(days=days - 1)
+    for day, total, hits in rows:
+        if isinstance(day, str):
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        offset = (day - start).days
+        reviews[offset] = total or 0
+        recalled[offset] = hits or 0
+    return reviews, recalled, start
+
+def retention_rate(user_id, days=30, specialty=None):
+    """Retenção (%) nos últimos `days` dias, somada no rollup diário"""
+    query, _ = _window_query(user_id, days, specialty)
+    reviews, recalled = query.with_entities(
+        db.func.coalesce(db.func.sum(DailyRetention.reviews), 0),
+        db.func.coalesce(db.func.sum(DailyRetention.recalled), 0)
+    ).one()
+    return _rate(recalled, reviews)
+
+def retention_windows(user_id, windows=RETENTION_WINDOWS, specialty=None):
+    """Retenção em várias janelas terminando hoje, com uma única leitura da maior janela"""
+    reviews, recalled, _ = _daily_series(user_id, max(windows), specialty)
+
+    # Somas acumuladas do dia mais recente para trás: a janela w é a posição w - 1
+    reviews_total = np.cumsum(reviews[::-1])
+    recalled_total = np.cumsum(recalled[::-1])
+
+    return {
+        f'{window}d': {
+            'reviews': int(reviews_total[window - 1]),
+            'recalled': int(recalled_total[window - 1]),
+            'retention_rate': _rate(int(recalled_total[window - 1]), int(reviews_total[window - 1]))
+        }
+        for window in windows
+    }
+
+def retention_trend(user_id, days=30, window=7, specialty=None):
+    """Retenção em janela deslizante de `window` dias para cada um dos últimos `days` dias"""
+    reviews, recalled, start = _daily_series(user_id, days + window - 1, specialty)
+
+    # Soma da janela por diferença de somas acumuladas: O(dias)
+    reviews_total = np.concatenate(([0], np.cumsum(reviews)))
+    recalled_total = np.concatenate(([0], np.cumsum(recalled)))
+    window_reviews = reviews_total[window:] - reviews_total[:-window]
+    window_recalled = recalled_total[window:] - recalled_total[:-window]
+
+    first_day = start + timedelta(days=window - 1)
+    return [
+        {
+            'date': (first_day + timedelta(days=offset)).isoformat(),
+            'reviews': int(window_reviews[offset]),
+            'retention_rate': _rate(int(window_recalled[offset]), int(window_reviews[offset]))
+        }
+        for offset in range(days)
+    ]
+
+def _grouped(user_id, days, column, specialty=None):
+    query, _ = _window_query(user_id, days, specialty)
+    return query.with_entities(
+        column,
+        db.func.sum(DailyRetention.reviews),
+        db.func.sum(DailyRetention.recalled)
+    ).group_by(column).all()
+
+def retention_by_interval(user_id, days=30, specialty=None):
+    """Retenção por faixa do intervalo testado (todas as faixas, inclusive as sem revisões)"""
+    counts = {
+        bucket: (total or 0, hits or 0)
+        for bucket, total, hits in _grouped(user_id, days, DailyRetention.interval_bucket, specialty)
+    }
+    result = []
+    for index, low in enumerate(INTERVAL_BUCKETS):
+        total, hits = counts.get(index, (0, 0))
+        result.append({
+            'bucket': bucket_label(index),
+            'min_interval': low,
+            'reviews': total,
+            'recalled': hits,
+            'retention_rate': _rate(hits, total)
+        })
+    return result
+
+def retention_by_maturity(by_interval):
+    """Retenção de cards jovens (< MATURE_INTERVAL dias) e maduros, somando as faixas de intervalo"""
+    result = {}
+    for maturity, mature in (('young', False), ('mature', True)):
+        rows = [row for row in by_interval if (row['min_interval'] >= MATURE_INTERVAL) == mature]
+        total = sum(row['reviews'] for row in rows)
+        hits = sum(row['recalled'] for row in rows)
+        result[maturity] = {'reviews': total, 'recalled': hits, 'retention_rate': _rate(hits, total)}
+    return result
+
+def retention_by_specialty(user_id, days=30):
+    rows = _grouped(user_id, days, DailyRetention.specialty)
+    return sorted(
+        (
+            {'specialty': specialty, 'reviews': total or 0, 'recalled': hits or 0, 'retention_rate': _rate(hits or 0, total or 0)}
+            for specialty, total, hits in rows
+        ),
+        key=lambda row: row['reviews'],
+        reverse=True
+    )
+
+def get_retention_report(user_id, days=30, specialty=None):
+    """Relatório completo de retenção lido apenas do rollup diário"""
+    by_interval = retention_by_interval(user_id, days, specialty)
+    return {
+        'windows': retention_windows(user_id, specialty=specialty),
+        'trend': retention_trend(user_id, days, specialty=specialty),
+        'by_interval': by_interval,
+        'by_maturity': retention_by_maturity(by_interval),
+        'by_specialty': retention_by_specialty(user_id, days) if not specialty else None,
+        'period_days': days,
+        'specialty': specialty
+    }
+
+def rebuild_retention_rollup(user_id=None, days=None):
+    """
+    Reconstrói o rollup de retenção a partir do histórico de revisões (rotina offline).
+    days limita o backfill aos últimos N dias.
+    """
+    from src.models.flashcard import Flashcard, FlashcardReview
+
+    start = datetime.utcnow().date() - timedelta(days=days - 1) if days else None
+    day = db.func.date(FlashcardReview.reviewed_at)
+    bucket = _bucket_case(FlashcardReview.previous_interval)
+
+    query = db.session.query(
+        FlashcardReview.user_id,
+        day,
+        Flashcard.specialty,
+        bucket,
+        db.func.count(FlashcardReview.id),
+        db.func.sum(db.case((FlashcardReview.quality_rating >= 3, 1), else_=0))
+    ).join(Flashcard, Flashcard.id == FlashcardReview.flashcard_id).filter(
+        FlashcardReview.quality_rating.isnot(None),
+        FlashcardReview.reviewed_at.isnot(None)
+    )
+    if user_id is not None:
+        query = query.filter(FlashcardReview.user_id == user_id)
+    if start is not None:
+        query = query.filter(FlashcardReview.reviewed_at >= datetime.combine(start, datetime.min.time()))
+
+    rows = []
+    for uid, review_day, specialty, index, total, hits in query.group_by(FlashcardReview.user_id, day, Flashcard.specialty, bucket):
+        if isinstance(review_day, str):
+            review_day = datetime.strptime(review_day, '%Y-%m-%d').date()
+        rows.append({
+            'user_id': uid,
+            'day': review_day,
+            'specialty': specialty,
+            'interval_bucket': index,
+            'reviews': total or 0,
+            'recalled': hits or 0
+        })
+
+    delete = DailyRetention.query
+    if user_id is not None:
+        delete = delete.filter(DailyRetention.user_id == user_id)
+    if start is not None:
+        delete = delete.filter(DailyRetention.day >= start)
+    delete.delete(synchronize_session=False)
+
+    if rows:
+        db.session.execute(DailyRetention.__table__.insert(), rows)
+
+    db.session.commit()
+
+    return len(rows)
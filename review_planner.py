@@ -0,0 +1,83 @@
+import numpy as np
+
+# Tempo padrão de uma revisão (segundos) quando o usuário ainda não tem histórico
+DEFAULT_REVIEW_SECONDS = 30
+
+# Peso (em revisões) da média do usuário na estimativa de tempo de cada card
+TIME_PRIOR_WEIGHT = 3
+
+# Cards que vencem até estes dias à frente também entram como candidatos
+NEAR_DUE_DAYS = 2
+
+# Horizonte (dias) em que o ganho de retenção de revisar agora é medido
+GAIN_HORIZON_DAYS = 1
+
+# Aprender um card novo vale esta fração do ganho de retenção de um card já aprendido
+NEW_CARD_GAIN_WEIGHT = 0.5
+
+# Resolução do tempo na seleção exata (segundos)
+TIME_UNIT_SECONDS = 5
+
+# Candidatos (maior ganho por segundo) considerados na seleção exata
+MAX_KNAPSACK_ITEMS = 1024
+
+def estimate_review_seconds(mean_seconds, review_counts, user_mean=None):
+    """
+    Tempo esperado de revisão de cada card: média do próprio histórico puxada para a média
+    do usuário (cards com poucas revisões cronometradas ficam perto da média do usuário).
+    mean_seconds é NaN para cards sem histórico.
+    """
+    mean_seconds = np.asarray(mean_seconds, dtype=np.float64)
+    review_counts = np.nan_to_num(np.asarray(review_counts, dtype=np.float64))
+    prior = user_mean or DEFAULT_REVIEW_SECONDS
+
+    own = np.where(review_counts > 0, np.nan_to_num(mean_seconds) * review_counts, 0.0)
+    return (own + prior * TIME_PRIOR_WEIGHT) / (review_counts + TIME_PRIOR_WEIGHT)
+
+def _knapsack(values, weights, capacity):
+    """Mochila 0/1 exata por programação dinâmica sobre a capacidade (vetorizada por item)"""
+    best = np.zeros(capacity + 1)
+    keep = np.zeros((len(values), capacity + 1), dtype=bool)
+
+    for item in range(len(values)):
+        weight = weights[item]
+        if weight > capacity:
+            continue
+        candidate = best[:-weight] + values[item]
+        improved = candidate > best[weight:]
+        keep[item, weight:] = improved
+        best[weight:] = np.where(improved, candidate, best[weight:])
+
+    chosen = []
+    remaining = capacity
+    for item in range(len(values) - 1, -1, -1):
+        if keep[item, remaining]:
+            chosen.append(item)
+            remaining -= weights[item]
+    return np.array(chosen[::-1], dtype=np.int64)
+
+def select_cards(gains, seconds, budget_seconds, max_items=MAX_KNAPSACK_ITEMS):
+    """
+    Escolhe os cards que maximizam o ganho total dentro do tempo disponível. A seleção exata
+    roda sobre os `max_items` cards de maior ganho por segundo; o tempo que sobrar é completado
+    com os demais na mesma ordem. Retorna os índices escolhidos, do maior ganho por segundo ao menor.
+    """
+    gains = np.asarray(gains, dtype=np.float64)
+    weights = np.maximum(np.ceil(np.asarray(seconds, dtype=np.float64) / TIME_UNIT_SECONDS), 1).astype(np.int64)
+    capacity = int(budget_seconds // TIME_UNIT_SECONDS)
+    if capacity <= 0 or not len(gains):
+        return np.array([], dtype=np.int64)
+
+    order = np.argsort(-gains / weights, kind='stable')
+    if weights.sum() <= capacity:
+        return order
+
+    candidates = order[:max_items]
+    selected = candidates[_knapsack(gains[candidates], weights[candidates], capacity)]
+
+    rest = order[max_items:]
+    if len(rest):
+        remaining = capacity - weights[selected].sum()
+        selected = np.concatenate((selected, rest[np.cumsum(weights[rest]) <= remaining]))
+
+    return selected
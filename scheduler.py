@@ -0,0 +1,252 @@
+import os
+import numpy as np
+from flask import current_app, has_app_context
+
+DEFAULT_SCHEDULER = 'sm2'
+
+class SchedulerEngine:
+    """
+    Interface dos algoritmos de agendamento. O estado dos cards é um dict de arrays
+    (review_count, interval_days, ease_factor, stability, difficulty), todos com forma (cards,).
+    replay processa as revisões de vários cards de uma vez; review é o caso de um único evento.
+    """
+
+    name = None
+
+    def replay(self, state, qualities, mask, elapsed_days):
+        """
+        qualities, mask e elapsed_days têm forma (cards, eventos), com os eventos de cada card
+        em ordem cronológica; elapsed_days é o tempo desde a revisão anterior do card.
+        Retorna o estado final e, por evento, o intervalo e o ease factor anteriores e o novo intervalo.
+        """
+        raise NotImplementedError
+
+    def retrievability(self, state, elapsed_days):
+        """Probabilidade prevista de lembrar o card após elapsed_days sem revisão"""
+        raise NotImplementedError
+
+    def review(self, state, quality, elapsed_days=0.0):
+        """Aplica uma revisão a um único card (estado com valores escalares)"""
+        result = self.replay(
+            {key: np.array([value]) for key, value in state.items()},
+            np.array([[quality]], dtype=np.int64),
+            np.ones((1, 1), dtype=bool),
+            np.array([[elapsed_days]], dtype=np.float64)
+        )
+        return {key: result[key][0].item() for key in STATE_FIELDS}
+
+    def retrievability_curve(self, state, days):
+        """Curva de retenção prevista para os próximos `days` dias a partir da última revisão"""
+        elapsed = np.arange(days + 1, dtype=np.float64)
+        return self.retrievability({key: np.full(len(elapsed), value) for key, value in state.items()}, elapsed)
+
+STATE_FIELDS = ('review_count', 'interval_days', 'ease_factor', 'stability', 'difficulty')
+
+def _initial_state(state, size):
+    """Normaliza o estado recebido, preenchendo valores ausentes (cards sem histórico)"""
+    defaults = {'review_count': 0, 'interval_days': 1, 'ease_factor': 2.5, 'stability': np.nan, 'difficulty': np.nan}
+    normalized = {}
+    for key, default in defaults.items():
+        values = np.array(
+            [default if value is None else value for value in state.get(key, [None] * size)],
+            dtype=np.int64 if key in ('review_count', 'interval_days') else np.float64
+        )
+        normalized[key] = values
+    return normalized
+
+class SM2Engine(SchedulerEngine):
+    """
+    SM-2 modificado (mesmas regras do agendamento original do serviço). first_interval,
+    second_interval e interval_modifier permitem usar parâmetros ajustados por usuário.
+    """
+
+    name = 'sm2'
+
+    def __init__(self, min_ease_factor=1.3, max_ease_factor=4.0, first_interval=1,
+                 second_interval=6, interval_modifier=1.0):
+        self.min_ease_factor = min_ease_factor
+        self.max_ease_factor = max_ease_factor
+        self.first_interval = first_interval
+        self.second_interval = second_interval
+        self.interval_modifier = interval_modifier
+
+    def replay(self, state, qualities, mask, elapsed_days):
+        state = _initial_state(state, qualities.shape[0])
+        review_count = state['review_count']
+        interval_days = state['interval_days']
+        ease_factor = state['ease_factor']
+
+        previous_interval = np.zeros(qualities.shape, dtype=np.int64)
+        previous_ease = np.zeros(qualities.shape, dtype=np.float64)
+        new_interval = np.zeros(qualities.shape, dtype=np.int64)
+
+        for step in range(qualities.shape[1]):
+            active = mask[:, step]
+            quality = qualities[:, step]
+
+            previous_interval[:, step] = interval_days
+            previous_ease[:, step] = ease_factor
+
+            count = review_count + 1
+            failed = quality < 3
+
+            # np.floor equivale ao int() da versão escalar (intervalos são positivos)
+            sm2_interval = np.maximum(np.floor(interval_days * ease_factor * self.interval_modifier), 1).astype(np.int64)
+            success_interval = np.where(count == 1, self.first_interval, np.where(count == 2, self.second_interval, sm2_interval))
+            interval = np.where(failed, 1, success_interval)
+
+            ease_adjustment = 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+            success_ease = np.maximum(self.min_ease_factor, np.minimum(self.max_ease_factor, ease_factor + ease_adjustment))
+            failed_ease = np.maximum(self.min_ease_factor, ease_factor - 0.2)
+            ease = np.where(failed, failed_ease, success_ease)
+
+            review_count = np.where(active, count, review_count)
+            interval_days = np.where(active, interval, interval_days)
+            ease_factor = np.where(active, ease, ease_factor)
+            new_interval[:, step] = interval_days
+
+        return dict(
+            state,
+            review_count=review_count,
+            interval_days=interval_days,
+            ease_factor=ease_factor,
+            previous_interval=previous_interval,
+            previous_ease_factor=previous_ease,
+            new_interval=new_interval
+        )
+
+    def retrievability(self, state, elapsed_days):
+        # SM-2 não modela a memória: aproxima com decaimento exponencial que chega a 90% no vencimento
+        interval = np.maximum(np.asarray(state['interval_days'], dtype=np.float64), 1.0)
+        return np.power(0.9, np.asarray(elapsed_days, dtype=np.float64) / interval)
+
+# Parâmetros padrão do FSRS-4.5
+FSRS_DEFAULT_WEIGHTS = (
+    0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+    0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755
+)
+FSRS_DECAY = -0.5
+FSRS_FACTOR = 0.9 ** (1 / FSRS_DECAY) - 1  # 19/81: R(S) = 90% quando t = S
+
+class FSRSEngine(SchedulerEngine):
+    """
+    FSRS (Free Spaced Repetition Scheduler): modela por card a estabilidade S (dias até a
+    retenção cair a 90%) e a dificuldade D (1-10), prevê a curva de retenção
+    R(t) = (1 + FACTOR * t / S) ^ DECAY e agenda a revisão quando R atinge a retenção desejada.
+    """
+
+    name = 'fsrs'
+
+    def __init__(self, weights=FSRS_DEFAULT_WEIGHTS, desired_retention=0.9, max_interval=36500,
+                 interval_modifier=1.0):
+        self.w = np.array(weights, dtype=np.float64)
+        self.desired_retention = desired_retention
+        self.max_interval = max_interval
+        self.interval_modifier = interval_modifier
+
+    @staticmethod
+    def grade(quality):
+        """Converte a qualidade 0-5 do app na nota do FSRS: 1=errou, 2=difícil, 3=bom, 4=fácil"""
+        quality = np.asarray(quality)
+        return np.where(quality < 3, 1, np.minimum(quality - 1, 4))
+
+    def _initial_difficulty(self, grade):
+        return np.clip(self.w[4] - (grade - 3) * self.w[5], 1, 10)
+
+    def _next_interval(self, stability):
+        interval = stability / FSRS_FACTOR * (self.desired_retention ** (1 / FSRS_DECAY) - 1) * self.interval_modifier
+        return np.clip(np.round(interval), 1, self.max_interval).astype(np.int64)
+
+    def replay(self, state, qualities, mask, elapsed_days):
+        w = self.w
+        state = _initial_state(state, qualities.shape[0])
+        review_count = state['review_count']
+        interval_days = state['interval_days']
+        ease_factor = state['ease_factor']
+        stability = state['stability']
+        difficulty = state['difficulty']
+
+        # Cards já revisados por outro engine: a estabilidade parte do intervalo atual
+        migrated = np.isnan(stability) & (review_count > 0)
+        stability = np.where(migrated, np.maximum(interval_days, 1).astype(np.float64), stability)
+        difficulty = np.where(migrated, self._initial_difficulty(3), difficulty)
+
+        previous_interval = np.zeros(qualities.shape, dtype=np.int64)
+        previous_ease = np.zeros(qualities.shape, dtype=np.float64)
+        new_interval = np.zeros(qualities.shape, dtype=np.int64)
+
+        for step in range(qualities.shape[1]):
+            active = mask[:, step]
+            grade = self.grade(qualities[:, step])
+            is_new = np.isnan(stability)
+
+            previous_interval[:, step] = interval_days
+            previous_ease[:, step] = ease_factor
+
+            # Primeira revisão: estado inicial pela nota
+            first_stability = w[grade - 1]
+            first_difficulty = self._initial_difficulty(grade)
+
+            # Revisões seguintes (np.where avalia os dois ramos; NaN dos cards novos é descartado)
+            safe_stability = np.where(is_new, 1.0, stability)
+            safe_difficulty = np.where(is_new, 5.0, difficulty)
+            retrievability = np.power(1 + FSRS_FACTOR * elapsed_days[:, step] / safe_stability, FSRS_DECAY)
+
+            next_difficulty = safe_difficulty - w[6] * (grade - 3)
+            next_difficulty = np.clip(w[7] * self._initial_difficulty(3) + (1 - w[7]) * next_difficulty, 1, 10)
+
+            hard_penalty = np.where(grade == 2, w[15], 1.0)
+            easy_bonus = np.where(grade == 4, w[16], 1.0)
+            recall_stability = safe_stability * (
+                1 + np.exp(w[8]) * (11 - safe_difficulty) * np.power(safe_stability, -w[9])
+                * (np.exp(w[10] * (1 - retrievability)) - 1) * hard_penalty * easy_bonus
+            )
+            forget_stability = np.minimum(
+                w[11] * np.power(safe_difficulty, -w[12]) * (np.power(safe_stability + 1, w[13]) - 1)
+                * np.exp(w[14] * (1 - retrievability)),
+                safe_stability
+            )
+            review_stability = np.where(grade == 1, forget_stability, recall_stability)
+
+            new_stability = np.where(is_new, first_stability, review_stability)
+            new_difficulty = np.where(is_new, first_difficulty, next_difficulty)
+
+            review_count = np.where(active, review_count + 1, review_count)
+            stability = np.where(active, new_stability, stability)
+            difficulty = np.where(active, new_difficulty, difficulty)
+            interval_days = np.where(active, self._next_interval(np.where(active, new_stability, 1.0)), interval_days)
+            new_interval[:, step] = interval_days
+
+        return dict(
+            state,
+            review_count=review_count,
+            interval_days=interval_days,
+            ease_factor=ease_factor,
+            stability=stability,
+            difficulty=difficulty,
+            previous_interval=previous_interval,
+            previous_ease_factor=previous_ease,
+            new_interval=new_interval
+        )
+
+    def retrievability(self, state, elapsed_days):
+        stability = np.asarray(state['stability'], dtype=np.float64)
+        # Cards sem estado FSRS usam o intervalo atual como estabilidade
+        stability = np.where(np.isnan(stability), np.maximum(np.asarray(state['interval_days'], dtype=np.float64), 1.0), stability)
+        return np.power(1 + FSRS_FACTOR * np.asarray(elapsed_days, dtype=np.float64) / stability, FSRS_DECAY)
+
+SCHEDULERS = {
+    SM2Engine.name: SM2Engine,
+    FSRSEngine.name: FSRSEngine
+}
+
+def default_scheduler_name():
+    """Engine padrão da instalação (config SCHEDULER_ENGINE ou variável de ambiente)"""
+    if has_app_context() and current_app.config.get('SCHEDULER_ENGINE'):
+        return current_app.config['SCHEDULER_ENGINE']
+    return os.environ.get('SCHEDULER_ENGINE', DEFAULT_SCHEDULER)
+
+def get_scheduler(name=None, **options):
+    """Instancia o engine pelo nome (padrão da instalação quando None ou desconhecido)"""
+    engine = SCHEDULERS.get(name) or SCHEDULERS.get(default_scheduler_name()) or SCHEDULERS[DEFAULT_SCHEDULER]
+    return engine(**options)
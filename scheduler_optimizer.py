@@ -0,0 +1,288 @@
+import numpy as np
+from sqlalchemy import or_
+from src.models.user import db
+from src.models.flashcard import Flashcard, FlashcardReview, SchedulerParameters
+from src.services.scheduler import FSRS_DEFAULT_WEIGHTS, FSRS_DECAY, FSRS_FACTOR, FSRSEngine
+
+# Faixas (escala log) do tempo até a segunda revisão e da razão tempo decorrido / intervalo agendado
+ELAPSED_BINS = np.geomspace(0.25, 365, 25)
+RATIO_BINS = np.geomspace(0.1, 10, 21)
+
+# Candidatos da busca em grade (avaliados de uma vez com arrays)
+STABILITY_GRID = np.geomspace(0.1, 365, 400)
+MODIFIER_GRID = np.geomspace(0.25, 4, 200)
+
+# Mínimo de observações para substituir o padrão
+MIN_FIRST_REVIEWS = 20
+MIN_MODIFIER_REVIEWS = 30
+MODIFIER_PRIOR_REVIEWS = 50  # Amortece cada ajuste do modificador pelo volume de dados novos
+MODIFIER_RANGE = (0.5, 3.0)
+
+# Parâmetros por especialidade só são usados com histórico suficiente
+MIN_SPECIALTY_REVIEWS = 100
+
+def _bin_centers(edges):
+    return np.sqrt(edges[:-1] * edges[1:])
+
+def _retrievability(elapsed, stability):
+    return np.clip(np.power(1 + FSRS_FACTOR * elapsed / stability, FSRS_DECAY), 1e-6, 1 - 1e-6)
+
+def _best_candidate(candidates, x, total, recalled):
+    """
+    Escolhe, numa grade de candidatos c, o que maximiza a verossimilhança binomial das revisões
+    agrupadas por faixa com R = (1 + FACTOR * x / c) ^ DECAY (candidatos x faixas de uma vez).
+    """
+    retrievability = _retrievability(x[None, :], candidates[:, None])
+    log_likelihood = (
+        recalled[None, :] * np.log(retrievability)
+        + (total - recalled)[None, :] * np.log(1 - retrievability)
+    ).sum(axis=1)
+    return float(candidates[np.argmax(log_likelihood)])
+
+def fit_initial_stability(first_total, first_recalled):
+    """Estabilidade inicial por nota da primeira revisão (None onde faltam dados)"""
+    centers = _bin_centers(ELAPSED_BINS)
+    fitted = []
+    for grade in range(4):
+        total = np.asarray(first_total[grade], dtype=np.float64)
+        if total.sum() < MIN_FIRST_REVIEWS:
+            fitted.append(None)
+            continue
+        recalled = np.asarray(first_recalled[grade], dtype=np.float64)
+        fitted.append(round(_best_candidate(STABILITY_GRID, centers, total, recalled), 4))
+    return fitted
+
+def fit_interval_modifier(ratio_total, ratio_recalled):
+    """
+    Quanto os intervalos agendados podem ser esticados: ajusta m tal que a retenção observada
+    em t / intervalo siga R = (1 + FACTOR * razão / m) ^ DECAY (m > 1 = revisões cedo demais).
+    """
+    total = np.asarray(ratio_total, dtype=np.float64)
+    recalled = np.asarray(ratio_recalled, dtype=np.float64)
+    return _best_candidate(MODIFIER_GRID, _bin_centers(RATIO_BINS), total, recalled)
+
+def _empty_statistics():
+    bins = len(ELAPSED_BINS) - 1
+    ratio_bins = len(RATIO_BINS) - 1
+    return {
+        'first_total': [[0] * bins for _ in range(4)],
+        'first_recalled': [[0] * bins for _ in range(4)],
+        'pending_ratio_total': [0] * ratio_bins,
+        'pending_ratio_recalled': [0] * ratio_bins
+    }
+
+def _load_reviews(user_id, watermarks):
+    """
+    Revisões novas (id acima da marca do usuário) e, para dar contexto, o histórico dos cards
+    tocados por elas. Retorna arrays ordenados por card e data.
+    """
+    new_query = db.session.query(FlashcardReview.flashcard_id).filter(
+        FlashcardReview.quality_rating.isnot(None)
+    )
+    if user_id is not None:
+        new_query = new_query.filter(
+            FlashcardReview.user_id == user_id,
+            FlashcardReview.id > watermarks.get(user_id, 0)
+        )
+    else:
+        # Usuários sem marca (nunca ajustados) têm todas as revisões como novas
+        floor = min(watermarks.values()) if watermarks else 0
+        new_query = new_query.filter(or_(
+            FlashcardReview.id > floor,
+            FlashcardReview.user_id.notin_(list(watermarks))
+        ))
+
+    touched = {row[0] for row in new_query.distinct().all()}
+    if not touched:
+        return None
+
+    rows = db.session.query(
+        FlashcardReview.id,
+        FlashcardReview.user_id,
+        FlashcardReview.flashcard_id,
+        Flashcard.specialty,
+        FlashcardReview.quality_rating,
+        FlashcardReview.previous_interval,
+        FlashcardReview.reviewed_at
+    ).join(Flashcard, Flashcard.id == FlashcardReview.flashcard_id).filter(
+        FlashcardReview.flashcard_id.in_(touched),
+        FlashcardReview.quality_rating.isnot(None),
+        FlashcardReview.reviewed_at.isnot(None)
+    ).order_by(FlashcardReview.flashcard_id, FlashcardReview.reviewed_at, FlashcardReview.id).all()
+
+    if user_id is not None:
+        rows = [row for row in rows if row[1] == user_id]
+    if not rows:
+        return None
+
+    ids, users, cards, specialties, qualities, intervals, reviewed_at = zip(*rows)
+    epoch = min(reviewed_at)
+    return {
+        'id': np.array(ids, dtype=np.int64),
+        'user_id': np.array(users, dtype=np.int64),
+        'card': np.array(cards, dtype=np.int64),
+        'specialty': np.array(specialties, dtype=object),
+        'quality': np.array(qualities, dtype=np.int64),
+        'previous_interval': np.array([interval or 0 for interval in intervals], dtype=np.float64),
+        'time': np.array([(moment - epoch).total_seconds() / 86400 for moment in reviewed_at], dtype=np.float64)
+    }
+
+def _accumulate(reviews, watermarks):
+    """Contagens por (usuário, especialidade) das revisões novas, calculadas com arrays"""
+    card = reviews['card']
+    same_card = np.r_[False, card[1:] == card[:-1]]
+
+    # Posição da revisão no histórico do card e tempo desde a revisão anterior
+    start = np.flatnonzero(~same_card)
+    ordinal = np.arange(len(card)) - np.repeat(start, np.diff(np.r_[start, len(card)]))
+    elapsed = np.r_[0.0, np.diff(reviews['time'])]
+    previous_quality = np.r_[0, reviews['quality'][:-1]]
+
+    watermark = np.array([watermarks.get(int(user), 0) for user in reviews['user_id']], dtype=np.int64)
+    is_new = reviews['id'] > watermark
+    recalled = reviews['quality'] >= 3
+    first_grade = FSRSEngine.grade(previous_quality) - 1
+
+    second_review = is_new & (ordinal == 1) & (elapsed > 0)
+    later_review = is_new & (ordinal >= 2) & (reviews['previous_interval'] > 0)
+
+    elapsed_bin = np.clip(np.digitize(elapsed, ELAPSED_BINS) - 1, 0, len(ELAPSED_BINS) - 2)
+    ratio = np.where(reviews['previous_interval'] > 0, elapsed / np.maximum(reviews['previous_interval'], 1e-9), 0)
+    ratio_bin = np.clip(np.digitize(ratio, RATIO_BINS) - 1, 0, len(RATIO_BINS) - 2)
+
+    # Cada revisão conta para a especialidade e para o agregado do usuário (especialidade None)
+    keys = sorted({(int(u), s) for u, s in zip(reviews['user_id'][is_new], reviews['specialty'][is_new])})
+    keys += sorted({(user, None) for user, _ in keys})
+    index = {key: position for position, key in enumerate(keys)}
+    specialty_group = np.array([index.get((int(u), s), -1) for u, s in zip(reviews['user_id'], reviews['specialty'])])
+    user_group = np.array([index.get((int(u), None), -1) for u in reviews['user_id']])
+
+    groups = len(keys)
+    first_total = np.zeros((groups, 4, len(ELAPSED_BINS) - 1), dtype=np.int64)
+    first_recalled = np.zeros_like(first_total)
+    ratio_total = np.zeros((groups, len(RATIO_BINS) - 1), dtype=np.int64)
+    ratio_recalled = np.zeros_like(ratio_total)
+    latest_id = np.zeros(groups, dtype=np.int64)
+    new_reviews = np.zeros(groups, dtype=np.int64)
+
+    for group in (specialty_group, user_group):
+        valid = group >= 0
+        mask = second_review & valid
+        np.add.at(first_total, (group[mask], first_grade[mask], elapsed_bin[mask]), 1)
+        np.add.at(first_recalled, (group[mask], first_grade[mask], elapsed_bin[mask]), recalled[mask])
+
+        mask = later_review & valid
+        np.add.at(ratio_total, (group[mask], ratio_bin[mask]), 1)
+        np.add.at(ratio_recalled, (group[mask], ratio_bin[mask]), recalled[mask])
+
+        mask = is_new & valid
+        np.maximum.at(latest_id, group[mask], reviews['id'][mask])
+        np.add.at(new_reviews, group[mask], 1)
+
+    return keys, {
+        'first_total': first_total,
+        'first_recalled': first_recalled,
+        'ratio_total': ratio_total,
+        'ratio_recalled': ratio_recalled,
+        'latest_id': latest_id,
+        'new_reviews': new_reviews
+    }
+
+def optimize_scheduler_parameters(user_id=None):
+    """
+    Rotina offline: ajusta os parâmetros de agendamento por usuário e por especialidade a
+    partir do histórico de revisões. Processa só as revisões posteriores à última execução
+    (as contagens ficam guardadas em SchedulerParameters.statistics). Retorna quantos
+    conjuntos de parâmetros foram atualizados.
+    """
+    query = SchedulerParameters.query.filter(SchedulerParameters.specialty.is_(None))
+    if user_id is not None:
+        query = query.filter(SchedulerParameters.user_id == user_id)
+    watermarks = {row.user_id: row.last_review_id or 0 for row in query.all()}
+
+    reviews = _load_reviews(user_id, watermarks)
+    if reviews is None:
+        return 0
+
+    keys, counts = _accumulate(reviews, watermarks)
+
+    existing = {
+        (row.user_id, row.specialty): row for row in SchedulerParameters.query.filter(
+            SchedulerParameters.user_id.in_({user for user, _ in keys})
+        ).all()
+    }
+    user_latest = {}
+    for position, (user, specialty) in enumerate(keys):
+        user_latest[user] = max(user_latest.get(user, 0), int(counts['latest_id'][position]))
+
+    for position, key in enumerate(keys):
+        row = existing.get(key)
+        if row is None:
+            row = SchedulerParameters(user_id=key[0], specialty=key[1], reviews_fitted=0, last_review_id=0)
+            db.session.add(row)
+
+        statistics = row.get_statistics() or _empty_statistics()
+        parameters = row.get_parameters()
+
+        first_total = np.asarray(statistics['first_total']) + counts['first_total'][position]
+        first_recalled = np.asarray(statistics['first_recalled']) + counts['first_recalled'][position]
+        pending_total = np.asarray(statistics['pending_ratio_total']) + counts['ratio_total'][position]
+        pending_recalled = np.asarray(statistics['pending_ratio_recalled']) + counts['ratio_recalled'][position]
+
+        initial_stability = fit_initial_stability(first_total, first_recalled)
+        if any(value is not None for value in initial_stability):
+            parameters['initial_stability'] = [
+                value if value is not None else previous
+                for value, previous in zip(initial_stability, parameters.get('initial_stability', FSRS_DEFAULT_WEIGHTS[:4]))
+            ]
+
+        # O modificador é corrigido só com revisões agendadas sob o valor atual
+        if pending_total.sum() >= MIN_MODIFIER_REVIEWS:
+            observed = fit_interval_modifier(pending_total, pending_recalled)
+            weight = pending_total.sum() / (pending_total.sum() + MODIFIER_PRIOR_REVIEWS)
+            modifier = parameters.get('interval_modifier', 1.0) * observed ** weight
+            parameters['interval_modifier'] = round(float(np.clip(modifier, *MODIFIER_RANGE)), 4)
+            pending_total = np.zeros_like(pending_total)
+            pending_recalled = np.zeros_like(pending_recalled)
+
+        row.set_statistics({
+            'first_total': first_total.tolist(),
+            'first_recalled': first_recalled.tolist(),
+            'pending_ratio_total': pending_total.tolist(),
+            'pending_ratio_recalled': pending_recalled.tolist()
+        })
+        row.set_parameters(parameters)
+        row.reviews_fitted = (row.reviews_fitted or 0) + int(counts['new_reviews'][position])
+        row.last_review_id = user_latest[key[0]]
+
+    db.session.commit()
+    return len(keys)
+
+def load_scheduler_parameters(user_id):
+    """Parâmetros ajustados do usuário: {especialidade ou None: parâmetros}"""
+    rows = SchedulerParameters.query.filter_by(user_id=user_id).all()
+    return {
+        row.specialty: row.get_parameters() for row in rows
+        if row.specialty is None or (row.reviews_fitted or 0) >= MIN_SPECIALTY_REVIEWS
+    }
+
+def engine_options(engine_name, parameters):
+    """Converte os parâmetros ajustados nas opções do engine de agendamento"""
+    if not parameters:
+        return {}
+
+    modifier = parameters.get('interval_modifier', 1.0)
+    initial_stability = parameters.get('initial_stability')
+
+    if engine_name == 'fsrs':
+        weights = list(FSRS_DEFAULT_WEIGHTS)
+        if initial_stability:
+            weights[:4] = initial_stability
+        return {'weights': weights, 'interval_modifier': modifier}
+
+    options = {'interval_modifier': modifier}
+    if initial_stability:
+        # Primeiro intervalo: dias até a retenção cair a 90% após uma primeira revisão "bom"
+        options['first_interval'] = int(np.clip(round(initial_stability[2]), 1, 6))
+    options['second_interval'] = max(options.get('first_interval', 1), int(round(6 * modifier)))
+    return options
@@ -0,0 +1,33 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+_HOOKS_KEY = 'after_transaction_hooks'
+
+def after_transaction(session, key, callback):
+    """
+    Agenda callback para o fim da transação da sessão (commit ou rollback), uma vez por key.
+    Os caches em processo invalidam por aqui, e não no flush: antes do commit outra requisição
+    ainda leria o valor antigo e o guardaria como atual.
+    """
+    if session is None:
+        callback()
+        return
+    session.info.setdefault(_HOOKS_KEY, {})[key] = callback
+
+def after_transaction_of(target, key, callback):
+    """after_transaction para a sessão dona do objeto (usado nos eventos de mapper)"""
+    after_transaction(object_session(target), key, callback)
+
+def _run_hooks(session):
+    hooks = session.info.pop(_HOOKS_KEY, None)
+    if hooks:
+        for callback in hooks.values():
+            callback()
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    _run_hooks(session)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _after_soft_rollback(session, previous_transaction):
+    _run_hooks(session)
@@ -1,16 +1,70 @@
 from datetime import datetime, timedelta
-from src.models.user import db
+from src.models.user import db, User
 from src.models.flashcard import Flashcard, FlashcardReview
 from src.models.question import Question, UserAnswer
 from src.models.priority import UserTopicPriority, get_user_topic_priority
+from src.models.user_stats import record_flashcard_review_stats
+from src.services.scheduler import SCHEDULERS, get_scheduler, default_scheduler_name
+from src.services.scheduler_optimizer import load_scheduler_parameters, engine_options
+from src.services.retention_analytics import record_review_retention, retention_rate
+from src.services.flashcard_content import get_content_ids, derive_front, derive_back
+from src.services.due_balancer import (
+    DueDateBalancer, BALANCE_HORIZON_DAYS, MAX_CAP_DELAY_DAYS, fuzz_window, load_balancing_enabled,
+    load_metrics
+)
+from src.services.flashcard_stats_cache import flashcard_stats_cache
+from src.services.review_planner import (
+    NEAR_DUE_DAYS, GAIN_HORIZON_DAYS, NEW_CARD_GAIN_WEIGHT, estimate_review_seconds, select_cards
+)
 import math
 import random
+import numpy as np
+
+FORECAST_BUCKETS = ('day', 'week', 'month')
+
+# Limite de eventos por sincronização de revisões offline
+MAX_BATCH_REVIEWS = 1000
+
+def _parse_reviewed_at(value):
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return datetime.utcnow()
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+def _elapsed_days(previous, current):
+    """Dias (fracionários) desde a revisão anterior; 0 quando o card nunca foi revisado"""
+    if previous is None:
+        return 0.0
+    return max((current - previous).total_seconds() / 86400, 0.0)
+
+def _as_date(value):
+    """Normaliza o retorno de func.date (string no SQLite, date no PostgreSQL/MySQL)"""
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+def _forecast_bucket_key(target_date, base_date, bucket):
+    """Chave do agrupamento da previsão: dia, semana (a partir de hoje) ou mês do calendário"""
+    if bucket == 'week':
+        return (target_date - base_date).days // 7
+    if bucket == 'month':
+        return (target_date.year, target_date.month)
+    return target_date
 
 class SpacedRepetitionService:
-    """Serviço de repetição espaçada baseado no algoritmo SM-2 (SuperMemo)"""
+    """Serviço de repetição espaçada (SM-2 por padrão; o engine de agendamento é configurável)"""
     
-    def __init__(self, user_id):
+    def __init__(self, user_id, scheduler=None, load_balance=None):
         self.user_id = user_id
+        self._scheduler = scheduler
+        self.load_balance = load_balancing_enabled() if load_balance is None else load_balance
+        self._balancer = None
+        self._engine_name = None
+        self._parameters = None
+        self._engines = {}
         
         # Intervalos iniciais em dias (baseado na curva de esquecimento)
         self.initial_intervals = [1, 3, 7, 14, 30, 90, 180, 365]
@@ -20,56 +74,189 @@ class SpacedRepetitionService:
         self.default_ease_factor = 2.5
         self.max_ease_factor = 4.0
     
+    @property
+    def scheduler(self):
+        """Engine de agendamento escolhido pelo usuário (ou o padrão da instalação)"""
+        return self.scheduler_for(None)
+    
+    def scheduler_for(self, specialty=None):
+        """Engine com os parâmetros ajustados do usuário (por especialidade quando houver)"""
+        if self._scheduler is not None:
+            return self._scheduler
+        
+        if self._parameters is None:
+            engine_name = db.session.query(User.scheduler_engine).filter(User.id == self.user_id).scalar()
+            self._engine_name = engine_name if engine_name in SCHEDULERS else default_scheduler_name()
+            self._parameters = load_scheduler_parameters(self.user_id)
+        
+        key = specialty if specialty in self._parameters else None
+        if key not in self._engines:
+            self._engines[key] = get_scheduler(
+                self._engine_name, **engine_options(self._engine_name, self._parameters.get(key))
+            )
+        return self._engines[key]
+    
+    @property
+    def balancer(self):
+        """Balanceador de vencimentos com a carga diária atual do usuário (uma consulta por instância)"""
+        if self._balancer is None:
+            base_date, day_counts = self._due_day_counts(BALANCE_HORIZON_DAYS)
+            self._balancer = DueDateBalancer(base_date, day_counts)
+        return self._balancer
+    
+    def _schedule_due(self, flashcard, reviewed_at):
+        """Define o próximo vencimento: exato ou balanceado dentro da janela do intervalo"""
+        if not self.load_balance:
+            flashcard.next_review_date = reviewed_at + timedelta(days=flashcard.interval_days)
+            return
+        
+        self.balancer.release(flashcard.next_review_date)
+        flashcard.next_review_date = self.balancer.assign(reviewed_at, flashcard.interval_days)
+    
+    def _initial_due(self):
+        """Vencimento de um card novo (espalhado pelos primeiros dias no modo balanceado)"""
+        now = datetime.utcnow()
+        if not self.load_balance:
+            return now + timedelta(days=1)
+        return self.balancer.assign_new(now)
+    
+    def _replay_cards(self, cards, by_card):
+        """
+        Reaplica os eventos de cada card (by_card: {id: [(reviewed_at, qualidade)]}) agrupando
+        os cards por especialidade, já que cada uma pode ter parâmetros próprios.
+        Retorna {id do card: (resultado do engine, linha)}.
+        """
+        by_specialty = {}
+        for card in cards:
+            by_specialty.setdefault(card.specialty, []).append(card)
+        
+        replayed = {}
+        for specialty, group in by_specialty.items():
+            width = max(len(by_card[card.id]) for card in group)
+            
+            qualities = np.zeros((len(group), width), dtype=np.int64)
+            mask = np.zeros((len(group), width), dtype=bool)
+            elapsed_days = np.zeros((len(group), width), dtype=np.float64)
+            for row, card in enumerate(group):
+                card_events = by_card[card.id]
+                qualities[row, :len(card_events)] = [quality for _, quality in card_events]
+                mask[row, :len(card_events)] = True
+                
+                previous = card.last_reviewed
+                for step, (reviewed_at, _) in enumerate(card_events):
+                    elapsed_days[row, step] = _elapsed_days(previous, reviewed_at)
+                    previous = reviewed_at
+            
+            result = self.scheduler_for(specialty).replay(self._card_state(group), qualities, mask, elapsed_days)
+            for row, card in enumerate(group):
+                replayed[card.id] = (result, row)
+        
+        return replayed
+    
+    def _card_state(self, flashcards):
+        """Estado de agendamento dos cards no formato do engine"""
+        return {
+            'review_count': [card.review_count or 0 for card in flashcards],
+            'interval_days': [card.interval_days or 1 for card in flashcards],
+            'ease_factor': [card.ease_factor or self.default_ease_factor for card in flashcards],
+            'stability': [card.stability for card in flashcards],
+            'difficulty': [card.memory_difficulty for card in flashcards]
+        }
+    
+    @staticmethod
+    def _apply_state(flashcard, result, row):
+        flashcard.review_count = int(result['review_count'][row])
+        flashcard.interval_days = int(result['interval_days'][row])
+        flashcard.ease_factor = float(result['ease_factor'][row])
+        stability = float(result['stability'][row])
+        difficulty = float(result['difficulty'][row])
+        flashcard.stability = None if math.isnan(stability) else stability
+        flashcard.memory_difficulty = None if math.isnan(difficulty) else difficulty
+    
     def generate_flashcards_from_questions(self, limit=50):
-        """Gera flashcards automaticamente a partir de questões respondidas incorretamente"""
+        """
+        Gera flashcards automaticamente a partir de questões respondidas incorretamente.
+        Pipeline em lote: uma anti-junção encontra as questões erradas ainda sem flashcard,
+        o conteúdo derivado é reaproveitado da tabela compartilhada (só versões novas são
+        montadas) e os cards entram numa única inserção apontando para ele.
+        """
         try:
-            # Buscar questões respondidas incorretamente pelo usuário
-            incorrect_answers = db.session.query(UserAnswer, Question).join(
-                Question
+            # Última resposta incorreta por questão
+            incorrect = db.session.query(
+                UserAnswer.question_id.label('question_id'),
+                db.func.max(UserAnswer.answered_at).label('last_answered')
             ).filter(
                 UserAnswer.user_id == self.user_id,
                 UserAnswer.is_correct == False
-            ).order_by(UserAnswer.answered_at.desc()).limit(limit).all()
+            ).group_by(UserAnswer.question_id).subquery()
+            
+            # Anti-junção: questões erradas sem flashcard do usuário
+            questions = db.session.query(
+                Question.id,
+                Question.content,
+                Question.options,
+                Question.correct_answer,
+                Question.explanation,
+                Question.specialty,
+                Question.difficulty
+            ).join(
+                incorrect, incorrect.c.question_id == Question.id
+            ).outerjoin(
+                Flashcard, db.and_(
+                    Flashcard.question_id == Question.id,
+                    Flashcard.user_id == self.user_id
+                )
+            ).filter(
+                Flashcard.id.is_(None)
+            ).order_by(incorrect.c.last_answered.desc()).limit(limit).all()
             
-            flashcards_created = 0
+            if not questions:
+                return 0, None
             
-            for answer, question in incorrect_answers:
-                # Verificar se já existe flashcard para esta questão
-                existing_flashcard = Flashcard.query.filter_by(
-                    user_id=self.user_id,
-                    question_id=question.id
-                ).first()
-                
-                if not existing_flashcard:
-                    # Criar flashcard
-                    flashcard = self.create_flashcard_from_question(question)
-                    if flashcard:
-                        flashcards_created += 1
+            # Texto compartilhado: só deriva as versões de questão ainda sem conteúdo
+            content_ids = get_content_ids(questions)
+            
+            now = datetime.utcnow()
+            rows = [{
+                'user_id': self.user_id,
+                'question_id': question.id,
+                'specialty': question.specialty,
+                'content_id': content_ids[question.id],
+                'difficulty': question.difficulty,
+                'ease_factor': self.default_ease_factor,
+                'interval_days': 1,
+                'review_count': 0,
+                'next_review_date': self._initial_due(),
+                'is_active': True,
+                'is_custom': False,
+                'created_at': now,
+                'updated_at': now
+            } for question in questions]
+            
+            db.session.execute(Flashcard.__table__.insert(), rows)
+            db.session.commit()
             
-            return flashcards_created, None
+            return len(rows), None
             
         except Exception as e:
+            db.session.rollback()
             return 0, str(e)
     
     def create_flashcard_from_question(self, question):
         """Cria um flashcard a partir de uma questão"""
         try:
-            # Extrair conceito principal da questão
-            front_text = self.extract_concept_from_question(question)
-            
-            # Criar resposta baseada na explicação
-            back_text = self.create_answer_from_explanation(question)
+            # Frente e verso compartilhados (derivados uma vez por versão da questão)
+            content_ids = get_content_ids([question])
             
             flashcard = Flashcard(
                 user_id=self.user_id,
                 question_id=question.id,
                 specialty=question.specialty,
-                front_text=front_text,
-                back_text=back_text,
+                content_id=content_ids[question.id],
                 difficulty=question.difficulty,
                 ease_factor=self.default_ease_factor,
                 interval_days=1,
-                next_review_date=datetime.utcnow() + timedelta(days=1)
+                next_review_date=self._initial_due()
             )
             
             db.session.add(flashcard)
@@ -83,63 +270,35 @@ class SpacedRepetitionService:
     
     def extract_concept_from_question(self, question):
         """Extrai o conceito principal de uma questão para criar a frente do flashcard"""
-        # Simplificação: usar as primeiras palavras da questão
-        # Em uma implementação mais avançada, usaríamos NLP para extrair conceitos
-        
-        question_text = question.question_text
-        
-        # Tentar identificar padrões comuns em questões médicas
-        if "diagnóstico" in question_text.lower():
-            return f"Qual o diagnóstico mais provável para: {question_text[:100]}..."
-        elif "tratamento" in question_text.lower():
-            return f"Qual o tratamento indicado para: {question_text[:100]}..."
-        elif "exame" in question_text.lower():
-            return f"Qual exame é indicado para: {question_text[:100]}..."
-        else:
-            # Usar a questão completa se for curta, ou resumir
-            if len(question_text) <= 150:
-                return question_text
-            else:
-                return f"{question_text[:150]}..."
+        return derive_front(question)
     
     def create_answer_from_explanation(self, question):
         """Cria a resposta do flashcard baseada na explicação da questão"""
-        explanation = question.explanation or ""
-        correct_option = question.correct_option
-        
-        # Buscar a opção correta
-        correct_answer_text = ""
-        if question.options and correct_option in question.options:
-            correct_answer_text = question.options[correct_option]
-        
-        # Combinar resposta correta com explicação
-        back_text = f"**Resposta:** {correct_option}) {correct_answer_text}\n\n"
-        
-        if explanation:
-            back_text += f"**Explicação:** {explanation}"
-        
-        return back_text
+        return derive_back(question)
+    
+    def due_flashcards_query(self, now, limit=20):
+        """Consulta dos flashcards pendentes (também verificada por migrate_flashcard_schedule --check)"""
+        return Flashcard.query.filter(
+            Flashcard.user_id == self.user_id,
+            Flashcard.next_review_date <= now,
+            Flashcard.is_active == True
+        ).order_by(Flashcard.next_review_date.asc()).limit(limit)
     
     def get_due_flashcards(self, limit=20):
         """Retorna flashcards que estão prontos para revisão"""
         try:
-            now = datetime.utcnow()
-            
-            due_flashcards = Flashcard.query.filter(
-                Flashcard.user_id == self.user_id,
-                Flashcard.next_review_date <= now,
-                Flashcard.is_active == True
-            ).order_by(Flashcard.next_review_date.asc()).limit(limit).all()
+            due_flashcards = self.due_flashcards_query(datetime.utcnow(), limit).all()
             
             return due_flashcards, None
             
         except Exception as e:
             return [], str(e)
     
-    def review_flashcard(self, flashcard_id, quality_rating):
+    def review_flashcard(self, flashcard_id, quality_rating, time_spent=None):
         """
         Processa a revisão de um flashcard
         quality_rating: 0-5 (0=não lembrou, 5=lembrou perfeitamente)
+        time_spent: duração da revisão em segundos (opcional)
         """
         try:
             flashcard = Flashcard.query.get(flashcard_id)
@@ -153,11 +312,16 @@ class SpacedRepetitionService:
                 user_id=self.user_id,
                 quality_rating=quality_rating,
                 previous_interval=flashcard.interval_days,
-                previous_ease_factor=flashcard.ease_factor
+                previous_ease_factor=flashcard.ease_factor,
+                time_spent=time_spent
             )
             db.session.add(review)
+            record_flashcard_review_stats(self.user_id)
+            record_review_retention(self.user_id, [
+                (datetime.utcnow(), flashcard.specialty, flashcard.interval_days, quality_rating)
+            ])
             
-            # Atualizar flashcard usando algoritmo SM-2
+            # Atualizar flashcard usando o engine de agendamento
             self.update_flashcard_schedule(flashcard, quality_rating)
             
             # Atualizar prioridade do tópico
@@ -178,127 +342,375 @@ class SpacedRepetitionService:
             db.session.rollback()
             return None, str(e)
     
-    def update_flashcard_schedule(self, flashcard, quality_rating):
-        """Atualiza o cronograma do flashcard usando algoritmo SM-2 modificado"""
+    def review_flashcards_batch(self, events):
+        """
+        Sincroniza revisões feitas offline: events é uma lista de
+        {flashcard_id, quality_rating, reviewed_at, time_spent?}. As revisões são reaplicadas em ordem
+        cronológica (engine de agendamento vetorizado por card) e gravadas numa única transação.
+        Eventos anteriores à última revisão já registrada do card são ignorados, o que
+        torna o reenvio do mesmo lote idempotente.
+        """
+        try:
+            if len(events) > MAX_BATCH_REVIEWS:
+                return None, f"Máximo de {MAX_BATCH_REVIEWS} revisões por lote"
+            
+            parsed = []
+            durations = {}
+            for position, event in enumerate(events):
+                quality_rating = event.get('quality_rating')
+                if not isinstance(quality_rating, int) or not (0 <= quality_rating <= 5):
+                    return None, f"quality_rating inválido na revisão {position}"
+                time_spent = event.get('time_spent')
+                if time_spent is not None and (not isinstance(time_spent, int) or time_spent < 0):
+                    return None, f"time_spent inválido na revisão {position}"
+                durations[position] = time_spent
+                parsed.append((
+                    _parse_reviewed_at(event.get('reviewed_at')),
+                    position,
+                    event.get('flashcard_id'),
+                    quality_rating
+                ))
+            
+            flashcard_ids = {event[2] for event in parsed}
+            flashcards = {
+                flashcard.id: flashcard for flashcard in Flashcard.query.filter(
+                    Flashcard.id.in_(flashcard_ids),
+                    Flashcard.user_id == self.user_id
+                ).all()
+            } if flashcard_ids else {}
+            
+            # Ordem cronológica (a posição no lote desempata eventos simultâneos)
+            by_card = {}
+            card_durations = {}
+            skipped = []
+            for reviewed_at, position, flashcard_id, quality_rating in sorted(parsed, key=lambda e: (e[0], e[1])):
+                flashcard = flashcards.get(flashcard_id)
+                if flashcard is None or (flashcard.last_reviewed and reviewed_at <= flashcard.last_reviewed):
+                    skipped.append(flashcard_id)
+                    continue
+                by_card.setdefault(flashcard_id, []).append((reviewed_at, quality_rating))
+                card_durations.setdefault(flashcard_id, []).append(durations[position])
+            
+            if not by_card:
+                return {'applied': 0, 'skipped': skipped, 'flashcards': []}, None
+            
+            cards = [flashcards[card_id] for card_id in by_card]
+            replayed = self._replay_cards(cards, by_card)
+            
+            review_rows = []
+            reviews_by_day = {}
+            for card in cards:
+                result, row = replayed[card.id]
+                card_events = by_card[card.id]
+                for step, (reviewed_at, quality_rating) in enumerate(card_events):
+                    interval = int(result['new_interval'][row, step])
+                    review_rows.append({
+                        'user_id': self.user_id,
+                        'flashcard_id': card.id,
+                        'quality_rating': quality_rating,
+                        'previous_interval': int(result['previous_interval'][row, step]),
+                        'previous_ease_factor': float(result['previous_ease_factor'][row, step]),
+                        'reviewed_at': reviewed_at,
+                        'time_spent': card_durations[card.id][step],
+                        'last_quality': quality_rating,
+                        'last_review_date': reviewed_at.date(),
+                        'interval': interval,
+                        'next_review_date': reviewed_at.date() + timedelta(days=interval)
+                    })
+                    reviews_by_day[reviewed_at.date()] = reviews_by_day.get(reviewed_at.date(), 0) + 1
+                
+                last_reviewed = card_events[-1][0]
+                self._apply_state(card, result, row)
+                self._schedule_due(card, last_reviewed)
+                card.last_reviewed = last_reviewed
+            
+            db.session.execute(FlashcardReview.__table__.insert(), review_rows)
+            
+            for day, count in reviews_by_day.items():
+                record_flashcard_review_stats(self.user_id, count, day)
+            record_review_retention(self.user_id, [
+                (row['reviewed_at'], flashcards[row['flashcard_id']].specialty, row['previous_interval'], row['quality_rating'])
+                for row in review_rows
+            ])
+            
+            # Desempenho por tópico na mesma ordem cronológica
+            priorities = {}
+            for reviewed_at, position, flashcard_id, quality_rating in sorted(parsed, key=lambda e: (e[0], e[1])):
+                if flashcard_id not in by_card:
+                    continue
+                specialty = flashcards[flashcard_id].specialty
+                if specialty not in priorities:
+                    priorities[specialty] = get_user_topic_priority(self.user_id, specialty)
+                priorities[specialty].update_performance(quality_rating >= 3)
+            
+            db.session.commit()
+            
+            return {
+                'applied': len(review_rows),
+                'skipped': skipped,
+                'flashcards': [card.to_dict() for card in cards]
+            }, None
+            
+        except Exception as e:
+            db.session.rollback()
+            return None, str(e)
+    
+    def update_flashcard_schedule(self, flashcard, quality_rating, reviewed_at=None):
+        """Atualiza o cronograma do flashcard com o engine de agendamento do usuário (SM-2 ou FSRS)"""
+        reviewed_at = reviewed_at or datetime.utcnow()
         
-        # Incrementar contador de revisões
-        flashcard.review_count += 1
+        result = self.scheduler_for(flashcard.specialty).replay(
+            self._card_state([flashcard]),
+            np.array([[quality_rating]], dtype=np.int64),
+            np.ones((1, 1), dtype=bool),
+            np.array([[_elapsed_days(flashcard.last_reviewed, reviewed_at)]], dtype=np.float64)
+        )
+        self._apply_state(flashcard, result, 0)
         
-        if quality_rating < 3:
-            # Resposta incorreta - resetar intervalo
-            flashcard.interval_days = 1
-            flashcard.ease_factor = max(
-                self.min_ease_factor,
-                flashcard.ease_factor - 0.2
-            )
-        else:
-            # Resposta correta - calcular próximo intervalo
-            if flashcard.review_count == 1:
-                flashcard.interval_days = 1
-            elif flashcard.review_count == 2:
-                flashcard.interval_days = 6
-            else:
-                # Usar fórmula SM-2
-                flashcard.interval_days = int(
-                    flashcard.interval_days * flashcard.ease_factor
-                )
+        # Calcular próxima data de revisão
+        self._schedule_due(flashcard, reviewed_at)
+        flashcard.last_reviewed = reviewed_at
+    
+    def get_retrievability_curve(self, flashcard_id, days=30):
+        """Curva de retenção prevista pelo engine do usuário a partir da última revisão do card"""
+        try:
+            flashcard = Flashcard.query.get(flashcard_id)
             
-            # Ajustar ease factor baseado na qualidade
-            ease_adjustment = 0.1 - (5 - quality_rating) * (0.08 + (5 - quality_rating) * 0.02)
-            flashcard.ease_factor = max(
-                self.min_ease_factor,
-                min(self.max_ease_factor, flashcard.ease_factor + ease_adjustment)
+            if not flashcard or flashcard.user_id != self.user_id:
+                return None, "Flashcard não encontrado"
+            
+            state = {key: values[0] for key, values in self._card_state([flashcard]).items()}
+            scheduler = self.scheduler_for(flashcard.specialty)
+            curve = scheduler.retrievability_curve(
+                {key: (np.nan if value is None else value) for key, value in state.items()}, days
             )
+            start = flashcard.last_reviewed or datetime.utcnow()
+            
+            return {
+                'flashcard_id': flashcard.id,
+                'engine': scheduler.name,
+                'curve': [
+                    {'date': (start + timedelta(days=i)).date().isoformat(), 'retrievability': round(float(r), 4)}
+                    for i, r in enumerate(curve)
+                ]
+            }, None
+            
+        except Exception as e:
+            return None, str(e)
+    
+    def flashcard_stats_query(self, now):
+        """Contagens por status com SUM(CASE), agrupadas por especialidade"""
+        return db.session.query(
+            Flashcard.specialty,
+            db.func.count(Flashcard.id).label('total'),
+            db.func.sum(db.case((Flashcard.next_review_date <= now, 1), else_=0)).label('due'),
+            db.func.sum(db.case((Flashcard.review_count < 3, 1), else_=0)).label('learning'),
+            db.func.sum(db.case(
+                (db.and_(Flashcard.review_count >= 3, Flashcard.interval_days >= 21), 1), else_=0
+            )).label('mature'),
+            db.func.avg(Flashcard.ease_factor).label('avg_ease'),
+            db.func.avg(Flashcard.interval_days).label('avg_interval'),
+            db.func.min(db.case((Flashcard.next_review_date > now, Flashcard.next_review_date))).label('next_due')
+        ).filter(
+            Flashcard.user_id == self.user_id,
+            Flashcard.is_active == True
+        ).group_by(Flashcard.specialty)
+    
+    def _compute_flashcard_stats(self, now):
+        """
+        Estatísticas em uma única consulta (flashcard_stats_query); os totais são somados a partir
+        das contagens por especialidade. Também retorna o próximo vencimento futuro (usado para
+        expirar o cache).
+        """
+        rows = self.flashcard_stats_query(now).all()
         
-        # Calcular próxima data de revisão
-        flashcard.next_review_date = datetime.utcnow() + timedelta(days=flashcard.interval_days)
-        flashcard.last_reviewed = datetime.utcnow()
+        specialty_data = []
+        totals = {'total': 0, 'due': 0, 'learning': 0, 'mature': 0}
+        for stat in rows:
+            for field in totals:
+                totals[field] += getattr(stat, field) or 0
+            specialty_data.append({
+                'specialty': stat.specialty,
+                'total_flashcards': stat.total,
+                'due_flashcards': stat.due or 0,
+                'learning_flashcards': stat.learning or 0,
+                'mature_flashcards': stat.mature or 0,
+                'average_ease': round(stat.avg_ease, 2) if stat.avg_ease else 0,
+                'average_interval': round(stat.avg_interval, 1) if stat.avg_interval else 0
+            })
+        
+        next_due = min((stat.next_due for stat in rows if stat.next_due is not None), default=None)
+        
+        return {
+            'total_flashcards': totals['total'],
+            'due_flashcards': totals['due'],
+            'learning_flashcards': totals['learning'],
+            'mature_flashcards': totals['mature'],
+            'by_specialty': specialty_data
+        }, next_due
+    
+    def flashcard_stats_key_query(self):
+        """MAX/COUNT que identifica a versão das estatísticas em cache"""
+        return db.session.query(
+            db.func.max(Flashcard.last_reviewed),
+            db.func.count(Flashcard.id)
+        ).filter(
+            Flashcard.user_id == self.user_id,
+            Flashcard.is_active == True
+        )
     
-    def get_flashcard_stats(self):
-        """Retorna estatísticas dos flashcards do usuário"""
+    def get_flashcard_stats(self, cached=False):
+        """
+        Retorna estatísticas dos flashcards do usuário.
+        cached: reaproveita o resultado enquanto não houver revisão nova, card criado/desativado
+        ou card vencendo desde o último cálculo (a verificação é uma consulta de MAX/COUNT).
+        """
         try:
-            total_flashcards = Flashcard.query.filter_by(
-                user_id=self.user_id,
-                is_active=True
-            ).count()
-            
-            # Flashcards por status
             now = datetime.utcnow()
             
-            due_count = Flashcard.query.filter(
-                Flashcard.user_id == self.user_id,
-                Flashcard.next_review_date <= now,
-                Flashcard.is_active == True
-            ).count()
+            if not cached:
+                return self._compute_flashcard_stats(now)[0], None
             
-            learning_count = Flashcard.query.filter(
-                Flashcard.user_id == self.user_id,
-                Flashcard.review_count < 3,
-                Flashcard.is_active == True
-            ).count()
+            key = tuple(self.flashcard_stats_key_query().one())
             
-            mature_count = Flashcard.query.filter(
-                Flashcard.user_id == self.user_id,
-                Flashcard.review_count >= 3,
-                Flashcard.interval_days >= 21,
-                Flashcard.is_active == True
-            ).count()
-            
-            # Estatísticas por especialidade
-            specialty_stats = db.session.query(
-                Flashcard.specialty,
-                db.func.count(Flashcard.id).label('total'),
-                db.func.avg(Flashcard.ease_factor).label('avg_ease'),
-                db.func.avg(Flashcard.interval_days).label('avg_interval')
-            ).filter(
+            stats = flashcard_stats_cache.get(self.user_id, key, now)
+            if stats is None:
+                stats, next_due = self._compute_flashcard_stats(now)
+                flashcard_stats_cache.put(self.user_id, key, stats, next_due)
+            
+            return stats, None
+            
+        except Exception as e:
+            return {}, str(e)
+    
+    def due_day_counts_query(self, window_end):
+        """Vencimentos agrupados por dia até window_end (exclusivo), atrasados incluídos"""
+        review_day = db.func.date(Flashcard.next_review_date)
+        
+        # Predicado por intervalo (sem função sobre a coluna) para usar o índice
+        return db.session.query(
+            review_day.label('day'),
+            db.func.count(Flashcard.id)
+        ).filter(
+            Flashcard.user_id == self.user_id,
+            Flashcard.is_active == True,
+            Flashcard.next_review_date < window_end
+        ).group_by(review_day)
+    
+    def _due_day_counts(self, days):
+        """
+        Contagem de vencimentos por dia a partir de hoje numa única consulta agrupada
+        (atrasados entram no dia 0). Retorna (data base, lista de contagens).
+        """
+        base_date = datetime.utcnow().date()
+        window_end = datetime.combine(base_date + timedelta(days=days), datetime.min.time())
+        rows = self.due_day_counts_query(window_end).all()
+        
+        day_counts = [0] * days
+        for day, count in rows:
+            offset = max((_as_date(day) - base_date).days, 0)
+            if offset < days:
+                day_counts[offset] += count
+        
+        return base_date, day_counts
+    
+    def get_review_load(self, days=30):
+        """Carga diária de revisões prevista e suas métricas de distribuição"""
+        try:
+            base_date, day_counts = self._due_day_counts(days)
+            
+            return {
+                'days': [
+                    {'date': (base_date + timedelta(days=i)).isoformat(), 'flashcards_due': count}
+                    for i, count in enumerate(day_counts)
+                ],
+                'metrics': load_metrics(day_counts)
+            }, None
+            
+        except Exception as e:
+            return None, str(e)
+    
+    def rebalance_due_dates(self, days=30):
+        """
+        Redistribui os vencimentos futuros (a partir de amanhã) dentro da janela de cada
+        intervalo, respeitando o limite diário. Retorna as métricas de carga antes e depois.
+        """
+        try:
+            base_date, before = self._due_day_counts(days)
+            tomorrow = datetime.combine(base_date + timedelta(days=1), datetime.min.time())
+            
+            flashcards = Flashcard.query.filter(
                 Flashcard.user_id == self.user_id,
-                Flashcard.is_active == True
-            ).group_by(Flashcard.specialty).all()
-            
-            specialty_data = []
-            for stat in specialty_stats:
-                specialty_data.append({
-                    'specialty': stat.specialty,
-                    'total_flashcards': stat.total,
-                    'average_ease': round(stat.avg_ease, 2) if stat.avg_ease else 0,
-                    'average_interval': round(stat.avg_interval, 1) if stat.avg_interval else 0
-                })
+                Flashcard.is_active == True,
+                Flashcard.next_review_date >= tomorrow,
+                Flashcard.next_review_date < tomorrow + timedelta(days=days - 1)
+            ).order_by(Flashcard.next_review_date.asc()).all()
+            
+            # Parte da carga que não se move (hoje e atrasados) e reatribui o restante;
+            # a margem além do horizonte acomoda as janelas dos últimos dias
+            margin = fuzz_window(days)[1] - days + MAX_CAP_DELAY_DAYS
+            balancer = DueDateBalancer(base_date, [before[0]] + [0] * (days - 1 + margin))
+            moved = 0
+            for flashcard in flashcards:
+                reviewed_at = flashcard.last_reviewed or flashcard.created_at or datetime.utcnow()
+                interval = max((flashcard.next_review_date.date() - reviewed_at.date()).days, 1)
+                low, high = fuzz_window(interval)
+                
+                # Nunca antecipa para hoje nem para antes da revisão
+                offset = (reviewed_at.date() - base_date).days
+                window = (max(low, 1 - offset), max(high, 1 - offset))
+                due = balancer.assign(reviewed_at, interval, window)
+                
+                if due.date() != flashcard.next_review_date.date():
+                    flashcard.next_review_date = due
+                    moved += 1
+            
+            db.session.commit()
             
             return {
-                'total_flashcards': total_flashcards,
-                'due_flashcards': due_count,
-                'learning_flashcards': learning_count,
-                'mature_flashcards': mature_count,
-                'by_specialty': specialty_data
+                'moved': moved,
+                'before': load_metrics(before),
+                'after': balancer.metrics(days)
             }, None
             
         except Exception as e:
-            return {}, str(e)
+            db.session.rollback()
+            return None, str(e)
     
-    def get_study_forecast(self, days=7):
-        """Retorna previsão de flashcards para os próximos dias"""
+    def get_study_forecast(self, days=7, bucket='day'):
+        """
+        Retorna previsão de flashcards para os próximos dias com uma única consulta
+        agrupada por data. Flashcards atrasados entram no dia 0. bucket: day, week ou month.
+        """
         try:
-            forecast = []
-            base_date = datetime.utcnow().date()
+            if bucket not in FORECAST_BUCKETS:
+                return [], f"bucket inválido: use {', '.join(FORECAST_BUCKETS)}"
+            
+            base_date, day_counts = self._due_day_counts(days)
             
-            for i in range(days):
+            forecast = []
+            for i, count in enumerate(day_counts):
                 target_date = base_date + timedelta(days=i)
-                start_datetime = datetime.combine(target_date, datetime.min.time())
-                end_datetime = datetime.combine(target_date, datetime.max.time())
+                key = _forecast_bucket_key(target_date, base_date, bucket)
                 
-                count = Flashcard.query.filter(
-                    Flashcard.user_id == self.user_id,
-                    Flashcard.next_review_date >= start_datetime,
-                    Flashcard.next_review_date <= end_datetime,
-                    Flashcard.is_active == True
-                ).count()
+                if forecast and forecast[-1]['_key'] == key:
+                    forecast[-1]['flashcards_due'] += count
+                    forecast[-1]['end_date'] = target_date.isoformat()
+                    continue
                 
                 forecast.append({
+                    '_key': key,
                     'date': target_date.isoformat(),
+                    'end_date': target_date.isoformat(),
                     'flashcards_due': count,
                     'is_today': i == 0
                 })
             
+            for entry in forecast:
+                del entry['_key']
+                if bucket == 'day':
+                    del entry['end_date']
+            
             return forecast, None
             
         except Exception as e:
@@ -315,7 +727,7 @@ class SpacedRepetitionService:
                 difficulty=difficulty,
                 ease_factor=self.default_ease_factor,
                 interval_days=1,
-                next_review_date=datetime.utcnow() + timedelta(days=1),
+                next_review_date=self._initial_due(),
                 is_custom=True
             )
             
@@ -329,53 +741,121 @@ class SpacedRepetitionService:
             return None, str(e)
     
     def get_retention_rate(self, days=30):
-        """Calcula taxa de retenção dos flashcards"""
+        """Calcula taxa de retenção dos flashcards (rollup diário, sem carregar as revisões)"""
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
-            
-            # Reviews dos últimos X dias
-            recent_reviews = FlashcardReview.query.filter(
-                FlashcardReview.user_id == self.user_id,
-                FlashcardReview.reviewed_at >= cutoff_date
-            ).all()
-            
-            if not recent_reviews:
-                return 0, None
-            
-            # Considerar correto se quality_rating >= 3
-            correct_reviews = [r for r in recent_reviews if r.quality_rating >= 3]
-            retention_rate = (len(correct_reviews) / len(recent_reviews)) * 100
-            
-            return round(retention_rate, 2), None
+            return retention_rate(self.user_id, days), None
             
         except Exception as e:
             return 0, str(e)
     
+    def _review_time_snapshot(self):
+        """Média e quantidade de revisões cronometradas por card do usuário"""
+        return db.session.query(
+            FlashcardReview.flashcard_id.label('flashcard_id'),
+            db.func.avg(FlashcardReview.time_spent).label('mean_seconds'),
+            db.func.count(FlashcardReview.time_spent).label('timed_reviews')
+        ).filter(
+            FlashcardReview.user_id == self.user_id,
+            FlashcardReview.time_spent.isnot(None)
+        ).group_by(FlashcardReview.flashcard_id).subquery()
+    
+    def _deck_snapshot(self, now, horizon):
+        """
+        Snapshot em arrays dos cards vencidos ou que vencem até `horizon` (uma consulta, sem
+        carregar objetos), já com o tempo médio de revisão de cada card e os dias desde a
+        última revisão em relação a `now`.
+        """
+        times = self._review_time_snapshot()
+        rows = db.session.query(
+            Flashcard.id,
+            Flashcard.specialty,
+            Flashcard.review_count,
+            Flashcard.interval_days,
+            Flashcard.stability,
+            Flashcard.last_reviewed,
+            Flashcard.next_review_date,
+            times.c.mean_seconds,
+            times.c.timed_reviews
+        ).outerjoin(times, times.c.flashcard_id == Flashcard.id).filter(
+            Flashcard.user_id == self.user_id,
+            Flashcard.is_active == True,
+            Flashcard.next_review_date <= horizon
+        ).all()
+        
+        if not rows:
+            return None
+        
+        columns = list(zip(*rows))
+        return {
+            'id': np.array(columns[0], dtype=np.int64),
+            'specialty': np.array(columns[1], dtype=object),
+            'review_count': np.array([value or 0 for value in columns[2]], dtype=np.int64),
+            'interval_days': np.array([value or 1 for value in columns[3]], dtype=np.int64),
+            'stability': np.array([np.nan if value is None else value for value in columns[4]], dtype=np.float64),
+            'elapsed_days': np.array([_elapsed_days(value, now) for value in columns[5]], dtype=np.float64),
+            'is_due': np.array([value <= now for value in columns[6]], dtype=bool),
+            'mean_seconds': np.array([np.nan if value is None else float(value) for value in columns[7]], dtype=np.float64),
+            'timed_reviews': np.array([value or 0 for value in columns[8]], dtype=np.int64)
+        }
+    
+    def _retention_gains(self, deck):
+        """
+        Ganho esperado de revisar cada card agora: quanto da retenção prevista para daqui a
+        GAIN_HORIZON_DAYS dias seria perdida sem a revisão (1 - R). Cards novos recebem
+        NEW_CARD_GAIN_WEIGHT da retenção de um card recém-aprendido.
+        """
+        elapsed = np.maximum(deck['elapsed_days'], 0.0) + GAIN_HORIZON_DAYS
+        
+        retrievability = np.ones(len(deck['id']))
+        specialties, groups = np.unique(deck['specialty'].astype(str), return_inverse=True)
+        for index, specialty in enumerate(specialties):
+            mask = groups == index
+            state = {key: deck[key][mask] for key in ('interval_days', 'stability')}
+            retrievability[mask] = self.scheduler_for(specialty).retrievability(state, elapsed[mask])
+        
+        # Retenção de um card recém-aprendido (intervalo de 1 dia, sem estado de memória)
+        learned = self.scheduler.retrievability(
+            {'interval_days': np.ones(1), 'stability': np.full(1, np.nan)},
+            np.full(1, float(GAIN_HORIZON_DAYS))
+        )[0]
+        return np.where(deck['review_count'] == 0, NEW_CARD_GAIN_WEIGHT * learned, 1 - retrievability)
+    
     def optimize_study_session(self, available_time_minutes=15):
-        """Otimiza uma sessão de estudo baseada no tempo disponível"""
+        """
+        Monta a sessão que maximiza o ganho esperado de retenção dentro do tempo disponível.
+        Candidatos: cards vencidos e os que vencem nos próximos NEAR_DUE_DAYS dias; o tempo de
+        cada card vem do seu histórico de revisões e a seleção é uma mochila sobre o snapshot.
+        """
         try:
-            # Estimar tempo por flashcard (média de 30 segundos)
-            estimated_time_per_card = 0.5  # minutos
-            max_cards = int(available_time_minutes / estimated_time_per_card)
-            
-            # Buscar flashcards devido, priorizando os mais atrasados
-            due_flashcards, error = self.get_due_flashcards(limit=max_cards)
-            
-            if error:
-                return [], error
-            
-            # Se não há flashcards devido, buscar alguns para revisão antecipada
-            if not due_flashcards:
-                upcoming_flashcards = Flashcard.query.filter(
-                    Flashcard.user_id == self.user_id,
-                    Flashcard.next_review_date <= datetime.utcnow() + timedelta(days=1),
-                    Flashcard.is_active == True
-                ).order_by(Flashcard.next_review_date.asc()).limit(max_cards // 2).all()
-                
-                return upcoming_flashcards, None
+            now = datetime.utcnow()
+            deck = self._deck_snapshot(now, now + timedelta(days=NEAR_DUE_DAYS))
             
-            return due_flashcards, None
+            if deck is None:
+                return {'flashcards': [], 'estimated_seconds': 0, 'expected_gain': 0, 'due': 0, 'near_due': 0}, None
+            
+            timed = deck['timed_reviews'] > 0
+            user_mean = (
+                float((deck['mean_seconds'][timed] * deck['timed_reviews'][timed]).sum() / deck['timed_reviews'][timed].sum())
+                if timed.any() else None
+            )
+            seconds = estimate_review_seconds(deck['mean_seconds'], deck['timed_reviews'], user_mean)
+            gains = self._retention_gains(deck)
+            
+            chosen = select_cards(gains, seconds, available_time_minutes * 60)
+            
+            flashcards = {
+                card.id: card for card in Flashcard.query.filter(Flashcard.id.in_(deck['id'][chosen].tolist())).all()
+            } if len(chosen) else {}
+            due = deck['is_due'][chosen]
+            
+            return {
+                'flashcards': [flashcards[card_id] for card_id in deck['id'][chosen].tolist()],
+                'estimated_seconds': int(round(float(seconds[chosen].sum()))),
+                'expected_gain': round(float(gains[chosen].sum()), 3),
+                'due': int(due.sum()),
+                'near_due': int((~due).sum())
+            }, None
             
         except Exception as e:
-            return [], str(e)
+            return None, str(e)
 
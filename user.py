@@ -22,12 +22,16 @@ class User(db.Model):
     avatar_url = db.Column(db.String(255))
     target_specialty = db.Column(db.String(100))
     daily_goal = db.Column(db.Integer, default=10)  # questões por dia
+    scheduler_engine = db.Column(db.String(20))  # sm2 ou fsrs (None = padrão da instalação)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     
+    # Versão dos tokens (incrementar revoga todos os tokens emitidos)
+    token_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    
     # Relacionamentos
     answers = db.relationship('UserAnswer', backref='user', lazy=True)
     flashcard_reviews = db.relationship('FlashcardReview', backref='user', lazy=True)
@@ -45,10 +49,15 @@ class User(db.Model):
     def generate_token(self):
         payload = {
             'user_id': self.id,
+            'ver': self.token_version or 0,
             'exp': datetime.utcnow() + timedelta(days=7)
         }
         return jwt.encode(payload, os.environ.get('SECRET_KEY', 'default-secret'), algorithm='HS256')
 
+    def revoke_tokens(self):
+        """Invalida todos os tokens emitidos até agora"""
+        self.token_version = (self.token_version or 0) + 1
+
     def add_xp(self, points):
         self.xp += points
         new_level = (self.xp // 100) + 1
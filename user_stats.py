@@ -0,0 +1,442 @@
+from src.models.user import db
+from src.models.achievement import Leaderboard, get_week_start, record_leaderboard_activity
+from datetime import datetime, timedelta
+
+class UserStats(db.Model):
+    """Contadores agregados do usuário, atualizados na mesma transação de cada resposta/revisão"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+
+    # Contadores
+    total_answered = db.Column(db.Integer, default=0, nullable=False)
+    total_correct = db.Column(db.Integer, default=0, nullable=False)
+    total_time_spent = db.Column(db.Integer, default=0, nullable=False)  # em segundos
+    flashcards_reviewed = db.Column(db.Integer, default=0, nullable=False)
+    sessions_completed = db.Column(db.Integer, default=0, nullable=False)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def get_accuracy_rate(self):
+        if not self.total_answered:
+            return 0
+        return (self.total_correct / self.total_answered) * 100
+
+    def to_dict(self):
+        return {
+            'total_answered': self.total_answered,
+            'total_correct': self.total_correct,
+            'accuracy_rate': round(self.get_accuracy_rate(), 2),
+            'total_time_spent': self.total_time_spent,
+            'flashcards_reviewed': self.flashcards_reviewed,
+            'sessions_completed': self.sessions_completed,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class DailyActivity(db.Model):
+    """Rollup diário (user_id, day) da atividade do usuário, mantido a cada escrita"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+
+    # Contadores do dia
+    questions_answered = db.Column(db.Integer, default=0, nullable=False)
+    correct_answers = db.Column(db.Integer, default=0, nullable=False)
+    seconds_studied = db.Column(db.Integer, default=0, nullable=False)
+    flashcards_reviewed = db.Column(db.Integer, default=0, nullable=False)
+    xp_earned = db.Column(db.Integer, default=0, nullable=False)
+
+    # Índice único (também atende às leituras por intervalo de dias)
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='unique_user_day_activity'),)
+
+    def get_accuracy_rate(self):
+        if not self.questions_answered:
+            return 0
+        return (self.correct_answers / self.questions_answered) * 100
+
+    def to_dict(self):
+        return {
+            'date': self.day.isoformat(),
+            'questions_answered': self.questions_answered,
+            'correct_answers': self.correct_answers,
+            'accuracy_rate': round(self.get_accuracy_rate(), 2),
+            'seconds_studied': self.seconds_studied,
+            'flashcards_reviewed': self.flashcards_reviewed,
+            'xp_earned': self.xp_earned
+        }
+
+class DailyRetention(db.Model):
+    """
+    Rollup diário das revisões de flashcards por (user_id, day, specialty, interval_bucket):
+    quantas revisões houve e quantas foram lembradas (quality_rating >= 3).
+    interval_bucket é o índice da faixa do intervalo que estava sendo testado (ver retention_analytics).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    specialty = db.Column(db.String(100), nullable=False)
+    interval_bucket = db.Column(db.Integer, nullable=False)
+
+    # Contadores do dia
+    reviews = db.Column(db.Integer, default=0, nullable=False)
+    recalled = db.Column(db.Integer, default=0, nullable=False)
+
+    # Índice único (também atende às leituras por intervalo de dias)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', 'specialty', 'interval_bucket', name='unique_user_day_retention'),
+    )
+
+def get_user_stats(user_id):
+    """Obtém ou cria os contadores do usuário (sem commit; persiste junto com a transação atual)"""
+    stats = UserStats.query.filter_by(user_id=user_id).first()
+
+    if not stats:
+        stats = UserStats(
+            user_id=user_id,
+            total_answered=0,
+            total_correct=0,
+            total_time_spent=0,
+            flashcards_reviewed=0,
+            sessions_completed=0
+        )
+        db.session.add(stats)
+        db.session.flush()
+
+    return stats
+
+def read_user_stats(user_id):
+    """Leitura O(1) dos contadores; usuários sem registro recebem contadores zerados (não persistidos)"""
+    stats = UserStats.query.filter_by(user_id=user_id).first()
+
+    if not stats:
+        stats = UserStats(
+            user_id=user_id,
+            total_answered=0,
+            total_correct=0,
+            total_time_spent=0,
+            flashcards_reviewed=0,
+            sessions_completed=0
+        )
+
+    return stats
+
+def _increment(user_id, **deltas):
+    """Incrementa contadores no próprio SQL (col = col + delta) para não perder atualizações concorrentes"""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    updated = db.session.query(UserStats).filter(UserStats.user_id == user_id).update(
+        {getattr(UserStats, field): getattr(UserStats, field) + value for field, value in deltas.items()},
+        synchronize_session='fetch'
+    )
+
+    if not updated:
+        stats = get_user_stats(user_id)
+        for field, value in deltas.items():
+            setattr(stats, field, getattr(stats, field) + value)
+
+def _increment_daily(user_id, day=None, **deltas):
+    """Incrementa o rollup do dia (cria a linha do dia na primeira atividade)"""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    day = day or datetime.utcnow().date()
+
+    updated = db.session.query(DailyActivity).filter(
+        DailyActivity.user_id == user_id,
+        DailyActivity.day == day
+    ).update(
+        {getattr(DailyActivity, field): getattr(DailyActivity, field) + value for field, value in deltas.items()},
+        synchronize_session='fetch'
+    )
+
+    if not updated:
+        activity = DailyActivity(
+            user_id=user_id,
+            day=day,
+            questions_answered=0,
+            correct_answers=0,
+            seconds_studied=0,
+            flashcards_reviewed=0,
+            xp_earned=0
+        )
+        for field, value in deltas.items():
+            setattr(activity, field, value)
+        db.session.add(activity)
+        db.session.flush()
+
+def get_daily_activity(user_id, start_day, end_day=None):
+    """Leitura por intervalo do rollup diário: {dia: DailyActivity}"""
+    query = DailyActivity.query.filter(
+        DailyActivity.user_id == user_id,
+        DailyActivity.day >= start_day
+    )
+
+    if end_day is not None:
+        query = query.filter(DailyActivity.day <= end_day)
+
+    return {activity.day: activity for activity in query.order_by(DailyActivity.day).all()}
+
+def sum_daily_activity(user_id, start_day, end_day=None):
+    """Soma o rollup diário num intervalo de dias"""
+    query = db.session.query(
+        db.func.coalesce(db.func.sum(DailyActivity.questions_answered), 0),
+        db.func.coalesce(db.func.sum(DailyActivity.correct_answers), 0),
+        db.func.coalesce(db.func.sum(DailyActivity.seconds_studied), 0),
+        db.func.coalesce(db.func.sum(DailyActivity.flashcards_reviewed), 0),
+        db.func.coalesce(db.func.sum(DailyActivity.xp_earned), 0)
+    ).filter(
+        DailyActivity.user_id == user_id,
+        DailyActivity.day >= start_day
+    )
+
+    if end_day is not None:
+        query = query.filter(DailyActivity.day <= end_day)
+
+    questions, correct, seconds, flashcards, xp = query.one()
+
+    return {
+        'questions_answered': questions,
+        'correct_answers': correct,
+        'seconds_studied': seconds,
+        'flashcards_reviewed': flashcards,
+        'xp_earned': xp
+    }
+
+def record_answer_stats(user_id, is_correct, time_spent=None, previous_answer=None):
+    """
+    Atualiza os contadores e o rollup do dia após uma resposta.
+    previous_answer: (is_correct, time_spent, answered_at) da resposta substituída,
+    quando a questão já tinha sido respondida.
+    """
+    if previous_answer is None:
+        _increment(
+            user_id,
+            total_answered=1,
+            total_correct=1 if is_correct else 0,
+            total_time_spent=time_spent or 0
+        )
+    else:
+        previous_correct, previous_time, previous_answered_at = previous_answer
+        _increment(
+            user_id,
+            total_correct=int(bool(is_correct)) - int(bool(previous_correct)),
+            total_time_spent=(time_spent or 0) - (previous_time or 0)
+        )
+
+        # A resposta substituída sai do dia em que foi dada
+        if previous_answered_at:
+            _increment_daily(
+                user_id,
+                previous_answered_at.date(),
+                questions_answered=-1,
+                correct_answers=-1 if previous_correct else 0,
+                seconds_studied=-(previous_time or 0)
+            )
+
+    _increment_daily(
+        user_id,
+        questions_answered=1,
+        correct_answers=1 if is_correct else 0,
+        seconds_studied=time_spent or 0
+    )
+
+    if previous_answer is None:
+        record_leaderboard_activity(user_id, questions=1)
+
+def record_answer_batch_stats(user_id, answered, correct, time_spent=0, day=None):
+    """Atualiza contadores, rollup do dia e ranking com várias respostas novas de uma vez"""
+    _increment(user_id, total_answered=answered, total_correct=correct, total_time_spent=time_spent)
+    _increment_daily(user_id, day, questions_answered=answered, correct_answers=correct, seconds_studied=time_spent)
+    record_leaderboard_activity(user_id, questions=answered)
+
+def record_flashcard_review_stats(user_id, count=1, day=None):
+    """Atualiza os contadores após a revisão de flashcards (day: dia das revisões, padrão hoje)"""
+    _increment(user_id, flashcards_reviewed=count)
+    _increment_daily(user_id, day, flashcards_reviewed=count)
+
+def record_session_completed_stats(user_id):
+    """Atualiza os contadores após completar uma sessão"""
+    _increment(user_id, sessions_completed=1)
+    record_leaderboard_activity(user_id, sessions=1)
+
+def record_xp_earned(user_id, xp):
+    """Registra no rollup do dia e no ranking semanal o XP ganho pelo usuário"""
+    _increment_daily(user_id, xp_earned=xp)
+    record_leaderboard_activity(user_id, xp=xp)
+
+def rebuild_user_stats(user_id=None):
+    """Recalcula os contadores a partir do histórico (rotina offline)"""
+    from src.models.question import UserAnswer, StudySession
+    from src.models.flashcard import FlashcardReview
+
+    def grouped(query, column):
+        if user_id is not None:
+            query = query.filter(column == user_id)
+        return {row[0]: row[1:] for row in query.group_by(column).all()}
+
+    answers = grouped(db.session.query(
+        UserAnswer.user_id,
+        db.func.count(UserAnswer.id),
+        db.func.sum(db.case((UserAnswer.is_correct == True, 1), else_=0)),
+        db.func.sum(UserAnswer.time_spent)
+    ), UserAnswer.user_id)
+
+    reviews = grouped(db.session.query(
+        FlashcardReview.user_id,
+        db.func.count(FlashcardReview.id)
+    ), FlashcardReview.user_id)
+
+    sessions = grouped(db.session.query(
+        StudySession.user_id,
+        db.func.count(StudySession.id)
+    ).filter(StudySession.completed_at.isnot(None)), StudySession.user_id)
+
+    user_ids = set(answers) | set(reviews) | set(sessions)
+    if user_id is not None:
+        user_ids.add(user_id)
+
+    rows = []
+    for uid in user_ids:
+        total, correct, time_spent = answers.get(uid, (0, 0, 0))
+        rows.append({
+            'user_id': uid,
+            'total_answered': total or 0,
+            'total_correct': correct or 0,
+            'total_time_spent': time_spent or 0,
+            'flashcards_reviewed': reviews.get(uid, (0,))[0] or 0,
+            'sessions_completed': sessions.get(uid, (0,))[0] or 0
+        })
+
+    # Usuários sem histórico não podem manter contadores antigos: o escopo é recriado inteiro
+    delete = UserStats.query
+    if user_id is not None:
+        delete = delete.filter(UserStats.user_id == user_id)
+    delete.delete(synchronize_session=False)
+
+    if rows:
+        db.session.execute(UserStats.__table__.insert(), rows)
+
+    db.session.commit()
+
+    return len(user_ids)
+
+def rebuild_daily_activity(user_id=None, days=None):
+    """
+    Reconstrói o rollup diário a partir do histórico (rotina offline).
+    days limita o backfill aos últimos N dias.
+    """
+    from src.models.question import UserAnswer, StudySession
+    from src.models.flashcard import FlashcardReview
+
+    start = datetime.utcnow().date() - timedelta(days=days - 1) if days else None
+
+    def grouped(query, user_column, date_column):
+        day = db.func.date(date_column)
+        if user_id is not None:
+            query = query.filter(user_column == user_id)
+        if start is not None:
+            query = query.filter(date_column >= datetime.combine(start, datetime.min.time()))
+        return query.group_by(user_column, day).all()
+
+    rollup = {}
+
+    def bucket(uid, day):
+        if isinstance(day, str):
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        return rollup.setdefault((uid, day), {
+            'questions_answered': 0,
+            'correct_answers': 0,
+            'seconds_studied': 0,
+            'flashcards_reviewed': 0,
+            'xp_earned': 0
+        })
+
+    for uid, day, total, correct, seconds in grouped(db.session.query(
+        UserAnswer.user_id,
+        db.func.date(UserAnswer.answered_at),
+        db.func.count(UserAnswer.id),
+        db.func.sum(db.case((UserAnswer.is_correct == True, 1), else_=0)),
+        db.func.sum(UserAnswer.time_spent)
+    ), UserAnswer.user_id, UserAnswer.answered_at):
+        row = bucket(uid, day)
+        row['questions_answered'] = total or 0
+        row['correct_answers'] = correct or 0
+        row['seconds_studied'] = seconds or 0
+
+    for uid, day, total in grouped(db.session.query(
+        FlashcardReview.user_id,
+        db.func.date(FlashcardReview.created_at),
+        db.func.count(FlashcardReview.id)
+    ), FlashcardReview.user_id, FlashcardReview.created_at):
+        bucket(uid, day)['flashcards_reviewed'] = total or 0
+
+    # XP histórico aproximado pelo XP acumulado nas sessões
+    for uid, day, xp in grouped(db.session.query(
+        StudySession.user_id,
+        db.func.date(StudySession.started_at),
+        db.func.sum(StudySession.xp_earned)
+    ), StudySession.user_id, StudySession.started_at):
+        bucket(uid, day)['xp_earned'] = xp or 0
+
+    delete = DailyActivity.query
+    if user_id is not None:
+        delete = delete.filter(DailyActivity.user_id == user_id)
+    if start is not None:
+        delete = delete.filter(DailyActivity.day >= start)
+    delete.delete(synchronize_session=False)
+
+    if rollup:
+        db.session.execute(DailyActivity.__table__.insert(), [
+            dict(user_id=uid, day=day, **counters) for (uid, day), counters in rollup.items()
+        ])
+
+    db.session.commit()
+
+    return len(rollup)
+
+def rebuild_leaderboard(week_start=None):
+    """Reconstrói o ranking de uma semana a partir do rollup diário (rotina offline)"""
+    from src.models.question import StudySession
+
+    week_start = week_start or get_week_start()
+    week_end = week_start + timedelta(days=6)
+
+    activity = db.session.query(
+        DailyActivity.user_id,
+        db.func.sum(DailyActivity.xp_earned),
+        db.func.sum(DailyActivity.questions_answered)
+    ).filter(
+        DailyActivity.day >= week_start,
+        DailyActivity.day <= week_end
+    ).group_by(DailyActivity.user_id).all()
+
+    sessions = dict(db.session.query(
+        StudySession.user_id,
+        db.func.count(StudySession.id)
+    ).filter(
+        StudySession.completed_at >= datetime.combine(week_start, datetime.min.time()),
+        StudySession.completed_at < datetime.combine(week_end + timedelta(days=1), datetime.min.time())
+    ).group_by(StudySession.user_id).all())
+
+    Leaderboard.query.filter(Leaderboard.week_start == week_start).delete(synchronize_session=False)
+
+    rows = [
+        {
+            'user_id': uid,
+            'week_start': week_start,
+            'weekly_xp': xp or 0,
+            'questions_answered': questions or 0,
+            'study_sessions': sessions.get(uid, 0)
+        }
+        for uid, xp, questions in activity
+    ]
+    if rows:
+        db.session.execute(Leaderboard.__table__.insert(), rows)
+
+    db.session.commit()
+
+    return len(rows)